@@ -1,12 +1,22 @@
 import json
-from pydantic import BaseModel
+
+from pydantic import BaseModel, Field, model_validator
 
 class Chat(BaseModel):
     id: int
     chat: str
     is_search: bool
+    enable_knowledge: bool = Field(default=False, description='是否启用知识库功能')
+    workspace: str = Field(default='', description='知识库工作区(启用知识库时必填)')
+    max_retry: int = Field(default=3, description='[代码生成]最大重试次数(超过服务端配置上限时按上限执行)', gt=0, le=10)
+
+    @model_validator(mode='after')
+    def check_workspace(self):
+        if self.enable_knowledge and not self.workspace:
+            raise ValueError('启用知识库时 workspace 不能为空')
+        return self
 
 class Feedback(BaseModel):
     id: int
     chat_id: int
-    feedback_code: int
\ No newline at end of file
+    feedback_code: int
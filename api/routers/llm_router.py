@@ -1,4 +1,5 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
 from api.models.llm_model import Chat, Feedback
 from common.logger.logging import Logger
 
@@ -17,13 +18,15 @@ async def llm_history(id: int = 0, status: str = "done", tags: str = ""):
         }
     }
 
-@router.post("/chat", summary="对话")
-async def llm_chat(chat: Chat):
-    return {
-        "code": 200,
-        "msg": "success",
-        "data": chat
-    }
+@router.post("/chat", summary="对话(Server-Sent Events 流式输出代码生成进度和结果)")
+async def llm_chat(chat: Chat, request: Request):
+    # 代码生成器在独立线程中执行, 客户端断开连接时取消执行并清理项目目录
+    code_helper_service = request.app.state.code_helper_service
+    return StreamingResponse(
+        code_helper_service.astream_chat(chat, is_disconnected=request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.put("/feedback", summary="反馈")
 async def llm_feedback(feedback: Feedback):
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+
+from langchain.chat_models import init_chat_model
+
+from api.models.llm_model import Chat
+from common.config.config import YAML_CONFIGS_INFO
+from common.logger.logging import Logger
+from core.graphs.code_helper.compile_graph import CompileGraph, init_vector_store, init_agent_client, init_send_mail, \
+    init_web_search, init_retrieval_orchestrator, init_sandbox_manager, init_deduplicator
+
+logger = Logger.get_instance(__file__)
+
+
+class CodeHelperService:
+
+    def __init__(self):
+        """
+        代码生成器服务, 应用启动时创建一次向量数据库(weaviate)、xinference 嵌入/重排模型、大模型、网页搜索、检索线程池、沙箱进程池、切片去重和邮件客户端,
+        所有请求共享这些客户端, 每次请求只新建智能体对话记忆
+        """
+        self.__code_type = YAML_CONFIGS_INFO['code_helper']['code_type']
+        self.__install_tool = YAML_CONFIGS_INFO['code_helper']['install_tool']
+        self.__vector_store = init_vector_store()
+        self.__send_mail = init_send_mail()
+        self.__web_search = init_web_search()
+        self.__retrieval_orchestrator = init_retrieval_orchestrator()
+        self.__deduplicator = init_deduplicator()
+
+        # 生成代码只写入服务端配置的根目录, 每次请求新建独立项目目录(请求结束后删除), 不接受客户端传入的路径
+        api_config = YAML_CONFIGS_INFO.get('code_helper', {}).get('api', {}) or {}
+        project_root = api_config.get('project_root')
+        if not project_root:
+            project_root = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'projects')
+        self.__project_root = os.path.abspath(project_root)
+        self.__max_retry = api_config.get('max_retry', 5)
+        # 每次请求的项目目录独立创建虚拟环境和预热进程(请求之间安装的依赖互不影响), 请求结束后关闭
+        self.__sandbox_manager = init_sandbox_manager()
+
+        extra_body = YAML_CONFIGS_INFO.get('code_helper', {}).get('agent_client', {}).get('extra_body', {})
+        self.__chat_model = init_chat_model(
+            base_url=YAML_CONFIGS_INFO['code_helper']['agent_client']['base_url'],
+            api_key=YAML_CONFIGS_INFO['code_helper']['agent_client']['api_key'],
+            model=YAML_CONFIGS_INFO['code_helper']['agent_client']['model'],
+            model_provider="openai",
+            extra_body={} if not extra_body else extra_body
+        )
+
+    @staticmethod
+    def format_sse(event: str, data: dict) -> str:
+        """
+        格式化 Server-Sent Events 消息
+        :param event: 事件名
+        :param data: 事件数据
+        :return:
+        """
+        return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n'
+
+    def stream_chat(self, chat: Chat, cancel_event: threading.Event | None = None) -> Iterator[str]:
+        """
+        [非交互]执行代码生成器, 以 SSE 格式迭代输出子图/节点进度、大模型 token 和最终结果, 结束后删除项目目录
+        :param chat: 对话请求
+        :param cancel_event: 取消事件, 被设置时停止执行代码生成器
+        :return:
+        """
+        project_path = os.path.join(self.__project_root, f'pj_{chat.id}_{uuid.uuid1().hex}')
+        compile_graph = CompileGraph(
+            enable_mutual=False,
+            vector_store=self.__vector_store,
+            agent_client=init_agent_client(
+                code_type=self.__code_type,
+                install_tool=self.__install_tool,
+                chat_model=self.__chat_model
+            ),
+            send_mail=self.__send_mail,
+            code_type=self.__code_type,
+            install_tool=self.__install_tool,
+            web_search=self.__web_search,
+            retrieval_orchestrator=self.__retrieval_orchestrator,
+            sandbox_manager=self.__sandbox_manager,
+            deduplicator=self.__deduplicator
+        )
+
+        events = compile_graph.stream_run(
+            prompt=chat.chat,
+            global_setting={
+                'enable_knowledge': chat.enable_knowledge,
+                'enable_web': chat.is_search,
+                'max_retry': min(chat.max_retry, self.__max_retry),
+                'project_path': project_path
+            },
+            data_source={
+                'workspace': chat.workspace,
+                'file_paths': []
+            },
+            cancel_event=cancel_event
+        )
+        try:
+            for event in events:
+                yield self.format_sse(event=event['event'], data={'id': chat.id, **event['data']})
+        finally:
+            events.close()
+            if self.__sandbox_manager:
+                self.__sandbox_manager.release(project_path)
+            shutil.rmtree(project_path, ignore_errors=True)
+
+    async def astream_chat(self, chat: Chat, is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[str]:
+        """
+        [非交互]异步执行代码生成器(同 stream_chat), 客户端断开连接时取消执行
+        代码生成器在独立线程中执行, 不长时间占用 anyio 线程池
+        :param chat: 对话请求
+        :param is_disconnected: 客户端是否已断开连接(如 request.is_disconnected)
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        messages: asyncio.Queue[str | None] = asyncio.Queue()
+        cancel_event = threading.Event()
+
+        def put(message: str | None):
+            try:
+                loop.call_soon_threadsafe(messages.put_nowait, message)
+            except RuntimeError:
+                # 事件循环已关闭
+                cancel_event.set()
+
+        def produce():
+            stream = self.stream_chat(chat, cancel_event=cancel_event)
+            try:
+                for message in stream:
+                    if cancel_event.is_set(): break
+                    put(message)
+            except Exception as e:
+                logger.exception(f'代码生成器执行出现异常: {str(e)}')
+            finally:
+                # 关闭生成器, 释放沙箱进程池并删除项目目录
+                stream.close()
+                put(None)
+
+        threading.Thread(target=produce, name=f'stream_chat_{chat.id}', daemon=True).start()
+        check_time = loop.time() + 1
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(messages.get(), timeout=1)
+                except asyncio.TimeoutError:
+                    message = ''
+
+                # 每秒检查一次客户端连接(长时间没有输出时, 如安装依赖和运行测试)
+                if loop.time() >= check_time:
+                    check_time = loop.time() + 1
+                    if await is_disconnected():
+                        logger.info('客户端已断开连接, 取消执行代码生成器', extra={'chat_id': chat.id})
+                        break
+
+                if message is None: break
+                if message: yield message
+        finally:
+            cancel_event.set()
+
+    def close(self):
+        self.__retrieval_orchestrator.close()
+        if self.__web_search:
+            self.__web_search.close()
+        if self.__sandbox_manager:
+            self.__sandbox_manager.close()
+        if self.__deduplicator:
+            self.__deduplicator.close()
+        self.__vector_store.close()
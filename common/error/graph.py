@@ -5,3 +5,7 @@ class EdgeMapsError(Exception):
 class EdgeFuncHasError(Exception):
     def __init__(self, msg='不存在边映射方法'):
         super().__init__(msg)
+
+class GraphCancelledError(Exception):
+    def __init__(self, msg='代码生成器已取消执行'):
+        super().__init__(msg)
\ No newline at end of file
@@ -0,0 +1,3 @@
+class SandboxError(Exception):
+    def __init__(self, msg='沙箱进程执行异常'):
+        super().__init__(msg)
\ No newline at end of file
@@ -8,41 +8,24 @@ import time
 from pathlib import Path
 from typing import Iterator, Union
 
-import pandas as pd
 import requests
 
 from bs4 import BeautifulSoup
 
+from common.file.file_walker import FileWalker
+from common.file.sheet import SHEET_TYPES, iter_sheet_frames, markdown_header, markdown_rows
+
 IMG_FORMAT = ['.jpg', '.jpeg', '.png', '.webp', '.avif', '.svg', '.gif', '.jxl', '.heic', '.heif', '.tiff', '.tif', '.png']
 
 def iter_file_infos(file_path: Union[str, Path] , filter_suffix: list[str] = []) -> Iterator[dict[str, Union[str, Path]]]:
     """
     输入一个 file_path，如果是一个文件，则返回包含该文件信息的长度为1的列表，每个元素是 dict 类型；
-    如果是一个目录，则递归返回该目录下所有子目录中的文件信息列表，每个文件作为一个 dict 元素。
+    如果是一个目录，则递归返回该目录下所有子目录中的文件信息列表(跳过 .git、node_modules、venv、__pycache__ 及 .gitignore 排除的文件)，每个文件作为一个 dict 元素。
     :param file_path: 文件/文件夹地址
     :param filter_suffix: 需要过滤的文件后缀名, 不在该列表的文件后缀不记录
     :return:
     """
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"The path {file_path} does not exist.")
-
-    if os.path.isfile(file_path):
-        # 获取文件后缀名作为文件类型
-        _, ext = os.path.splitext(file_path)
-        file_type = ext.lower().lstrip('.') or 'unknown'
-        if not filter_suffix or file_type in filter_suffix:
-            yield {'file_type': file_type, 'file_path': file_path}
-
-    for root, dirs, files in os.walk(file_path):
-        for file in files:
-            full_path = os.path.join(root, file)
-            _, ext = os.path.splitext(file)
-            file_type = ext.lower().lstrip('.') or 'unknown'
-            if filter_suffix and not (file_type in filter_suffix): continue
-            yield {'file_type': file_type, 'file_path': full_path}
-
-    # return file_list
-
+    yield from FileWalker(include_suffix=filter_suffix).iter_files(file_path)
 
 def bs4_extractor(html: str, features: str = 'lxml') -> str:
     soup = BeautifulSoup(html, features=features)
@@ -50,58 +33,59 @@ def bs4_extractor(html: str, features: str = 'lxml') -> str:
 
 def excel_to_markdown(input_file, output_file=None):
     """
-    将Excel文件转换为Markdown格式
+    将Excel文件转换为Markdown格式(按行流式读取, 按列向量化转换单元格, 写入文件时不在内存中保存整个表格)
 
     参数:
         input_file (str): Excel文件路径
         output_file (str): 输出文件路径，若不提供则返回字符串
     """
     try:
-        # 读取Excel文件的所有工作表
-        excel_data = pd.ExcelFile(input_file)
-        markdown_result = []
-
-        # 遍历每个工作表
-        for sheet_name in excel_data.sheet_names:
-            # 读取工作表数据
-            df = pd.read_excel(excel_data, sheet_name)
-
-            # 处理表头
-            header = "| " + " | ".join(df.columns) + " |"
-            # 创建分隔行（自动适配列数）
-            separator = "| " + " | ".join(["---"] * len(df.columns)) + " |"
-
-            # 处理数据行（处理NaN值为空字符串）
-            rows = []
-            for _, row in df.iterrows():
-                # 将每行数据转换为字符串并处理空值
-                formatted_row = [
-                    str(cell) if pd.notna(cell) else ""
-                    for cell in row
-                ]
-                rows.append("| " + " | ".join(formatted_row) + " |")
-
-            # 组合当前工作表的markdown内容
-            markdown_result.append(f"## {sheet_name}")
-            markdown_result.append(header)
-            markdown_result.append(separator)
-            markdown_result.extend(rows)
-            markdown_result.append("")  # 添加空行分隔不同工作表
-
-        # 组合所有内容
-        result = "\n".join(markdown_result)
+        file_type = os.path.splitext(str(input_file))[1].lower().lstrip('.')
+        file_type = file_type if file_type in SHEET_TYPES else 'xlsx'
+
+        def iter_lines() -> Iterator[str]:
+            current_sheet = None
+            for sheet_name, header, frame in iter_sheet_frames(input_file, file_type):
+                if sheet_name != current_sheet:
+                    # 添加空行分隔不同工作表
+                    if current_sheet is not None: yield ""
+                    current_sheet = sheet_name
+                    yield f"## {sheet_name}"
+                    yield markdown_header(header)
+                yield from markdown_rows(frame)
+            if current_sheet is not None: yield ""
 
         # 决定输出方式
         if output_file:
             with open(output_file, "w", encoding="utf-8") as f:
-                f.write(result)
+                for index, line in enumerate(iter_lines()):
+                    f.write(f"\n{line}" if index else line)
             return f"已成功写入到 {output_file}"
         else:
-            return result
+            return "\n".join(iter_lines())
 
     except Exception as e:
         return f"转换失败: {str(e)}"
 
+def py_module_path(py_path: str) -> dict[str, str]:
+    """
+    根据包结构(__init__.py)计算 python 文件的可导入 module 路径, 不导入任何模块:
+    从文件所在目录向上查找, 直到目录下不存在 __init__.py, 该目录即为导入根目录
+    如: /src/pkg/sub/mod.py(pkg、sub 下都有 __init__.py) -> pkg.sub.mod; /src/pkg/__init__.py -> pkg
+    :param py_path: python 文件地址
+    :return: {'py_path': 文件地址, 'module': module 路径}
+    """
+    py_dir, file_name = os.path.split(os.path.abspath(py_path))
+    module_name = os.path.splitext(file_name)[0]
+    module_paths = [] if module_name == '__init__' else [module_name]
+
+    while os.path.isfile(os.path.join(py_dir, '__init__.py')):
+        py_dir, package_name = os.path.split(py_dir)
+        if not package_name: break
+        module_paths.insert(0, package_name)
+
+    return {'py_path': py_path, 'module': '.'.join(module_paths)}
+
 def py_module_adap(py_path: str) -> dict[str, str]:
     """
     python 文件导入适配器, 输入一个 python 文件路径, 返回一个在其它python文件中使用的可导入文件
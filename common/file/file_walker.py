@@ -0,0 +1,306 @@
+import json
+import os
+import re
+import stat
+from pathlib import Path
+from typing import Iterator, Union
+
+from pydantic import BaseModel, Field
+
+# 默认排除的目录/文件(gitignore 语法)
+DEFAULT_EXCLUDE = [
+    '.git/', '.hg/', '.svn/', '.idea/', '.vscode/', '.DS_Store',
+    'node_modules/', '__pycache__/', '*.pyc', '*.pyo',
+    'venv/', '.venv/', 'env/', '.env/', '.tox/', '.mypy_cache/', '.pytest_cache/', '.ipynb_checkpoints/',
+]
+
+
+class IgnoreRule:
+
+    def __init__(self, pattern: str, base_dir: str = ''):
+        """
+        gitignore 单条规则
+        :param pattern: 规则(已去除注释和首尾空白)
+        :param base_dir: 规则所在 .gitignore 相对遍历根目录的目录(posix 格式, 根目录为空)
+        """
+        self.negate = pattern.startswith('!')
+        pattern = pattern[1:] if self.negate else pattern
+        # \! \# 转义
+        if pattern[:2] in ['\\!', '\\#']: pattern = pattern[1:]
+
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        # 规则开头或中间包含 / 时相对 .gitignore 所在目录匹配, 否则匹配任意层级的文件/目录名
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+
+        regex = self.__translate(pattern)
+        prefix = re.escape(base_dir + '/') if base_dir else ''
+        self.__regex = re.compile(f'^{prefix}{regex}$' if anchored else f'^{prefix}(?:.*/)?{regex}$')
+
+    @staticmethod
+    def __translate(pattern: str) -> str:
+        """
+        gitignore 通配符转正则: ** 匹配任意层级目录, * 匹配除 / 以外任意字符, ? 匹配除 / 以外单个字符, [] 字符集
+        :param pattern:
+        :return:
+        """
+        regex = ''
+        index = 0
+        while index < len(pattern):
+            char = pattern[index]
+            if pattern[index: index + 3] == '**/':
+                regex += '(?:.*/)?'
+                index += 3
+                continue
+            if pattern[index: index + 3] == '/**' and index + 3 == len(pattern):
+                regex += '/.*'
+                index += 3
+                continue
+            if pattern[index: index + 2] == '**':
+                regex += '.*'
+                index += 2
+                continue
+
+            if char == '*':
+                regex += '[^/]*'
+            elif char == '?':
+                regex += '[^/]'
+            elif char == '[':
+                end = pattern.find(']', index + 1)
+                if end == -1:
+                    regex += re.escape(char)
+                else:
+                    char_class = pattern[index + 1: end].replace('\\', '\\\\')
+                    if char_class.startswith('!'): char_class = '^' + char_class[1:]
+                    regex += f'[{char_class}]'
+                    index = end
+            elif char == '\\' and index + 1 < len(pattern):
+                index += 1
+                regex += re.escape(pattern[index])
+            else:
+                regex += re.escape(char)
+            index += 1
+
+        return regex
+
+    def match(self, rel_path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir: return False
+        return bool(self.__regex.match(rel_path))
+
+
+def parse_ignore_rules(lines: list[str], base_dir: str = '') -> list[IgnoreRule]:
+    """
+    解析 gitignore 规则
+    :param lines: 规则行
+    :param base_dir: 规则所在目录(相对遍历根目录, posix 格式)
+    :return:
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip('\r')
+        # 行尾未转义的空格忽略
+        if not line.endswith('\\ '): line = line.rstrip(' ')
+        if not line or line.startswith('#'): continue
+        rules.append(IgnoreRule(line, base_dir=base_dir))
+
+    return rules
+
+
+def is_ignored(rules: list[IgnoreRule], rel_path: str, is_dir: bool) -> bool:
+    """
+    按 gitignore 语义判断是否排除: 最后一条匹配的规则生效
+    :param rules:
+    :param rel_path: 相对遍历根目录路径(posix 格式)
+    :param is_dir: 是否为目录
+    :return:
+    """
+    ignored = False
+    for rule in rules:
+        if rule.match(rel_path, is_dir): ignored = not rule.negate
+    return ignored
+
+
+class FileIndex:
+
+    def __init__(self, index_path: str):
+        """
+        持久化文件索引, 记录每个文件的 (大小, 修改时间), 用于重复扫描时只返回变化的文件
+        :param index_path: 索引文件地址(json)
+        """
+        self.__index_path = index_path
+        self.__files: dict[str, list[int]] = {}
+
+        if os.path.exists(self.__index_path):
+            with open(self.__index_path, 'r', encoding='utf-8') as f:
+                self.__files = json.load(f).get('files', {})
+
+    @property
+    def files(self) -> dict[str, list[int]]:
+        return self.__files
+
+    def is_changed(self, file_info: dict) -> bool:
+        return self.__files.get(file_info['file_path']) != [file_info['size'], file_info['mtime']]
+
+    def update(self, file_info: dict):
+        self.__files[file_info['file_path']] = [file_info['size'], file_info['mtime']]
+
+    def remove(self, file_path: str):
+        self.__files.pop(file_path, None)
+
+    def save(self):
+        """
+        先写临时文件再替换, 防止写入中断导致索引损坏
+        :return:
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.__index_path)), exist_ok=True)
+        tmp_path = f'{self.__index_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.__files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.__index_path)
+
+    def clear(self):
+        self.__files = {}
+
+
+class ScanResult(BaseModel):
+    changed: list[dict] = Field(default_factory=list, description='新增/修改文件信息')
+    unchanged: list[dict] = Field(default_factory=list, description='未修改文件信息')
+    removed: list[str] = Field(default_factory=list, description='索引中存在但本次扫描不存在的文件')
+
+
+class FileWalker:
+
+    def __init__(
+        self,
+        exclude: list[str] | None = None,
+        use_gitignore: bool = True,
+        use_default_exclude: bool = True,
+        include_suffix: list[str] | None = None,
+        exclude_suffix: list[str] | None = None,
+        min_size: int = 0,
+        max_size_mb: float | None = None,
+        follow_symlinks: bool = True
+    ):
+        """
+        文件遍历: 单次 os.scandir 遍历, 支持 gitignore 规则(包括各级目录的 .gitignore)、后缀和大小过滤, 跟随软链接时防止循环
+        :param exclude: 额外排除规则(gitignore 语法, 相对遍历根目录)
+        :param use_gitignore: 是否读取各级目录的 .gitignore
+        :param use_default_exclude: 是否排除 .git、node_modules、venv、__pycache__ 等目录
+        :param include_suffix: 只保留的文件后缀(不含 ., 为空表示不过滤)
+        :param exclude_suffix: 排除的文件后缀(不含 .)
+        :param min_size: 最小文件大小(单位: byte)
+        :param max_size_mb: 最大文件大小(单位: MB), 为空表示不限制
+        :param follow_symlinks: 是否跟随软链接目录(通过 (st_dev, st_ino) 判断已遍历目录, 防止软链接循环)
+        """
+        self.__root_rules = parse_ignore_rules((DEFAULT_EXCLUDE if use_default_exclude else []) + (exclude or []))
+        self.__use_gitignore = use_gitignore
+        self.__include_suffix = [suffix.lower().lstrip('.') for suffix in include_suffix] if include_suffix else []
+        self.__exclude_suffix = [suffix.lower().lstrip('.') for suffix in exclude_suffix] if exclude_suffix else []
+        self.__min_size = min_size
+        self.__max_size = max_size_mb * 1024 * 1024 if max_size_mb else None
+        self.__follow_symlinks = follow_symlinks
+
+    @staticmethod
+    def file_type(file_path: str) -> str:
+        _, ext = os.path.splitext(file_path)
+        return ext.lower().lstrip('.') or 'unknown'
+
+    def __keep_file(self, file_type: str, size: int) -> bool:
+        if self.__include_suffix and file_type not in self.__include_suffix: return False
+        if file_type in self.__exclude_suffix: return False
+        if size < self.__min_size: return False
+        if self.__max_size is not None and size > self.__max_size: return False
+        return True
+
+    def iter_files(self, file_path: Union[str, Path]) -> Iterator[dict]:
+        """
+        [懒加载]遍历文件/文件夹, 输出文件信息 {'file_type', 'file_path', 'size', 'mtime'(纳秒)};
+        输入为文件时只做后缀过滤(显式输入的文件不受排除规则和大小限制)
+        :param file_path: 文件/文件夹地址
+        :return:
+        """
+        file_path = str(file_path)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"The path {file_path} does not exist.")
+
+        if os.path.isfile(file_path):
+            file_stat = os.stat(file_path)
+            file_type = self.file_type(file_path)
+            if not self.__include_suffix or file_type in self.__include_suffix:
+                yield {'file_type': file_type, 'file_path': file_path, 'size': file_stat.st_size, 'mtime': file_stat.st_mtime_ns}
+            return
+
+        root_stat = os.stat(file_path)
+        visited_dirs = {(root_stat.st_dev, root_stat.st_ino)}
+        # 栈元素: (目录地址, 相对根目录路径, 生效的规则)
+        stack: list[tuple[str, str, list[IgnoreRule]]] = [(file_path, '', self.__root_rules)]
+
+        while stack:
+            current_dir, rel_dir, rules = stack.pop()
+            try:
+                with os.scandir(current_dir) as entries:
+                    entries = sorted(entries, key=lambda entry: entry.name)
+            except OSError:
+                continue
+
+            if self.__use_gitignore and any(entry.name == '.gitignore' for entry in entries):
+                try:
+                    with open(os.path.join(current_dir, '.gitignore'), 'r', encoding='utf-8', errors='ignore') as f:
+                        rules = rules + parse_ignore_rules(f.readlines(), base_dir=rel_dir)
+                except OSError:
+                    pass
+
+            sub_dirs = []
+            for entry in entries:
+                rel_path = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+                try:
+                    is_symlink = entry.is_symlink()
+                    is_dir = entry.is_dir(follow_symlinks=self.__follow_symlinks)
+                    if is_ignored(rules, rel_path, is_dir): continue
+
+                    if is_dir:
+                        dir_stat = entry.stat(follow_symlinks=True) if is_symlink else entry.stat(follow_symlinks=False)
+                        dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+                        if dir_key in visited_dirs: continue
+                        visited_dirs.add(dir_key)
+                        sub_dirs.append((entry.path, rel_path, rules))
+                        continue
+
+                    if is_symlink and not self.__follow_symlinks: continue
+                    file_stat = entry.stat(follow_symlinks=True)
+                    if not stat.S_ISREG(file_stat.st_mode): continue
+                except OSError:
+                    continue
+
+                file_type = self.file_type(entry.name)
+                if not self.__keep_file(file_type, file_stat.st_size): continue
+                yield {'file_type': file_type, 'file_path': entry.path, 'size': file_stat.st_size, 'mtime': file_stat.st_mtime_ns}
+
+            # 倒序入栈, 保证子目录按文件名顺序遍历
+            stack.extend(reversed(sub_dirs))
+
+    def scan(self, file_paths: list[Union[str, Path]], index: FileIndex | None = None) -> ScanResult:
+        """
+        扫描文件/文件夹列表, 与索引对比 (大小, 修改时间) 区分新增/修改和未修改文件(不更新索引)
+        :param file_paths: 文件/文件夹地址列表
+        :param index: 文件索引, 为空时所有文件视为新增
+        :return:
+        """
+        result = ScanResult()
+        scanned = set()
+        for file_path in file_paths:
+            for file_info in self.iter_files(file_path):
+                file_info['file_path'] = os.path.abspath(file_info['file_path'])
+                if file_info['file_path'] in scanned: continue
+                scanned.add(file_info['file_path'])
+
+                if index is None or index.is_changed(file_info):
+                    result.changed.append(file_info)
+                else:
+                    result.unchanged.append(file_info)
+
+        if index is not None:
+            result.removed = [file_path for file_path in index.files if file_path not in scanned]
+
+        return result
@@ -0,0 +1,144 @@
+import csv
+from pathlib import Path
+from typing import Iterator, Union
+
+import pandas as pd
+
+SHEET_TYPES = ['xlsx', 'xlsm', 'xls', 'csv']
+
+
+def sheet_header(columns: list) -> list[str]:
+    """
+    表头单元格转字符串, 空表头使用 pandas 风格的 Unnamed: 列号
+    :param columns:
+    :return:
+    """
+    return [str(column).strip() if column is not None and str(column).strip() else f'Unnamed: {index}' for index, column in enumerate(columns)]
+
+
+def to_str_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    按列向量化转换单元格为字符串(空值转为空字符串)
+    :param frame:
+    :return:
+    """
+    frame = frame.astype(object)
+    return frame.where(frame.notna(), '').astype(str)
+
+
+def rows_frame(rows: list, width: int) -> pd.DataFrame:
+    """
+    行数据转字符串单元格表格, 列数对齐表头
+    :param rows:
+    :param width: 表头列数
+    :return:
+    """
+    return to_str_frame(pd.DataFrame(rows).reindex(columns=range(width)))
+
+
+def markdown_header(header: list[str]) -> str:
+    header = [column.replace('|', '\\|').replace('\n', ' ') for column in header]
+    return '| ' + ' | '.join(header) + ' |\n' + '| ' + ' | '.join(['---'] * len(header)) + ' |'
+
+
+def markdown_rows(frame: pd.DataFrame) -> list[str]:
+    """
+    按列向量化拼接 markdown 表格行(转义 |, 换行替换为空格)
+    :param frame: 字符串单元格表格
+    :return:
+    """
+    if frame.empty: return []
+
+    rows = None
+    for column_index in range(frame.shape[1]):
+        column = frame.iloc[:, column_index].str.replace('|', '\\|', regex=False).str.replace('\n', ' ', regex=False)
+        rows = '| ' + column if rows is None else rows + ' | ' + column
+    return (rows + ' |').tolist()
+
+
+def iter_xlsx_frames(file_path: str, batch_rows: int) -> Iterator[tuple[str, list[str], pd.DataFrame]]:
+    from openpyxl import load_workbook
+
+    # 只读模式按行流式读取, 不加载整个工作簿
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            header = None
+            rows = []
+            batches = 0
+            for row in worksheet.iter_rows(values_only=True):
+                if all(cell is None or cell == '' for cell in row): continue
+                if header is None:
+                    # 去除表头右侧的空列
+                    width = max(index for index, cell in enumerate(row) if cell is not None and cell != '') + 1
+                    header = sheet_header(list(row[:width]))
+                    continue
+
+                rows.append(row[:len(header)])
+                if len(rows) >= batch_rows:
+                    yield worksheet.title, header, rows_frame(rows, len(header))
+                    rows = []
+                    batches += 1
+
+            if header is not None and (rows or not batches):
+                yield worksheet.title, header, rows_frame(rows, len(header))
+    finally:
+        workbook.close()
+
+
+def iter_xls_frames(file_path: str, batch_rows: int) -> Iterator[tuple[str, list[str], pd.DataFrame]]:
+    # xls 格式不支持流式读取(单个工作表最多 65536 行), 按工作表读取后分批输出
+    with pd.ExcelFile(file_path) as excel_file:
+        for sheet_name in excel_file.sheet_names:
+            frame = excel_file.parse(sheet_name, dtype=object)
+            header = sheet_header(list(frame.columns))
+            frame = to_str_frame(frame)
+            frame.columns = range(len(header))
+            for start in range(0, max(len(frame), 1), batch_rows):
+                yield str(sheet_name), header, frame.iloc[start: start + batch_rows]
+
+
+def iter_csv_frames(file_path: str, batch_rows: int, encoding: str = 'utf-8') -> Iterator[tuple[str, list[str], pd.DataFrame]]:
+    # 所有单元格按字符串读取, 不做类型推断
+    reader = pd.read_csv(
+        file_path,
+        dtype=str,
+        keep_default_na=False,
+        chunksize=batch_rows,
+        encoding=encoding,
+        encoding_errors='replace',
+        quoting=csv.QUOTE_MINIMAL,
+        skip_blank_lines=True
+    )
+    sheet_name = Path(file_path).stem
+    with reader:
+        for frame in reader:
+            header = sheet_header(list(frame.columns))
+            frame.columns = range(len(header))
+            yield sheet_name, header, frame
+
+
+def iter_sheet_frames(
+    file_path: Union[str, Path],
+    file_type: str,
+    batch_rows: int = 1000,
+    encoding: str = 'utf-8'
+) -> Iterator[tuple[str, list[str], pd.DataFrame]]:
+    """
+    [懒加载]按行分批读取表格文件, 迭代输出 (工作表名, 表头, 字符串单元格表格), 内存占用由 batch_rows 决定
+    xlsx 使用 openpyxl 只读模式流式读取, csv 使用 pandas 分块读取, xls 按工作表读取后分批输出
+    :param file_path: 文件地址
+    :param file_type: 文件类型 xlsx/xlsm/xls/csv
+    :param batch_rows: 每批行数
+    :param encoding: csv 文件编码
+    :return:
+    """
+    file_path = str(file_path)
+    if file_type in ['xlsx', 'xlsm']:
+        yield from iter_xlsx_frames(file_path, batch_rows)
+    elif file_type == 'xls':
+        yield from iter_xls_frames(file_path, batch_rows)
+    elif file_type == 'csv':
+        yield from iter_csv_frames(file_path, batch_rows, encoding=encoding)
+    else:
+        raise ValueError(f'不支持的表格类型【{file_type}】, 支持类型【{"|".join(SHEET_TYPES)}】')
@@ -1,6 +1,21 @@
+import functools
 import importlib
 
 
+@functools.lru_cache(maxsize=None)
+def load_class(module_path: str, class_name: str):
+    """
+    导入模块并获取类(支持 类名.方法名 格式), 同一类只导入一次
+    :param module_path: 模块路径
+    :param class_name: 类名
+    :return:
+    """
+    load_cls = importlib.import_module(module_path)
+    for cls_name in class_name.split('.'):
+        load_cls = getattr(load_cls, cls_name)
+    return load_cls
+
+
 class InpectInstance:
 
     def __init__(self, module_map: dict[str, dict], module_key: str):
@@ -13,14 +28,7 @@ class InpectInstance:
         __class_name = self.__module_map.get(self.__module_key, {}).get('class_name', '')
         __init_args = self.__module_map.get(self.__module_key, {}).get('init_args', {})
 
-        self.__load_module = importlib.import_module(__module_path)
-        __class_names = __class_name.split('.')
-        for index, cls_name in enumerate(__class_names):
-            if index == 0:
-                self.__load_cls = getattr(self.__load_module, cls_name)
-            else:
-                self.__load_cls = getattr(self.__load_cls, cls_name)
-
+        self.__load_cls = load_class(__module_path, __class_name)
         self.__load_instance = self.__load_cls(**__init_args)
 
     @property
@@ -29,4 +37,4 @@ class InpectInstance:
 
     @property
     def module_map(self):
-        return self.__module_map
\ No newline at end of file
+        return self.__module_map
@@ -1,56 +1,159 @@
+import atexit
+import copy
+import json
 import logging
 import os.path
-from logging.handlers import RotatingFileHandler
+import queue
+import sys
+import threading
+from datetime import datetime
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 from common.config.config import YAML_CONFIGS_INFO
 
+# LogRecord 自带属性, 其余属性(logger.info(..., extra={...}))作为结构化字段输出
+LOG_RECORD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', None, None).__dict__) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        格式化为单行 json: {'time', 'level', 'logger', 'file', 'line', 'thread', 'message', 'exception', ...extra}
+        :param record:
+        :return:
+        """
+        log_info = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'file': record.filename,
+            'line': record.lineno,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            log_info['exception'] = record.exc_text
+
+        for key, value in record.__dict__.items():
+            if key not in LOG_RECORD_ATTRS and key not in log_info:
+                log_info[key] = value
+
+        return json.dumps(log_info, ensure_ascii=False, default=str)
+
+
+class LogQueueHandler(QueueHandler):
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        在调用线程合并消息参数和异常堆栈(参数对象可能在写入前被修改), 结构化字段保留原样, 由监听线程格式化
+        :param record:
+        :return:
+        """
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 
 class Logger:
 
+    __loggers: dict[str, logging.Logger] = {}
+    __lock = threading.Lock()
+    __queue: queue.Queue | None = None
+    __queue_handler: LogQueueHandler | None = None
+    __listener: QueueListener | None = None
+
     @staticmethod
-    def get_instance(file_path: str):
+    def __log_config() -> dict:
+        return YAML_CONFIGS_INFO.get('log_config', {})
+
+    @classmethod
+    def __init_listener(cls):
+        """
+        创建共用的日志队列和监听线程, 控制台和文件处理器只在监听线程中执行, 记录日志的线程只把日志放入队列
+        :return:
+        """
+        log_config = cls.__log_config()
 
         # 默认 log 路径
         project_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
         default_log_path = os.path.join(project_path, 'logs', 'app.log')
 
         # 初始化 log 文件夹
-        log_file = YAML_CONFIGS_INFO.get('log_config', {}).get('LOG_FILE')
+        log_file = log_config.get('LOG_FILE')
         log_file = log_file if log_file else default_log_path
-        log_dir = os.path.dirname(log_file)
-        os.makedirs(log_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
 
         # 获取log 配置参数
-        max_bytes = YAML_CONFIGS_INFO.get('log_config', {}).get('LOG_FILE_MAX_SIZE') * 1024 * 1024
-        backup_count = YAML_CONFIGS_INFO.get('log_config', {}).get('LOG_FILE_BACKUP_COUNT')
-        format = YAML_CONFIGS_INFO.get('log_config', {}).get('LOG_FORMAT')
+        max_bytes = log_config.get('LOG_FILE_MAX_SIZE', 20) * 1024 * 1024
+        backup_count = log_config.get('LOG_FILE_BACKUP_COUNT', 5)
+        log_format = log_config.get('LOG_FORMAT')
 
-        # 创建日志器
-        file_name = os.path.split(file_path)[1]
-        logger = logging.getLogger(file_name)
-        logger.setLevel(logging.DEBUG)  # 设置全局日志级别
+        # 文件处理器（自动轮换日志文件）, 记录 logger 级别允许的所有日志
+        file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter() if log_config.get('LOG_JSON', True) else logging.Formatter(log_format))
+        handlers: list[logging.Handler] = [file_handler]
 
         # 控制台处理器
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)  # 控制台仅记录 INFO 及以上级别
-
-        # 文件处理器（自动轮换日志文件）
-        file_handler = RotatingFileHandler(
-            log_file, maxBytes=max_bytes, backupCount=backup_count
-        )
-        file_handler.setLevel(logging.DEBUG)  # 文件记录所有 DEBUG 及以上级别
-
-        # 定义日志格式
-        formatter = logging.Formatter(
-            # "%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s"
-            format
-        )
-        console_handler.setFormatter(formatter)
-        file_handler.setFormatter(formatter)
-
-        # 将处理器添加到日志器
-        logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
-
-        return logger
\ No newline at end of file
+        if log_config.get('LOG_CONSOLE', True):
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setLevel(log_config.get('LOG_CONSOLE_LEVEL', 'INFO'))
+            console_handler.setFormatter(logging.Formatter(log_config.get('LOG_CONSOLE_FORMAT') or log_format))
+            handlers.append(console_handler)
+
+        cls.__queue = queue.Queue()
+        cls.__queue_handler = LogQueueHandler(cls.__queue)
+        cls.__listener = QueueListener(cls.__queue, *handlers, respect_handler_level=True)
+        cls.__listener.start()
+        # 进程退出前写完队列中的日志
+        atexit.register(cls.shutdown)
+
+    @classmethod
+    def get_instance(cls, file_path: str) -> logging.Logger:
+        """
+        获取日志器, 同一文件名只创建一次; 日志级别按文件名(子系统)读取 LOG_LEVELS, 未配置时使用 LOG_LEVEL
+        :param file_path: 使用日志的文件地址, 如: __file__
+        :return:
+        """
+        name = os.path.splitext(os.path.split(file_path)[1])[0]
+        with cls.__lock:
+            if name in cls.__loggers: return cls.__loggers[name]
+            if cls.__listener is None: cls.__init_listener()
+
+            log_config = cls.__log_config()
+            levels = log_config.get('LOG_LEVELS') or {}
+            logger = logging.getLogger(name)
+            logger.setLevel(levels.get(name) or log_config.get('LOG_LEVEL') or 'INFO')
+            logger.addHandler(cls.__queue_handler)
+            logger.propagate = False
+
+            cls.__loggers[name] = logger
+            return logger
+
+    @classmethod
+    def flush(cls):
+        """
+        等待队列中的日志全部输出(交互输入前调用, 避免日志与输入提示交错)
+        :return:
+        """
+        if cls.__listener is not None and cls.__queue is not None:
+            cls.__queue.join()
+
+    @classmethod
+    def shutdown(cls):
+        """
+        输出队列中剩余日志并停止监听线程
+        :return:
+        """
+        with cls.__lock:
+            if cls.__listener is None: return
+            cls.__listener.stop()
+            cls.__listener = None
+            for logger in cls.__loggers.values():
+                logger.removeHandler(cls.__queue_handler)
+            cls.__loggers.clear()
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from typing import Dict, Any, Callable
 from typing import Union
-from collections.abc import Sequence, Iterator
+from collections.abc import Sequence, Iterator, AsyncIterator
 
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.tools import BaseTool
@@ -9,7 +9,7 @@ from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
 
 from core.agent.llm_chat import LLMChat
-from core.common.format_result.format_result import output_stream
+from core.common.format_result.format_result import output_stream, aoutput_stream, aiter_stream
 
 class LLMAgent(LLMChat):
 
@@ -83,4 +83,48 @@ class LLMAgent(LLMChat):
         if enable_assistant:
             self.merge_messages(stream_msgs)
 
-        return agent_stream
\ No newline at end of file
+        return agent_stream
+
+    def __agent_astream(self, prompt: Union[str, list[Union[str, dict]]]) -> AsyncIterator[dict[str, Any] | Any]:
+        self._messages.append(HumanMessage(content=prompt, id=self._chat_id))
+        return self._agent_executor.astream(
+            {
+                "messages": [
+                    HumanMessage(content=prompt)
+                ]
+            },
+            self._config,
+            stream_mode=["updates", "messages", "custom"]
+        )
+
+    async def aagent_ask(self, prompt: Union[str, list[Union[str, dict]]], enable_assistant: bool = False, enable_print: bool = True) -> list:
+        """
+        [异步]agent 对话
+        :param prompt: 提示词
+        :param enable_assistant: 是否记录对话流
+        :param enable_print: 是否打印 stream 流输出
+        :return: 对话流消息列表
+        """
+        agent_stream = self.__agent_astream(prompt=prompt)
+
+        stream_msgs = await aoutput_stream(agent_stream=agent_stream, chat_id=self._chat_id, enable_print=enable_print)
+        if enable_assistant:
+            self.merge_messages(stream_msgs)
+
+        return stream_msgs
+
+    async def aagent_stream(self, prompt: Union[str, list[Union[str, dict]]], enable_assistant: bool = False) -> AsyncIterator[str]:
+        """
+        [异步]agent 流式对话, 逐 token 输出对话文本
+        :param prompt: 提示词
+        :param enable_assistant: 是否记录对话流(对话流结束后记录)
+        :return:
+        """
+        stream_msgs: list = []
+        agent_stream = self.__agent_astream(prompt=prompt)
+
+        async for text in aiter_stream(agent_stream=agent_stream, chat_id=self._chat_id, messages=stream_msgs):
+            yield text
+
+        if enable_assistant:
+            self.merge_messages(stream_msgs)
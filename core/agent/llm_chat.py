@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 import uuid
-from collections.abc import Iterator, Sequence
+from collections.abc import Iterator, AsyncIterator, Sequence
 
 from langchain.chat_models import init_chat_model
 from langchain_core.messages import BaseMessage, BaseMessageChunk, AIMessage, HumanMessage, SystemMessage
 
+from common.logger.logging import Logger
+
+logger = Logger.get_instance(__file__)
+
 
 class LLMChat:
 
@@ -15,8 +19,19 @@ class LLMChat:
         model: str,
         system_propt: str | None = None,
         chat_id: str | None = None,
+        chat_model: any = None,
         **kwargs: any
     ):
+        """
+
+        :param base_url: 模型服务地址
+        :param api_key: 模型服务 api_key
+        :param model: 模型名
+        :param system_propt: 系统提示词
+        :param chat_id: 对话id
+        :param chat_model: 已初始化的对话模型(多个对话共享同一模型客户端时传入, 不为空时不重新初始化)
+        :param kwargs: init_chat_model 拓展参数
+        """
         self._base_url: str = base_url
         self._api_key: str = api_key
         self._model: str = model
@@ -32,7 +47,7 @@ class LLMChat:
                 SystemMessage(content=self._system_propt, id=self._chat_id)
             )
 
-        self._client = init_chat_model(
+        self._client = chat_model if chat_model else init_chat_model(
             base_url=self._base_url,
             api_key=self._api_key,
             model=self._model,
@@ -50,6 +65,23 @@ class LLMChat:
     def get_chat_id(self):
         return self._chat_id
 
+    def fork(self, chat_id: str | None = None) -> 'LLMChat':
+        """
+        派生对话: 共享模型客户端并复制当前对话记录, 派生对话的后续对话不影响原对话(用于同一上下文并发请求)
+        :param chat_id: 派生对话id
+        :return:
+        """
+        chat = LLMChat(
+            base_url=self._base_url,
+            api_key=self._api_key,
+            model=self._model,
+            chat_id=chat_id,
+            chat_model=self._client
+        )
+        chat._system_propt = self._system_propt
+        chat.merge_messages(list(self._messages))
+        return chat
+
     def merge_messages(self, msg: list | HumanMessage | AIMessage):
         if isinstance(msg, list):
             self._messages += msg
@@ -99,3 +131,60 @@ class LLMChat:
             self._messages.append(ask_msg)
 
         return ask_result
+
+    async def aask_stream_msg(self, ask_stream: AsyncIterator[BaseMessageChunk]) -> AIMessage:
+        """
+        [异步]获取对话流文本对象, 完整返回文本记录到 debug 日志
+        :param ask_stream: 异步对话流
+        :return:
+        """
+        messages = []
+        async for chunk in ask_stream:
+            messages.append(chunk.content)
+
+        content = "".join(messages)
+        logger.debug('=> 模型返回(共 %s 字):\n%s', len(content), content, extra={'chat_id': self._chat_id})
+        return AIMessage(content=content, id=self._chat_id)
+
+    async def aask(
+        self,
+        prompt: str,
+        is_steam: bool = False,
+        enable_assistant: bool = False
+    ) -> BaseMessage:
+        """
+        [异步]模型对话
+        :param prompt: 用户提示词
+        :param is_steam: 是否流调用
+        :param enable_assistant: 是否记录模型对话返回结果
+        :return: 模型返回消息
+        """
+        self._messages.append(HumanMessage(content=prompt, id=self._chat_id))
+
+        if is_steam:
+            ask_msg = await self.aask_stream_msg(ask_stream=self._client.astream(self._messages))
+        else:
+            ask_result: any = await self._client.ainvoke(self._messages)
+            ask_msg = ask_result.model_copy(update={"id": self._chat_id})
+
+        if enable_assistant:
+            self._messages.append(ask_msg)
+
+        return ask_msg
+
+    async def aask_stream(self, prompt: str, enable_assistant: bool = False) -> AsyncIterator[BaseMessageChunk]:
+        """
+        [异步]流式模型对话, 逐块输出模型返回结果
+        :param prompt: 用户提示词
+        :param enable_assistant: 是否记录模型对话返回结果(对话流结束后记录)
+        :return:
+        """
+        self._messages.append(HumanMessage(content=prompt, id=self._chat_id))
+        messages = []
+
+        async for chunk in self._client.astream(self._messages):
+            messages.append(chunk.content)
+            yield chunk
+
+        if enable_assistant:
+            self._messages.append(AIMessage(content=("".join(messages)), id=self._chat_id))
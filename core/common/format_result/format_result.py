@@ -1,9 +1,14 @@
+import logging
 import re
-from typing import Iterator, Any, List, Tuple
+from typing import Iterator, AsyncIterator, Any, List, Tuple
 
 from langchain_core.documents import Document
 from langchain_core.messages import AIMessage
 
+from common.logger.logging import Logger
+
+logger = Logger.get_instance(__file__)
+
 
 def output_stream(agent_stream: Iterator[dict[str, Any] | Any], chat_id: str, enable_print: bool = True) -> list:
     """
@@ -16,37 +21,80 @@ def output_stream(agent_stream: Iterator[dict[str, Any] | Any], chat_id: str, en
     messages: list = []
 
     for stream_mode, chunk in agent_stream:
-        # 记录打印完成的结果
-        if stream_mode == 'updates':
-            if 'agent' in chunk:
-                msg = chunk.get('agent', {}).get('messages', [])[-1]
-                messages.append(msg.model_copy(update={"id": chat_id}))
-
-            if 'tools' in chunk:
-                msg = chunk.get('tools', {}).get('messages', [])[-1]
-                messages.append(msg.model_copy(update={"id": chat_id}))
-
-        # 记录自定义内容
-        if stream_mode == 'custom':
-            messages.append(
-                AIMessage(content=chunk, id=chat_id, additional_kwargs={'msg_type': 'custom'})
-            )
-
-        # 不打印工具调用信息(防止泄密)
-        if stream_mode == 'messages':
-            if chunk[-1].get('langgraph_triggers', ()) == ('branch:to:tools',):
-                if enable_print: print(f'Tools 调用中...')
-                continue
-            if enable_print: print(chunk[0].text(), end="", flush=True)
+        text = parse_stream_chunk(stream_mode=stream_mode, chunk=chunk, chat_id=chat_id, messages=messages)
+        if enable_print and text is not None: print(text, end="", flush=True)
+
+    if enable_print: print()
+    return messages
+
+async def aoutput_stream(agent_stream: AsyncIterator[dict[str, Any] | Any], chat_id: str, enable_print: bool = True) -> list:
+    """
+    [异步]输出对话流
+    :param agent_stream: agent astream 异步对话流
+    :param chat_id:
+    :param enable_print: 是否开启打印
+    :return:
+    """
+    messages: list = []
+
+    async for text in aiter_stream(agent_stream=agent_stream, chat_id=chat_id, messages=messages):
+        if enable_print: print(text, end="", flush=True)
 
     if enable_print: print()
     return messages
 
+async def aiter_stream(agent_stream: AsyncIterator[dict[str, Any] | Any], chat_id: str, messages: list) -> AsyncIterator[str]:
+    """
+    [异步]逐 token 迭代输出对话流文本, 完整消息记录到 messages
+    :param agent_stream: agent astream 异步对话流
+    :param chat_id:
+    :param messages: 记录打印完成的消息列表
+    :return:
+    """
+    async for stream_mode, chunk in agent_stream:
+        text = parse_stream_chunk(stream_mode=stream_mode, chunk=chunk, chat_id=chat_id, messages=messages)
+        if text is not None: yield text
+
+def parse_stream_chunk(stream_mode: str, chunk: Any, chat_id: str, messages: list) -> str | None:
+    """
+    解析对话流单个输出块, 完整消息记录到 messages
+    :param stream_mode: 输出块类型(updates/custom/messages)
+    :param chunk: 输出块
+    :param chat_id:
+    :param messages: 记录打印完成的消息列表
+    :return: 需要输出的文本, 无需输出时返回 None
+    """
+    # 记录打印完成的结果
+    if stream_mode == 'updates':
+        if 'agent' in chunk:
+            msg = chunk.get('agent', {}).get('messages', [])[-1]
+            messages.append(msg.model_copy(update={"id": chat_id}))
+
+        if 'tools' in chunk:
+            msg = chunk.get('tools', {}).get('messages', [])[-1]
+            messages.append(msg.model_copy(update={"id": chat_id}))
+
+    # 记录自定义内容
+    if stream_mode == 'custom':
+        messages.append(
+            AIMessage(content=chunk, id=chat_id, additional_kwargs={'msg_type': 'custom'})
+        )
+
+    # 不打印工具调用信息(防止泄密)
+    if stream_mode == 'messages':
+        if chunk[-1].get('langgraph_triggers', ()) == ('branch:to:tools',):
+            return f'Tools 调用中...\n'
+        return chunk[0].text()
+
+    return None
+
 # [todo] 该方法要封装到对应 pydantic 输出结果类中
 def vector_results(docs: list) -> list[dict]:
     vec_results = []
+    is_debug = logger.isEnabledFor(logging.DEBUG)
     for i, doc in enumerate(docs):
-        print(f'可信度: {round(doc[1], 3)}', '检索内容:', doc[0].page_content, 'DOC Metadata:', doc[0].metadata, '\n\n')
+        if is_debug:
+            logger.debug('可信度: %s 检索内容: %s DOC Metadata: %s', round(doc[1], 3), doc[0].page_content, doc[0].metadata)
         vec_results.append({
             'score': doc[1],
             'content': doc[0].page_content
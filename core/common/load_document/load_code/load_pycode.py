@@ -1,38 +1,61 @@
 import os.path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
 from pathlib import Path
 from typing import Union, Iterator
 
-from common.file.file import iter_file_infos, py_module_adap
-from langchain_community.document_loaders.generic import GenericLoader
+from common.file.file import iter_file_infos, py_module_path
+from langchain_community.document_loaders.blob_loaders import Blob
 from langchain_community.document_loaders.parsers import LanguageParser
 from langchain_core.documents import Document
 
+
+def parse_py_file(py_path: str, module: str, parser_kwargs: dict) -> list[Document]:
+    """
+    解析单个 python 文件(在进程池子进程中执行, 只解析语法树, 不执行文件代码)
+    :param py_path: python 文件地址
+    :param module: 文件 module 路径
+    :param parser_kwargs: LanguageParser 拓展参数
+    :return:
+    """
+    parser = LanguageParser(language='python', **parser_kwargs)
+    docs = []
+    for doc in parser.lazy_parse(Blob.from_path(py_path)):
+        doc.metadata = {
+            'py_module': module,
+            **doc.metadata
+        }
+        docs.append(doc)
+
+    return docs
+
+
 class LoadPyCode:
 
-    def __init__(self, file_path: Union[str, Path], **kwargs):
+    def __init__(self, file_path: Union[str, Path], max_workers: int | None = None, **kwargs):
         """
-        输入文件/文件夹地址, 将所有文件后缀名为 .py 的文件, 上传返回为 list[Document] 对象
+        输入文件/文件夹地址, 将所有文件后缀名为 .py 的文件, 上传返回为 list[Document] 对象;
+        文件夹使用 os.scandir 遍历, 文件在进程池中并发解析, 按遍历顺序流式输出
         :param file_path: 文件/文件夹地址
+        :param max_workers: 解析进程数, 默认 cpu 核数, 为1时在当前进程解析
+        :param kwargs: LanguageParser 拓展参数
         """
+        self.__file_path = file_path
         self.__filter_suffix: list[str] = ['py']
-        self.__py_files: list[dict[str, Union[str, Path]]] = list(
-            iter_file_infos(
-                file_path=file_path,
-                filter_suffix=self.__filter_suffix
-            )
-        )
+        self.__max_workers: int = max_workers if max_workers else (os.cpu_count() or 1)
         self.__load_modules: list[dict[str, str]] = []
         self.__kwargs = kwargs
 
     def lazy_load_modules(self) -> Iterator[dict[str, str]]:
         """
         [懒加载]加载python文件对应的module导入列表,
-        输入 python 文件列表, 迭代输出对应 python 代码被其它 python 文件调用的 module 路径列表
+        输入 python 文件列表, 迭代输出对应 python 代码被其它 python 文件调用的 module 路径列表(根据 __init__.py 包结构计算, 不导入模块)
         :return: python文件module调度地址
         """
-        for py_file in self.__py_files:
+        py_files = iter_file_infos(file_path=self.__file_path, filter_suffix=self.__filter_suffix)
+        for py_file in py_files:
             py_path = py_file.get('file_path', '')
-            yield py_module_adap(py_path=py_path)
+            yield py_module_path(py_path=py_path)
 
     def load_modules(self) -> list[dict[str, str]]:
         """
@@ -46,23 +69,21 @@ class LoadPyCode:
     def lazy_load(self) -> Iterator[Document]:
 
         py_modules = self.lazy_load_modules()
-        for py_module in py_modules:
-            py_path = py_module.get('py_path', '')
-            module = py_module.get('module', '')
+        if self.__max_workers <= 1:
+            for py_module in py_modules:
+                yield from parse_py_file(py_module.get('py_path', ''), py_module.get('module', ''), self.__kwargs)
+            return
 
-            lazy_gen_loader = GenericLoader.from_filesystem(
-                path=py_path,
-                parser=LanguageParser(),
-                **self.__kwargs
-            ).lazy_load()
+        # 限制在途文件数, 按提交顺序输出, 防止解析结果堆积在内存
+        pending: deque[Future] = deque()
+        with ProcessPoolExecutor(max_workers=self.__max_workers) as executor:
+            for py_module in py_modules:
+                pending.append(executor.submit(parse_py_file, py_module.get('py_path', ''), py_module.get('module', ''), self.__kwargs))
+                if len(pending) >= self.__max_workers * 4:
+                    yield from pending.popleft().result()
 
-            for gen_load_item in lazy_gen_loader:
-                lazy_load_obj = gen_load_item
-                lazy_load_obj.metadata = {
-                    'py_module': module,
-                    **lazy_load_obj.metadata
-                }
-                yield lazy_load_obj
+            while pending:
+                yield from pending.popleft().result()
 
     def load(self) -> list[Document]:
-        return list(self.lazy_load())
\ No newline at end of file
+        return list(self.lazy_load())
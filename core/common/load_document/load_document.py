@@ -1,5 +1,5 @@
+import functools
 import os
-import importlib
 from pathlib import Path
 from typing import Iterator, Union
 
@@ -8,11 +8,68 @@ from langchain_core.documents import Document
 from langchain_community.document_loaders.parsers import LanguageParser
 
 from common.error.load import UnLoadableError
-from common.inspect.inpect_instance import InpectInstance
+from common.file.sheet import SHEET_TYPES
+from common.inspect.inpect_instance import load_class
 
 # Unstructured 需要设置环境变量, 防止下载 nlp 和 cv 包
 os.environ["AUTO_DOWNLOAD_NLTK"] = "false"
 
+# 按目录加载的文件类型
+DIR_TYPES = ['py_module']
+
+
+@functools.lru_cache(maxsize=None)
+def load_specs() -> dict[str, dict]:
+    """
+    文件类型对应的加载器配置(首次调用时创建, 进程内共享):
+    {文件类型: {'module_path': 模块路径, 'class_name': 类名, 'path_arg': 文件地址参数名, 'init_args': 固定初始化参数}}
+    :return:
+    """
+    def spec(module_path: str, class_name: str, path_arg: str = 'file_path', **init_args) -> dict:
+        return {'module_path': module_path, 'class_name': class_name, 'path_arg': path_arg, 'init_args': init_args}
+
+    code_spec = spec(
+        'langchain_community.document_loaders.generic', 'GenericLoader.from_filesystem',
+        path_arg='path', parser=LanguageParser()
+    )
+    text_spec = spec('langchain_community.document_loaders', 'TextLoader', encoding='utf-8', autodetect_encoding=True)
+    doc_spec = spec('langchain_community.document_loaders', 'Docx2txtLoader')
+
+    return {
+        # [todo] pdf 的图文能力之后要结合飞桨ocr和pymupdf实现
+        # [todo] web 要支持多代理服务器, 防止被拦截
+        'web': spec('langchain_community.document_loaders', 'RecursiveUrlLoader', path_arg='url'),
+        'pdf': spec('core.common.load_document.load_pdf', 'LoadPdf'),
+        **{json_type: spec('core.common.load_document.load_json', 'LoadJson', json_lines=json_type != 'json')
+           for json_type in ['json', 'jsonl', 'ndjson']},
+        **dict.fromkeys(['txt', 'yml', 'ipynb'], text_spec),
+        **dict.fromkeys(LANGUAGE_EXTENSIONS.keys(), code_spec),
+        **{sheet_type: spec('core.common.load_document.load_sheet', 'LoadSheet', file_type=sheet_type) for sheet_type in SHEET_TYPES},
+        **dict.fromkeys(['doc', 'docx'], doc_spec),
+        'py_module': spec('core.common.load_document.load_code.load_pycode', 'LoadPyCode'),
+    }
+
+
+def uploadable_types() -> list[str]:
+    return list(load_specs().keys())
+
+
+def create_loader(file_path: Union[str, Path], file_type: str, **kwargs):
+    """
+    创建文件加载器(加载器类只导入一次)
+    :param file_path: 文件地址
+    :param file_type: 文件类型
+    :param kwargs: 加载器拓展参数
+    :return:
+    """
+    load_spec = load_specs().get(file_type)
+    if not load_spec:
+        raise UnLoadableError(f'上传文件类型【{file_type}】, 不属于可上传类型 【{"|".join(uploadable_types())}】')
+
+    load_cls = load_class(load_spec['module_path'], load_spec['class_name'])
+    return load_cls(**{load_spec['path_arg']: file_path, **load_spec['init_args'], **kwargs})
+
+
 class LoadDocument:
 
     def __init__(self, file_path: Union[str, Path], file_type: str, **kwargs):
@@ -24,105 +81,11 @@ class LoadDocument:
         """
         self.__file_path: str = file_path
         self.__file_type: str = file_type
-        self.__dir_type: list[str] = ['py_module']
-
-        if os.path.isdir(self.__file_path) and not (self.__file_type in self.__dir_type):
-            raise Exception(f'非 {self.__dir_type} 类型, file_path 不能为目录!!')
-
-        # [todo] excel 解析格式要对齐csv
-        self.__excel_loader: dict = {
-            'module_path': 'langchain_community.document_loaders',
-            'class_name': 'UnstructuredExcelLoader',
-            'init_args': {
-                'file_path': self.__file_path,
-                'mode': 'elements',
-                **kwargs
-            }
-        }
-        self.__code_loader: dict = {
-            'module_path': 'langchain_community.document_loaders.generic',
-            'class_name': 'GenericLoader.from_filesystem',
-            'init_args': {
-                'path': self.__file_path,
-                'parser': LanguageParser(),
-                **kwargs
-            }
-        }
-        self.__doc_loader: dict = {
-            'module_path': 'langchain_community.document_loaders',
-            'class_name': 'Docx2txtLoader',
-            'init_args': {
-                'file_path': self.__file_path,
-                **kwargs
-            }
-        }
-        self.__py_loader: dict = {
-            'module_path': 'core.common.load_document.load_code.load_pycode',
-            'class_name': 'LoadPyCode',
-            'init_args': {
-                'file_path': self.__file_path,
-                **kwargs
-            }
-        }
-        self.__text_loader: dict = {
-            'module_path': 'langchain_community.document_loaders',
-            'class_name': 'TextLoader',
-            'init_args': {
-                'file_path': self.__file_path,
-                'encoding': 'utf-8',
-                'autodetect_encoding': True,
-                **kwargs
-            }
-        }
-
-        self.__load_map: dict = {
-            # [todo] excel 要单独封装
-            # [todo] pdf 的图文能力之后要结合飞桨ocr和pymupdf实现
-            # [todo] web 要支持多代理服务器, 防止被拦截
-            'web': {
-                'module_path': 'langchain_community.document_loaders',
-                'class_name': 'RecursiveUrlLoader',
-                'init_args': {
-                    'url': self.__file_path,
-                    **kwargs
-                }
-            },
-            'pdf': {
-                'module_path': 'langchain_community.document_loaders',
-                'class_name': 'PyMuPDFLoader',
-                'init_args': {
-                    'file_path': self.__file_path,
-                    **kwargs
-                }
-            },
-            'csv': {
-                'module_path': 'langchain_community.document_loaders.csv_loader',
-                'class_name': 'CSVLoader',
-                'init_args': {
-                    'file_path': self.__file_path,
-                    **kwargs
-                }
-            },
-            'json': {
-                'module_path': 'langchain_community.document_loaders',
-                'class_name': 'JSONLoader',
-                'init_args': {
-                    'file_path': self.__file_path,
-                    **kwargs
-                }
-            },
-            **dict.fromkeys(['txt', 'yml', 'ipynb'], self.__text_loader),
-            **dict.fromkeys(LANGUAGE_EXTENSIONS.keys(), self.__code_loader),
-            **dict.fromkeys(['xlsx', 'xls'], self.__excel_loader),
-            **dict.fromkeys(['doc', 'docx'], self.__doc_loader),
-            **dict.fromkeys(['py_module'], self.__py_loader),
-        }
-
-        if not (self.__file_type in list(self.uploadable_type)):
-            raise UnLoadableError(f'上传文件类型【{self.__file_type}】, 不属于可上传类型 【{"|".join(self.uploadable_type)}】')
-
-        self.__load_instance = InpectInstance(module_map=self.__load_map, module_key=self.__file_type).load_instance
 
+        if not (self.__file_type in DIR_TYPES) and os.path.isdir(self.__file_path):
+            raise Exception(f'非 {DIR_TYPES} 类型, file_path 不能为目录!!')
+
+        self.__load_instance = create_loader(file_path=self.__file_path, file_type=self.__file_type, **kwargs)
 
     @property
     def load_instance(self):
@@ -130,11 +93,11 @@ class LoadDocument:
 
     @property
     def uploadable_type(self) -> list[str]:
-        return list(self.__load_map.keys())
+        return uploadable_types()
 
     def load(self) -> list[Document]:
         return list(self.lazy_load())
 
     def lazy_load(self) -> Iterator[Document]:
         lazy_result = self.__load_instance.lazy_load()
-        return lazy_result
\ No newline at end of file
+        return lazy_result
@@ -0,0 +1,205 @@
+import json
+from pathlib import Path
+from typing import IO, Iterator, Union
+
+from langchain_core.documents import Document
+
+from common.error.load import UnLoadableError
+
+
+class JsonStreamParser:
+
+    def __init__(self, file: IO[str], block_size: int = 64 * 1024, max_item_size: int = 1024 * 1024):
+        """
+        json 流式解析: 按块读取文件, 逐个输出容器(数组/对象)内的元素;
+        元素超过 max_item_size 仍未解析完成时进入该元素内部继续流式解析, 内存占用由 max_item_size 决定而不是文件大小
+        :param file: 文本文件对象
+        :param block_size: 单次读取字符数
+        :param max_item_size: 单个元素最大解析字符数(超出后拆分为子元素, 标量元素除外)
+        """
+        self.__file = file
+        self.__block_size = block_size
+        self.__max_item_size = max_item_size
+        self.__decoder = json.JSONDecoder()
+        self.__buffer = ''
+        self.__pos = 0
+        self.__eof = False
+
+    def __read(self, size: int) -> bool:
+        """
+        读取更多数据到缓冲区, 已解析的部分从缓冲区移除
+        :param size: 读取字符数
+        :return: 是否读取到数据
+        """
+        if self.__eof: return False
+        if self.__pos:
+            self.__buffer = self.__buffer[self.__pos:]
+            self.__pos = 0
+
+        data = self.__file.read(size)
+        if not data:
+            self.__eof = True
+            return False
+        self.__buffer += data
+        return True
+
+    def __peek(self) -> str:
+        """
+        跳过空白字符, 返回下一个字符(文件结束时为空)
+        :return:
+        """
+        while True:
+            while self.__pos < len(self.__buffer) and self.__buffer[self.__pos] in ' \t\r\n':
+                self.__pos += 1
+            if self.__pos < len(self.__buffer) or not self.__read(self.__block_size):
+                return self.__buffer[self.__pos: self.__pos + 1]
+
+    def __expect(self, char: str):
+        if self.__peek() != char:
+            raise UnLoadableError(f'json 格式错误: 位置附近应为【{char}】, 实际为【{self.__buffer[self.__pos: self.__pos + 20]}】')
+        self.__pos += 1
+
+    def __decode(self, max_size: int | None = None) -> tuple[bool, any]:
+        """
+        从当前位置解析一个 json 值, 数据不完整时按倍数增加读取量后重试
+        :param max_size: 最大解析字符数, 超出后返回 (False, None), 为空表示不限制
+        :return: (是否解析完成, 值)
+        """
+        read_size = self.__block_size
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(self.__buffer, self.__pos)
+                # 缓冲区末尾的数字可能被截断, 需要读取到后续字符或文件结束才能确认
+                if end < len(self.__buffer) or self.__eof or isinstance(value, (dict, list)):
+                    self.__pos = end
+                    return True, value
+            except json.JSONDecodeError as e:
+                if self.__eof: raise UnLoadableError(f'json 格式错误: {str(e)}')
+
+            if max_size is not None and len(self.__buffer) - self.__pos >= max_size: return False, None
+            self.__read(read_size)
+            read_size = min(read_size * 2, max_size) if max_size else read_size * 2
+
+    def iter_items(self) -> Iterator[tuple[list[Union[str, int]], any]]:
+        """
+        [懒加载]迭代输出 (元素路径, 元素值), 路径为对象键/数组下标列表;
+        顶层为标量时输出 ([], 值), 空数组/空对象不输出
+        :return:
+        """
+        char = self.__peek()
+        if not char: return
+        if char not in '[{':
+            yield [], self.__decode()[1]
+            return
+
+        self.__pos += 1
+        # 栈元素: [容器类型, 容器路径, 下一个数组下标]
+        stack: list[list] = [[char, [], 0]]
+
+        while stack:
+            container_type, container_path, index = stack[-1]
+            char = self.__peek()
+            if not char: raise UnLoadableError('json 格式错误: 文件意外结束')
+
+            if char in ']}':
+                self.__pos += 1
+                stack.pop()
+                continue
+            if char == ',':
+                self.__pos += 1
+                continue
+
+            if container_type == '{':
+                _, key = self.__decode()
+                if not isinstance(key, str): raise UnLoadableError(f'json 格式错误: 对象键【{key}】不是字符串')
+                self.__expect(':')
+            else:
+                key = index
+                stack[-1][2] += 1
+
+            item_path = container_path + [key]
+            if self.__peek() in ['[', '{']:
+                finished, value = self.__decode(max_size=self.__max_item_size)
+                if not finished:
+                    stack.append([self.__buffer[self.__pos], item_path, 0])
+                    self.__pos += 1
+                    continue
+            else:
+                _, value = self.__decode()
+
+            yield item_path, value
+
+
+def json_path(path: list[Union[str, int]]) -> str:
+    """
+    元素路径转 json path, 如: ['data', 0, 'name'] -> $.data[0].name
+    :param path:
+    :return:
+    """
+    return '$' + ''.join(f'[{key}]' if isinstance(key, int) else f'.{key}' for key in path)
+
+
+def wrap_item(path: list[Union[str, int]], value: any) -> any:
+    """
+    按路径还原元素所在的嵌套结构(保留上层键作为切片上下文), 顶层数组下标不保留
+    :param path:
+    :param value:
+    :return:
+    """
+    while path and isinstance(path[0], int):
+        path = path[1:]
+    for key in reversed(path):
+        value = [value] if isinstance(key, int) else {key: value}
+    return value
+
+
+class LoadJson:
+
+    def __init__(
+        self,
+        file_path: Union[str, Path],
+        json_lines: bool = False,
+        max_item_size: int = 1024 * 1024,
+        encoding: str = 'utf-8'
+    ):
+        """
+        流式加载 json/jsonl 文件, 每个元素(json 为顶层容器内元素, jsonl 为每行记录)输出一个 Document, 不读取整个文件到内存
+        :param file_path: 文件地址
+        :param json_lines: 是否为 jsonl 格式(每行一个 json)
+        :param max_item_size: json 单个元素最大解析字符数, 超出后拆分为子元素
+        :param encoding: 文件编码
+        """
+        self.__file_path = str(file_path)
+        self.__json_lines = json_lines
+        self.__max_item_size = max_item_size
+        self.__encoding = encoding
+
+    def __lazy_load_lines(self) -> Iterator[Document]:
+        with open(self.__file_path, 'r', encoding=self.__encoding) as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip(): continue
+                try:
+                    value = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise UnLoadableError(f'jsonl 第【{line_number}】行格式错误: {str(e)}')
+
+                yield Document(
+                    page_content=json.dumps(value, ensure_ascii=False),
+                    metadata={'source': self.__file_path, 'line': line_number}
+                )
+
+    def lazy_load(self) -> Iterator[Document]:
+        if self.__json_lines:
+            yield from self.__lazy_load_lines()
+            return
+
+        with open(self.__file_path, 'r', encoding=self.__encoding) as f:
+            parser = JsonStreamParser(file=f, max_item_size=self.__max_item_size)
+            for path, value in parser.iter_items():
+                yield Document(
+                    page_content=json.dumps(wrap_item(path, value), ensure_ascii=False),
+                    metadata={'source': self.__file_path, 'json_path': json_path(path)}
+                )
+
+    def load(self) -> list[Document]:
+        return list(self.lazy_load())
@@ -0,0 +1,241 @@
+import os
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterator, Union
+
+from langchain_core.documents import Document
+
+from common.error.load import UnLoadableError
+from common.file.hash_file import calculate_file_hash
+from common.logger.logging import Logger
+
+logger = Logger.get_instance(__file__)
+
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> list[tuple[int, str | None, str | None]]:
+    """
+    提取 pdf 页码范围内每页的文本(在进程池子进程中执行), 单页失败不影响其它页
+    :param file_path: pdf 文件地址
+    :param start: 起始页码(从0开始)
+    :param end: 结束页码(不包含)
+    :return: [(页码, 文本, 失败原因)]
+    """
+    import pymupdf
+
+    pages = []
+    with pymupdf.open(file_path) as pdf:
+        for page_number in range(start, end):
+            try:
+                pages.append((page_number, pdf.load_page(page_number).get_text(), None))
+            except Exception as e:
+                pages.append((page_number, None, str(e)))
+
+    return pages
+
+
+class PdfTextCache:
+
+    def __init__(self, db_path: str | None = None):
+        """
+        pdf 文本缓存, 以 (文件哈希, 页码) 为键保存每页提取的文本, 重复写入同一文件时跳过提取
+        :param db_path: sqlite 缓存文件地址, 默认 ../data/pdf_cache.db
+        """
+        project_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+        self.__db_path = db_path if db_path else os.path.join(project_path, 'data', 'pdf_cache.db')
+        self.__lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.__db_path)), exist_ok=True)
+        self.__conn = sqlite3.connect(self.__db_path, check_same_thread=False)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        self.__conn.execute(
+            'CREATE TABLE IF NOT EXISTS pdf_page ('
+            'file_hash TEXT NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL, PRIMARY KEY (file_hash, page))'
+        )
+        self.__conn.commit()
+
+    def get_pages(self, file_hash: str) -> dict[int, str]:
+        with self.__lock:
+            rows = self.__conn.execute('SELECT page, text FROM pdf_page WHERE file_hash = ?', [file_hash]).fetchall()
+        return {page: text for page, text in rows}
+
+    def set_pages(self, file_hash: str, pages: dict[int, str]):
+        if not pages: return
+        with self.__lock:
+            self.__conn.executemany(
+                'INSERT OR REPLACE INTO pdf_page (file_hash, page, text) VALUES (?, ?, ?)',
+                [(file_hash, page, text) for page, text in pages.items()]
+            )
+            self.__conn.commit()
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
+
+
+class LoadPdf:
+
+    def __init__(
+        self,
+        file_path: Union[str, Path],
+        pages_per_task: int = 16,
+        max_workers: int | None = None,
+        enable_cache: bool = True,
+        cache_db_path: str | None = None
+    ):
+        """
+        按页码范围拆分 pdf, 在进程池中并发提取文本, 按页码范围完成顺序流式输出每页 Document(元数据 page 从0开始);
+        单页提取失败时跳过该页, 子进程异常退出时按单页重新提取; 提取结果按文件哈希缓存, 重复写入时跳过已提取的页
+        :param file_path: pdf 文件地址
+        :param pages_per_task: 单个任务提取的页数
+        :param max_workers: 提取进程数, 默认 cpu 核数, 为1时在当前进程提取
+        :param enable_cache: 是否开启文本缓存
+        :param cache_db_path: 缓存文件地址, 默认 ../data/pdf_cache.db
+        """
+        self.__file_path = str(file_path)
+        self.__pages_per_task = max(pages_per_task, 1)
+        self.__max_workers = max_workers if max_workers else (os.cpu_count() or 1)
+        self.__enable_cache = enable_cache
+        self.__cache_db_path = cache_db_path
+        self.__failed_pages: dict[int, str] = {}
+
+    @property
+    def failed_pages(self) -> dict[int, str]:
+        """
+        提取失败的页 {页码: 失败原因}
+        """
+        return self.__failed_pages
+
+    def __page_count(self) -> int:
+        import pymupdf
+
+        try:
+            with pymupdf.open(self.__file_path) as pdf:
+                return pdf.page_count
+        except Exception as e:
+            raise UnLoadableError(f'pdf 文件【{self.__file_path}】无法打开: {str(e)}')
+
+    def __page_ranges(self, pages: list[int]) -> list[tuple[int, int]]:
+        """
+        连续页码合并为页码范围, 每个范围不超过 pages_per_task 页
+        :param pages: 升序页码
+        :return: [(起始页码, 结束页码(不包含))]
+        """
+        ranges = []
+        for page in pages:
+            if ranges and ranges[-1][1] == page and ranges[-1][1] - ranges[-1][0] < self.__pages_per_task:
+                ranges[-1] = (ranges[-1][0], page + 1)
+            else:
+                ranges.append((page, page + 1))
+        return ranges
+
+    def __document(self, page: int, text: str, total_pages: int) -> Document:
+        return Document(
+            page_content=text,
+            metadata={'source': self.__file_path, 'file_path': self.__file_path, 'page': page, 'total_pages': total_pages}
+        )
+
+    def __renew_executor(self, executor: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """
+        子进程异常退出(如解析崩溃)后进程池不可用, 关闭并新建进程池
+        :param executor:
+        :return:
+        """
+        executor.shutdown(wait=False, cancel_futures=True)
+        return ProcessPoolExecutor(max_workers=self.__max_workers)
+
+    def __iter_extract(self, ranges: list[tuple[int, int]]) -> Iterator[tuple[int, str | None, str | None]]:
+        """
+        [懒加载]提取页码范围, 按完成顺序输出 (页码, 文本, 失败原因)
+        :param ranges:
+        :return:
+        """
+        if self.__max_workers <= 1 or len(ranges) <= 1:
+            for start, end in ranges:
+                yield from extract_pdf_pages(self.__file_path, start, end)
+            return
+
+        # 任务: (起始页码, 结束页码, 是否为重试任务)
+        tasks: deque[tuple[int, int, bool]] = deque((start, end, False) for start, end in ranges)
+        pending: dict[Future, tuple[int, int, bool, ProcessPoolExecutor]] = {}
+        executor = ProcessPoolExecutor(max_workers=self.__max_workers)
+        try:
+            while tasks or pending:
+                # 限制在途任务数, 防止提取结果堆积在内存; 重试任务单独运行, 不受其它任务导致的进程池异常影响
+                while tasks and len(pending) < self.__max_workers * 2:
+                    start, end, is_retry = tasks[0]
+                    if is_retry and pending: break
+                    tasks.popleft()
+                    try:
+                        future = executor.submit(extract_pdf_pages, self.__file_path, start, end)
+                    except BrokenProcessPool:
+                        executor = self.__renew_executor(executor)
+                        future = executor.submit(extract_pdf_pages, self.__file_path, start, end)
+                    pending[future] = (start, end, is_retry, executor)
+                    if is_retry: break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end, is_retry, task_executor = pending.pop(future)
+                    try:
+                        pages = future.result()
+                    except BrokenProcessPool as e:
+                        if task_executor is executor: executor = self.__renew_executor(executor)
+                        # 同一进程池内其它任务导致的异常, 单页单独重试一次
+                        if end - start == 1 and not is_retry:
+                            tasks.append((start, end, True))
+                            continue
+                        error = str(e) or 'pdf 提取进程异常退出'
+                    except Exception as e:
+                        error = str(e)
+                    else:
+                        yield from pages
+                        continue
+
+                    # 页码范围失败时按单页重新提取, 隔离失败页
+                    if end - start > 1:
+                        tasks.extend((page, page + 1, False) for page in range(start, end))
+                    else:
+                        yield start, None, error
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def lazy_load(self) -> Iterator[Document]:
+        total_pages = self.__page_count()
+        file_hash = calculate_file_hash(self.__file_path) if self.__enable_cache else None
+        cache = PdfTextCache(db_path=self.__cache_db_path) if self.__enable_cache else None
+        self.__failed_pages = {}
+
+        new_pages: dict[int, str] = {}
+        try:
+            cached_pages = cache.get_pages(file_hash) if cache else {}
+            for page in sorted(cached_pages):
+                if page < total_pages and cached_pages[page].strip():
+                    yield self.__document(page, cached_pages[page], total_pages)
+
+            missing_pages = [page for page in range(total_pages) if page not in cached_pages]
+            for page, text, error in self.__iter_extract(self.__page_ranges(missing_pages)):
+                if error is not None:
+                    self.__failed_pages[page] = error
+                    logger.warning(
+                        f'* 文件: {self.__file_path} 第【{page + 1}】页提取失败: {error}',
+                        extra={'file_path': self.__file_path, 'page': page}
+                    )
+                    continue
+
+                if cache:
+                    new_pages[page] = text
+                    if len(new_pages) >= self.__pages_per_task:
+                        cache.set_pages(file_hash, new_pages)
+                        new_pages = {}
+                if text.strip(): yield self.__document(page, text, total_pages)
+        finally:
+            if cache:
+                cache.set_pages(file_hash, new_pages)
+                cache.close()
+
+    def load(self) -> list[Document]:
+        return list(self.lazy_load())
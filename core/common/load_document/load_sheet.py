@@ -0,0 +1,52 @@
+from pathlib import Path
+from typing import Iterator, Union
+
+from langchain_core.documents import Document
+
+from common.file.sheet import iter_sheet_frames, markdown_header, markdown_rows
+
+
+class LoadSheet:
+
+    def __init__(
+        self,
+        file_path: Union[str, Path],
+        file_type: str,
+        batch_rows: int = 1000,
+        encoding: str = 'utf-8'
+    ):
+        """
+        流式加载表格文件(xlsx/xls/csv), 每批行输出一个 markdown 表格 Document(包含表头), 不读取整个文件到内存;
+        元数据 header 为表头 markdown, 切片时每个切片重复表头
+        :param file_path: 文件地址
+        :param file_type: 文件类型
+        :param batch_rows: 每个 Document 的行数
+        :param encoding: csv 文件编码
+        """
+        self.__file_path = str(file_path)
+        self.__file_type = file_type
+        self.__batch_rows = batch_rows
+        self.__encoding = encoding
+
+    def lazy_load(self) -> Iterator[Document]:
+        start_rows: dict[str, int] = {}
+        frames = iter_sheet_frames(self.__file_path, self.__file_type, batch_rows=self.__batch_rows, encoding=self.__encoding)
+        for sheet_name, header, frame in frames:
+            header_text = markdown_header(header)
+            if self.__file_type != 'csv': header_text = f'## {sheet_name}\n{header_text}'
+
+            start_row = start_rows.get(sheet_name, 1)
+            start_rows[sheet_name] = start_row + len(frame)
+            yield Document(
+                page_content='\n'.join([header_text] + markdown_rows(frame)),
+                metadata={
+                    'source': self.__file_path,
+                    'sheet': sheet_name,
+                    'header': header_text,
+                    'start_row': start_row,
+                    'end_row': start_row + len(frame) - 1
+                }
+            )
+
+    def load(self) -> list[Document]:
+        return list(self.lazy_load())
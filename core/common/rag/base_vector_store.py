@@ -0,0 +1,396 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterator, List, Union
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from pydantic import BaseModel, Field
+
+from core.common.format_result.format_result import vector_results
+from core.common.load_document.load_document import LoadDocument
+from core.common.rag.query_cache import QueryCache
+from core.common.rag.rerank import RerankClient, AdaptiveReranker
+from core.common.split_document.split_document import SplitDocument
+
+
+class IndexStats(BaseModel):
+    index_name: str = Field(description='索引名')
+    tenant: str | None = Field(default=None, description='租户名')
+    count: int = Field(default=0, description='切片数')
+    dim: int = Field(default=0, description='向量维度')
+    quantization: str = Field(default='none', description='生效的量化类型')
+    vector_bytes: int = Field(default=0, description='原始向量占用空间(单位: byte)')
+    memory_bytes: int = Field(default=0, description='检索时常驻内存估算(单位: byte)')
+    k: int = Field(default=10, description='召回率计算的检索个数')
+    recall_at_k: float | None = Field(default=None, description='抽样计算的 recall@k, 为空表示未计算')
+
+    @property
+    def memory_mb(self) -> float:
+        return self.memory_bytes / 1024 / 1024
+
+
+class BaseVectorStore(ABC):
+
+    def __init__(
+        self,
+        embedding_client: Embeddings = None,
+        rerank_client: RerankClient = None,
+        query_cache: QueryCache | None = None,
+        reranker: AdaptiveReranker | None = None
+    ):
+        """
+        向量数据库基类: 实现文件加载切片、检索结果缓存、批量检索和 rerank, 子类实现索引管理、写入、删除和混合检索(similarity_search)
+        :param embedding_client: 嵌入模型客户端
+        :param rerank_client: 重排模型客户端
+        :param query_cache: 检索结果缓存, 为空时不缓存
+        :param reranker: 自适应重排(跳过/截断/并发/候选数上限), 为空时使用 rerank_client 直接重排
+        """
+        self.__embedding_client = embedding_client
+        self.__rerank_client = reranker.rerank_client if reranker else rerank_client
+        self.__reranker = reranker if reranker else (AdaptiveReranker(rerank_client) if rerank_client else None)
+        self.__query_cache = query_cache
+
+    @property
+    def embedding_client(self) -> Embeddings:
+        return self.__embedding_client
+
+    @property
+    def rerank_client(self) -> RerankClient | None:
+        return self.__rerank_client
+
+    @property
+    def reranker(self) -> AdaptiveReranker | None:
+        return self.__reranker
+
+    @property
+    def query_cache(self) -> QueryCache | None:
+        return self.__query_cache
+
+    @property
+    @abstractmethod
+    def index_name(self) -> str | None:
+        """
+        当前检索的索引名(get_store/init_vector 后设置)
+        """
+
+    def load_file(
+        self,
+        file_path: Union[str, Path],
+        file_type: str,
+        chunk_size: int = 200,
+        chunk_overlap: int = 10,
+        separators: list = ['\n', ' '],
+        max_tokens: int = 512,
+        tokenizer: str | None = None
+    ):
+        loader = LoadDocument(
+            file_path=file_path,
+            file_type=file_type
+        )
+        docs = loader.load()
+        spliter = SplitDocument(
+            file_type=file_type,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=separators,
+            max_tokens=max_tokens,
+            tokenizer=tokenizer
+        )
+        split_docs = spliter.split_documents(docs)
+
+        return split_docs
+
+    def lazy_load_file(
+        self,
+        file_path: Union[str, Path],
+        file_type: str,
+        chunk_size: int = 200,
+        chunk_overlap: int = 10,
+        separators: list = ['\n', ' '],
+        max_tokens: int = 512,
+        tokenizer: str | None = None
+    ) -> Iterator[Document]:
+        """
+        [懒加载]按文档逐个加载并切片, 迭代输出切片, 不在内存中保存整个文件的切片结果
+        :param file_path: 文件地址
+        :param file_type: 文件类型
+        :param chunk_size: 切片大小
+        :param chunk_overlap: 切片重合度
+        :param separators: 切片分隔符
+        :param max_tokens: python 代码切片最大 token 数
+        :param tokenizer: python 代码切片使用的嵌入模型 tokenizer
+        :return:
+        """
+        spliter = SplitDocument(
+            file_type=file_type,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=separators,
+            max_tokens=max_tokens,
+            tokenizer=tokenizer
+        )
+        loader = LoadDocument(
+            file_path=file_path,
+            file_type=file_type
+        )
+        yield from spliter.lazy_split_documents(loader.lazy_load())
+
+    @abstractmethod
+    def get_store(self, index_name: str, tenant: str | None = None) -> Any:
+        """
+        获取索引对应的向量库句柄(索引不存在时创建空索引), 不写入任何数据
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :return:
+        """
+
+    @abstractmethod
+    def insert_vectors(
+        self,
+        split_docs: List[Document],
+        vectors: List[List[float]],
+        index_name: str,
+        tenant: str | None = None,
+    ) -> dict:
+        """
+        写入已向量化的切片
+        :param split_docs: 切片数据, 切片 id 不为空时作为 uuid(相同 uuid 覆盖写入)
+        :param vectors: 切片对应的向量
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :return: 写入失败的切片 {切片下标: 失败原因}
+        """
+
+    def init_vector(
+        self,
+        split_docs: List[Document],
+        uuids: list[str] = [],
+        index_name: str | None = None,
+        tenant: str | None = None,
+        **kwargs
+    ):
+        """
+        初始化写入向量库
+        :param split_docs: 切片数据
+        :param uuids: 切片对应的uuid列表, 存在该值时, 第一次是插入之后按照uuid 匹配更新; 没有该值每次都是新增
+        :param index_name: 索引名, 不同名会新建索引
+        :param tenant: 租户名
+        :return:
+        """
+        store = self.get_store(index_name=index_name, tenant=tenant)
+        if not split_docs: return store
+
+        for split_doc, chunk_uuid in zip(split_docs, uuids):
+            split_doc.id = chunk_uuid
+        vectors = self.__embedding_client.embed_documents([split_doc.page_content for split_doc in split_docs])
+        self.insert_vectors(split_docs=split_docs, vectors=vectors, index_name=index_name, tenant=tenant)
+
+        return store
+
+    @abstractmethod
+    def similarity_search(
+        self,
+        query: str,
+        query_vector: list[float] | None = None,
+        alpha: float = 0.75,
+        k: int = 5,
+        filter: Any = None,
+        tenant: str | None = None,
+        index_name: str | None = None
+    ) -> list[tuple[Document, float]]:
+        """
+        混合检索(向量 + BM25 关键字)
+        :param query: 需要查询的问题
+        :param query_vector: 问题向量, 为空时使用嵌入模型向量化
+        :param alpha: 向量和关键字比重, 范围: [0,1], 1 表示完全使用向量
+        :param k: 需要返回的结果个数
+        :param filter: 过滤表达式
+        :param tenant: 租户名
+        :param index_name: 索引名, 为空时使用当前索引(get_store/init_vector 设置)
+        :return: [(切片, 分数)]
+        """
+
+    # [todo] 以后需要统一wrap验证
+    # [todo] 该结果之后用 pydantic 表示, 并封装对应输出格式的方法
+    def search(
+        self,
+        query: str,
+        alpha = 0.75,
+        k: int = 5,
+        rerank_topn: int = 5,
+        is_rerank: bool = False,
+        filter: Any = None,
+        tenant: str | None = None,
+        index_name: str | None = None,
+    ) -> list[dict]:
+        """
+        查询向量数据库数据, 返回可信度最高的 k 个结果
+        :param query: 需要查询的问题
+        :param alpha: 向量和关键字比重, 范围: [0,1], 1 表示完全使用向量, 默认值 0.75
+        :param k: 需要返回的结果个数
+        :param rerank_topn: rerank 需要返回的结果个数
+        :param is_rerank: 查询结果是否再次使用 rerank 结果
+        :param filter: 过滤表达式
+        :param index_name: 索引名, 为空时使用当前索引(get_store/init_vector 设置); 多线程检索时需指定
+        :return:
+        """
+        index_name = index_name if index_name else self.index_name
+        if not index_name:
+            raise Exception('向量数据库未加载向量!!')
+
+        cache_key = self.__query_cache_key(index_name, query, alpha, k, rerank_topn, is_rerank, filter, tenant)
+        if cache_key:
+            cache_result = self.__query_cache.get(cache_key)
+            if cache_result is not None: return cache_result
+
+        docs = self.similarity_search(query, alpha=alpha, k=k, filter=filter, tenant=tenant, index_name=index_name)
+        search_results = vector_results(docs)
+
+        if is_rerank and self.__reranker:
+            search_results = self.__reranker.rerank(query=query, candidates=search_results, top_n=rerank_topn)
+
+        if cache_key: self.__query_cache.set(cache_key, search_results)
+        return search_results
+
+    def search_many(
+        self,
+        queries: list[str],
+        alpha = 0.75,
+        k: int = 5,
+        rerank_topn: int = 5,
+        is_rerank: bool = False,
+        filter: Any = None,
+        tenant: str | None = None,
+        max_workers: int = 8,
+        index_name: str | None = None,
+    ) -> list[list[dict]]:
+        """
+        批量查询向量数据库数据: 一次请求向量化所有问题, 并发执行混合检索和 rerank
+        :param queries: 需要查询的问题列表
+        :param alpha: 向量和关键字比重, 范围: [0,1], 1 表示完全使用向量, 默认值 0.75
+        :param k: 每个问题需要返回的结果个数
+        :param rerank_topn: rerank 需要返回的结果个数
+        :param is_rerank: 查询结果是否再次使用 rerank 结果
+        :param filter: 过滤表达式
+        :param tenant: 租户名
+        :param max_workers: 最大并发查询数
+        :param index_name: 索引名, 为空时使用当前索引(get_store/init_vector 设置)
+        :return: 与 queries 顺序一致的查询结果列表
+        """
+        # 检索在线程池中执行, 索引名需显式传递
+        index_name = index_name if index_name else self.index_name
+        if not index_name:
+            raise Exception('向量数据库未加载向量!!')
+        if not queries: return []
+
+        search_map: dict[str, list[dict]] = {}
+        cache_keys = {
+            query: self.__query_cache_key(index_name, query, alpha, k, rerank_topn, is_rerank, filter, tenant)
+            for query in dict.fromkeys(queries)
+        }
+        for query, cache_key in cache_keys.items():
+            cache_result = self.__query_cache.get(cache_key) if cache_key else None
+            if cache_result is not None: search_map[query] = cache_result
+
+        unique_queries = [query for query in cache_keys if query not in search_map]
+        if not unique_queries: return [search_map[query] for query in queries]
+        query_vectors = self.__embedding_client.embed_documents(unique_queries)
+
+        def hybrid_search(query: str, query_vector: list[float]) -> list[dict]:
+            docs = self.similarity_search(
+                query, query_vector=query_vector, alpha=alpha, k=k, filter=filter, tenant=tenant, index_name=index_name
+            )
+            return vector_results(docs)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique_queries)))) as executor:
+            search_results_list = list(executor.map(hybrid_search, unique_queries, query_vectors))
+        # 所有问题的重排请求一起调度, 共享候选数上限
+        if is_rerank and self.__reranker:
+            search_results_list = self.__reranker.rerank_many(unique_queries, search_results_list, top_n=rerank_topn)
+
+        for query, search_results in zip(unique_queries, search_results_list):
+            search_map[query] = search_results
+            if cache_keys[query]: self.__query_cache.set(cache_keys[query], search_results)
+
+        return [search_map[query] for query in queries]
+
+    def __query_cache_key(
+        self,
+        index_name: str,
+        query: str,
+        alpha: float,
+        k: int,
+        rerank_topn: int,
+        is_rerank: bool,
+        filter: Any,
+        tenant: str | None
+    ) -> str | None:
+        """
+        生成检索结果缓存键, 未开启缓存或带过滤条件的查询不缓存
+        :return:
+        """
+        if not self.__query_cache or filter is not None: return None
+        return self.__query_cache.make_key(
+            collection=index_name,
+            tenant=tenant,
+            query=query,
+            alpha=alpha,
+            k=k,
+            rerank_topn=rerank_topn,
+            is_rerank=is_rerank and self.__reranker is not None
+        )
+
+    def rerank(self, query: str, vector_results: list[dict], top_n: int = 5) -> list[dict]:
+        """
+        重排检索结果
+        :param query: 问题
+        :param vector_results: 混合检索结果 [{'score': 分数, 'content': 文本}]
+        :param top_n: 保留的结果个数
+        :return: 重排结果, 格式同混合检索结果
+        """
+        if not self.__reranker: return vector_results
+        return self.__reranker.rerank(query=query, candidates=vector_results, top_n=top_n)
+
+    @abstractmethod
+    def delete_by_ids(self, index_name: str, uuids: list[str], tenant: str | None = None, batch_size: int = 1000) -> int:
+        """
+        按 uuid 删除索引中的切片
+        :param index_name: 索引名
+        :param uuids: 需要删除的切片 uuid 列表
+        :param tenant: 租户名
+        :param batch_size: 单次删除的 uuid 数
+        :return: 删除成功的切片数
+        """
+
+    @abstractmethod
+    def index_stats(self, index_name: str, tenant: str | None = None, k: int = 10, samples: int = 100) -> IndexStats:
+        """
+        工作区索引的内存占用和召回率
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :param k: 召回率计算的检索个数
+        :param samples: 抽样问题数, 为0时不计算召回率
+        :return:
+        """
+
+    @abstractmethod
+    def delete_collection(self, collection_name: str):
+        pass
+
+    @abstractmethod
+    def clear_collections(self):
+        pass
+
+    @abstractmethod
+    def all_collections(self) -> list:
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,87 @@
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+
+from core.common.rag.web_search_cache import WebSearchCache
+
+
+class BaseWebSearch(ABC):
+
+    name = 'base'
+
+    def __init__(self, max_results: int = 2, max_chars: int | None = None, cache: WebSearchCache | None = None):
+        """
+        网页搜索基类: 实现结果缓存、相同问题并发请求合并(只请求一次, 其余请求等待结果)和摘要截断, 子类实现 fetch
+        :param max_results: 每个问题返回的结果个数
+        :param max_chars: 摘要最大字符数, 写入缓存前截断, 为空时不截断
+        :param cache: 搜索结果缓存, 为空时不缓存
+        """
+        self.__max_results = max_results
+        self.__max_chars = max_chars
+        self.__cache = cache
+        self.__lock = threading.Lock()
+        self.__in_flight: dict[tuple[str, int], Future] = {}
+        self.__coalesced = 0
+
+    @property
+    def cache(self) -> WebSearchCache | None:
+        return self.__cache
+
+    @property
+    def coalesced(self) -> int:
+        """
+        合并到进行中请求的搜索次数
+        """
+        return self.__coalesced
+
+    @abstractmethod
+    def fetch(self, query: str, max_results: int) -> list[dict]:
+        """
+        请求搜索源
+        :param query: 搜索问题
+        :param max_results: 返回结果个数
+        :return: [{'title': 标题, 'url': 网页地址, 'content': 摘要}]
+        """
+
+    def search(self, query: str, max_results: int | None = None) -> list[dict]:
+        """
+        网页搜索(优先读取缓存)
+        :param query: 搜索问题
+        :param max_results: 返回结果个数, 为空时使用初始化配置
+        :return: [{'title': 标题, 'url': 网页地址, 'content': 摘要}]
+        """
+        max_results = max_results if max_results else self.__max_results
+        if self.__cache:
+            results = self.__cache.get(self.name, query, max_results)
+            if results is not None: return results
+
+        key = (WebSearchCache.normalize_query(query), max_results)
+        with self.__lock:
+            future = self.__in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self.__in_flight[key] = Future()
+            else:
+                self.__coalesced += 1
+
+        if not is_leader:
+            return [dict(item) for item in future.result()]
+
+        try:
+            results = self.fetch(query, max_results)
+            if self.__max_chars:
+                results = [{**item, 'content': item.get('content', '')[:self.__max_chars]} for item in results]
+            if self.__cache: self.__cache.put(self.name, query, max_results, results)
+            future.set_result(results)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.__lock:
+                self.__in_flight.pop(key, None)
+
+        return results
+
+    def close(self):
+        if self.__cache:
+            self.__cache.close()
@@ -0,0 +1,153 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Hashable, Iterable
+
+# 中日韩字符按单字分词, 英文/数字按单词分词, 标识符额外按下划线和驼峰拆分为子词
+BM25_TOKEN_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]|[A-Za-z0-9_]+')
+CAMEL_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    BM25 分词(小写), 如: getUserName -> [getusername, get, user, name]
+    :param text:
+    :return:
+    """
+    tokens = []
+    for token in BM25_TOKEN_PATTERN.findall(text):
+        tokens.append(token.lower())
+        if len(token) == 1 or not token.isascii(): continue
+
+        sub_tokens = [sub_token.lower() for part in token.split('_') for sub_token in CAMEL_PATTERN.findall(part)]
+        if len(sub_tokens) > 1: tokens.extend(sub_tokens)
+    return tokens
+
+
+def bm25_score(tf: int, df: int, doc_count: int, doc_length: int, avg_length: float, k1: float = 1.2, b: float = 0.75) -> float:
+    """
+    单个词的 BM25 分数
+    :param tf: 词在文档中的词频
+    :param df: 包含该词的文档数
+    :param doc_count: 文档总数
+    :param doc_length: 文档分词数
+    :param avg_length: 平均文档分词数
+    :param k1: 词频饱和参数
+    :param b: 文档长度归一化参数
+    :return:
+    """
+    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * doc_length / avg_length) if avg_length else k1
+    return idf * tf * (k1 + 1) / (tf + norm)
+
+
+def min_max_normalize(scores: dict[Hashable, float]) -> dict[Hashable, float]:
+    """
+    分数归一化到 [0, 1](所有分数相同时均为 1), 用于混合检索分数融合
+    :param scores:
+    :return:
+    """
+    if not scores: return {}
+    min_score, max_score = min(scores.values()), max(scores.values())
+    if max_score == min_score: return {key: 1.0 for key in scores}
+    return {key: (score - min_score) / (max_score - min_score) for key, score in scores.items()}
+
+
+def fuse_scores(vector_scores: dict[Hashable, float], keyword_scores: dict[Hashable, float], alpha: float) -> dict[Hashable, float]:
+    """
+    混合检索分数融合(与 weaviate relativeScoreFusion 一致): 两路结果分别归一化后按 alpha 加权求和
+    :param vector_scores: 向量检索分数
+    :param keyword_scores: 关键字检索分数
+    :param alpha: 向量分数比重, 范围: [0,1]
+    :return:
+    """
+    vector_scores, keyword_scores = min_max_normalize(vector_scores), min_max_normalize(keyword_scores)
+    return {
+        key: alpha * vector_scores.get(key, 0.0) + (1 - alpha) * keyword_scores.get(key, 0.0)
+        for key in vector_scores.keys() | keyword_scores.keys()
+    }
+
+
+class BM25Index:
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        内存 BM25 倒排索引
+        :param k1: 词频饱和参数
+        :param b: 文档长度归一化参数
+        """
+        self.__k1 = k1
+        self.__b = b
+        self.__postings: dict[str, dict[Hashable, int]] = {}
+        self.__lengths: dict[Hashable, int] = {}
+        self.__doc_terms: dict[Hashable, list[str]] = {}
+        self.__total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.__lengths)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.__lengths
+
+    def add(self, key: Hashable, text: str):
+        """
+        添加文档(键已存在时覆盖)
+        :param key: 文档键
+        :param text: 文档文本
+        :return:
+        """
+        if key in self.__lengths: self.remove(key)
+
+        tokens = tokenize(text)
+        term_counts = Counter(tokens)
+        for term, tf in term_counts.items():
+            self.__postings.setdefault(term, {})[key] = tf
+        self.__doc_terms[key] = list(term_counts)
+        self.__lengths[key] = len(tokens)
+        self.__total_length += len(tokens)
+
+    def add_many(self, items: Iterable[tuple[Hashable, str]]):
+        for key, text in items:
+            self.add(key, text)
+
+    def remove(self, key: Hashable):
+        length = self.__lengths.pop(key, None)
+        if length is None: return
+
+        self.__total_length -= length
+        for term in self.__doc_terms.pop(key):
+            del self.__postings[term][key]
+            if not self.__postings[term]: del self.__postings[term]
+
+    def scores(self, query: str, keys: set | None = None) -> dict[Hashable, float]:
+        """
+        计算包含查询词的文档的 BM25 分数
+        :param query: 查询文本
+        :param keys: 只计算这些键的分数, 为空时计算所有文档
+        :return: {文档键: 分数}
+        """
+        doc_count = len(self.__lengths)
+        if not doc_count: return {}
+
+        avg_length = self.__total_length / doc_count
+        scores: dict[Hashable, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.__postings.get(term)
+            if not postings: continue
+
+            df = len(postings)
+            for key, tf in postings.items():
+                if keys is not None and key not in keys: continue
+                scores[key] = scores.get(key, 0.0) + bm25_score(tf, df, doc_count, self.__lengths[key], avg_length, self.__k1, self.__b)
+        return scores
+
+    def search(self, query: str, k: int = 5, keys: set | None = None) -> list[tuple[Hashable, float]]:
+        """
+        BM25 检索
+        :param query: 查询文本
+        :param k: 返回结果个数
+        :param keys: 只检索这些键
+        :return: 按分数降序的 [(文档键, 分数)]
+        """
+        return heapq.nlargest(k, self.scores(query, keys=keys).items(), key=lambda item: item[1])
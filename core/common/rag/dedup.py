@@ -0,0 +1,246 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+from langchain_core.documents import Document
+
+# MinHash 哈希函数 (a * x + b) % MINHASH_PRIME, 32 位哈希值运算不会溢出 uint64
+MINHASH_PRIME = np.uint64(4294967291)
+MINHASH_SEED = 20240601
+SHINGLE_PATTERN = re.compile(r'\w+')
+
+
+class ChunkDedup:
+
+    def __init__(
+        self,
+        db_path: str | None = None,
+        threshold: float = 0.85,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle_size: int = 3,
+        min_tokens: int = 20,
+        commit_size: int = 256
+    ):
+        """
+        切片去重: 按切片文本哈希精确去重, 按 MinHash + LSH 分桶检测近似重复切片, 去重范围为同一工作区(索引名 + 租户);
+        去重索引持久化到 sqlite, 记录被跳过的切片及其重复的切片 uuid
+        :param db_path: sqlite 索引文件地址, 默认 ../data/dedup.db
+        :param threshold: 近似重复阈值(MinHash 估计的 Jaccard 相似度)
+        :param num_perm: MinHash 签名长度
+        :param bands: LSH 分桶数(num_perm 必须能被 bands 整除), 分桶越多召回越高
+        :param shingle_size: 分词 n-gram 长度
+        :param min_tokens: 近似去重的最小分词数, 低于该值的切片只做精确去重
+        :param commit_size: 累计写入多少条后提交
+        """
+        if num_perm % bands != 0:
+            raise ValueError('num_perm 必须能被 bands 整除')
+
+        project_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+        self.__db_path = db_path if db_path else os.path.join(project_path, 'data', 'dedup.db')
+        self.__threshold = threshold
+        self.__num_perm = num_perm
+        self.__bands = bands
+        self.__rows = num_perm // bands
+        self.__shingle_size = max(shingle_size, 1)
+        self.__min_tokens = min_tokens
+        self.__commit_size = commit_size
+        self.__uncommitted = 0
+        self.__lock = threading.Lock()
+
+        # 哈希参数固定随机种子, 保证持久化的签名在不同进程间可比较
+        random_state = np.random.RandomState(MINHASH_SEED)
+        self.__perm_a = random_state.randint(1, int(MINHASH_PRIME), size=num_perm, dtype=np.uint64)
+        self.__perm_b = random_state.randint(0, int(MINHASH_PRIME), size=num_perm, dtype=np.uint64)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.__db_path)), exist_ok=True)
+        self.__conn = sqlite3.connect(self.__db_path, check_same_thread=False)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        self.__conn.execute(
+            'CREATE TABLE IF NOT EXISTS dedup_chunk ('
+            'scope TEXT NOT NULL, uuid TEXT NOT NULL, content_hash TEXT NOT NULL, signature BLOB, '
+            'source TEXT, PRIMARY KEY (scope, uuid))'
+        )
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_dedup_chunk_hash ON dedup_chunk (scope, content_hash)')
+        self.__conn.execute('CREATE TABLE IF NOT EXISTS dedup_band (scope TEXT NOT NULL, band_key TEXT NOT NULL, uuid TEXT NOT NULL)')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_dedup_band_key ON dedup_band (scope, band_key)')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_dedup_band_uuid ON dedup_band (scope, uuid)')
+        self.__conn.execute(
+            'CREATE TABLE IF NOT EXISTS dedup_skip ('
+            'scope TEXT NOT NULL, uuid TEXT NOT NULL, source TEXT, duplicate_of TEXT NOT NULL, '
+            'similarity REAL NOT NULL, PRIMARY KEY (scope, uuid))'
+        )
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_dedup_skip_of ON dedup_skip (scope, duplicate_of)')
+        self.__conn.commit()
+
+    @property
+    def threshold(self) -> float:
+        return self.__threshold
+
+    @staticmethod
+    def scope(index_name: str, tenant: str | None = None) -> str:
+        return index_name if not tenant else f'{index_name}.{tenant}'
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.strip().encode('utf-8')).hexdigest()
+
+    def signature(self, text: str) -> np.ndarray | None:
+        """
+        计算切片 MinHash 签名, 分词数少于 min_tokens 时返回 None
+        :param text: 切片文本
+        :return:
+        """
+        tokens = SHINGLE_PATTERN.findall(text.lower())
+        if len(tokens) < max(self.__min_tokens, 1): return None
+
+        size = min(self.__shingle_size, len(tokens))
+        shingles = {zlib.crc32(' '.join(tokens[index: index + size]).encode('utf-8')) for index in range(len(tokens) - size + 1)}
+        hash_values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        return ((hash_values[:, None] * self.__perm_a + self.__perm_b) % MINHASH_PRIME).min(axis=0).astype(np.uint32)
+
+    def __band_keys(self, signature: np.ndarray) -> list[str]:
+        return [
+            f'{band}:{hashlib.md5(signature[band * self.__rows: (band + 1) * self.__rows].tobytes()).hexdigest()[:16]}'
+            for band in range(self.__bands)
+        ]
+
+    def check(self, index_name: str, split_doc: Document, tenant: str | None = None) -> tuple[str, float] | None:
+        """
+        检查切片是否与工作区内已有切片重复, 不重复时加入去重索引, 重复时记录跳过的切片
+        :param index_name: 索引名
+        :param split_doc: 切片(id 为空时无法记录, 需先设置 id)
+        :param tenant: 租户名
+        :return: 重复时返回 (重复的切片 uuid, 相似度), 不重复返回 None
+        """
+        scope = self.scope(index_name, tenant)
+        source = str(split_doc.metadata.get('source', ''))
+        content_hash = self.content_hash(split_doc.page_content)
+        signature = self.signature(split_doc.page_content)
+        band_keys = self.__band_keys(signature) if signature is not None else []
+
+        with self.__lock:
+            duplicate = self.__find_duplicate(scope, split_doc.id, content_hash, signature, band_keys)
+            if duplicate:
+                self.__conn.execute('DELETE FROM dedup_chunk WHERE scope = ? AND uuid = ?', [scope, split_doc.id])
+                self.__conn.execute('DELETE FROM dedup_band WHERE scope = ? AND uuid = ?', [scope, split_doc.id])
+                self.__conn.execute(
+                    'INSERT OR REPLACE INTO dedup_skip (scope, uuid, source, duplicate_of, similarity) VALUES (?, ?, ?, ?, ?)',
+                    [scope, split_doc.id, source, duplicate[0], duplicate[1]]
+                )
+            else:
+                self.__conn.execute(
+                    'INSERT OR REPLACE INTO dedup_chunk (scope, uuid, content_hash, signature, source) VALUES (?, ?, ?, ?, ?)',
+                    [scope, split_doc.id, content_hash, signature.tobytes() if signature is not None else None, source]
+                )
+                self.__conn.execute('DELETE FROM dedup_skip WHERE scope = ? AND uuid = ?', [scope, split_doc.id])
+                self.__conn.execute('DELETE FROM dedup_band WHERE scope = ? AND uuid = ?', [scope, split_doc.id])
+                self.__conn.executemany(
+                    'INSERT INTO dedup_band (scope, band_key, uuid) VALUES (?, ?, ?)',
+                    [(scope, band_key, split_doc.id) for band_key in band_keys]
+                )
+
+            self.__uncommitted += 1
+            if self.__uncommitted >= self.__commit_size:
+                self.__conn.commit()
+                self.__uncommitted = 0
+
+        return duplicate
+
+    def __find_duplicate(
+        self,
+        scope: str,
+        chunk_uuid: str,
+        content_hash: str,
+        signature: np.ndarray | None,
+        band_keys: list[str]
+    ) -> tuple[str, float] | None:
+        row = self.__conn.execute(
+            'SELECT uuid FROM dedup_chunk WHERE scope = ? AND content_hash = ? AND uuid != ? LIMIT 1',
+            [scope, content_hash, chunk_uuid]
+        ).fetchone()
+        if row: return row[0], 1.0
+        if signature is None: return None
+
+        # LSH 候选: 任一分桶相同的切片, 再按签名估计相似度
+        rows = self.__conn.execute(
+            f'SELECT DISTINCT c.uuid, c.signature FROM dedup_band b JOIN dedup_chunk c ON c.scope = b.scope AND c.uuid = b.uuid '
+            f'WHERE b.scope = ? AND b.band_key IN ({", ".join("?" * len(band_keys))}) AND b.uuid != ?',
+            [scope, *band_keys, chunk_uuid]
+        ).fetchall()
+
+        best = None
+        for candidate_uuid, candidate_signature in rows:
+            if not candidate_signature: continue
+            similarity = float(np.mean(np.frombuffer(candidate_signature, dtype=np.uint32) == signature))
+            if similarity >= self.__threshold and (best is None or similarity > best[1]):
+                best = candidate_uuid, similarity
+        return best
+
+    def remove(self, index_name: str, uuids: list[str], tenant: str | None = None) -> dict[str, list[str]]:
+        """
+        从去重索引删除切片; 被删除切片的重复切片失去保留副本, 需要重新写入
+        :param index_name: 索引名
+        :param uuids: 删除的切片 uuid 列表
+        :param tenant: 租户名
+        :return: 需要重新写入的切片 {文件地址: [切片 uuid]}
+        """
+        scope = self.scope(index_name, tenant)
+        orphans: dict[str, list[str]] = {}
+        removed = set(uuids)
+
+        with self.__lock:
+            for index in range(0, len(uuids), 500):
+                batch = uuids[index: index + 500]
+                placeholders = ', '.join('?' * len(batch))
+                for table in ['dedup_chunk', 'dedup_band', 'dedup_skip']:
+                    self.__conn.execute(f'DELETE FROM {table} WHERE scope = ? AND uuid IN ({placeholders})', [scope, *batch])
+
+                rows = self.__conn.execute(
+                    f'SELECT uuid, source FROM dedup_skip WHERE scope = ? AND duplicate_of IN ({placeholders})',
+                    [scope, *batch]
+                ).fetchall()
+                for chunk_uuid, source in rows:
+                    if chunk_uuid not in removed: orphans.setdefault(source, []).append(chunk_uuid)
+                self.__conn.execute(f'DELETE FROM dedup_skip WHERE scope = ? AND duplicate_of IN ({placeholders})', [scope, *batch])
+
+            self.__conn.commit()
+            self.__uncommitted = 0
+
+        return orphans
+
+    def skipped(self, index_name: str, tenant: str | None = None) -> list[dict]:
+        """
+        工作区内被跳过的重复切片
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :return: [{'uuid': 切片 uuid, 'source': 文件地址, 'duplicate_of': 重复的切片 uuid, 'similarity': 相似度}]
+        """
+        with self.__lock:
+            rows = self.__conn.execute(
+                'SELECT uuid, source, duplicate_of, similarity FROM dedup_skip WHERE scope = ?',
+                [self.scope(index_name, tenant)]
+            ).fetchall()
+        return [{'uuid': row[0], 'source': row[1], 'duplicate_of': row[2], 'similarity': row[3]} for row in rows]
+
+    def clear(self, index_name: str, tenant: str | None = None):
+        scope = self.scope(index_name, tenant)
+        with self.__lock:
+            for table in ['dedup_chunk', 'dedup_band', 'dedup_skip']:
+                self.__conn.execute(f'DELETE FROM {table} WHERE scope = ?', [scope])
+            self.__conn.commit()
+            self.__uncommitted = 0
+
+    def commit(self):
+        with self.__lock:
+            self.__conn.commit()
+            self.__uncommitted = 0
+
+    def close(self):
+        with self.__lock:
+            self.__conn.commit()
+            self.__conn.close()
@@ -5,12 +5,22 @@ from xinference.client.restful.restful_client import RESTfulEmbeddingModelHandle
 from xinference.types import Embedding
 
 from langchain_community.embeddings import XinferenceEmbeddings
+from langchain_core.embeddings import Embeddings
 
-class EmbeddingClient:
+from core.common.rag.embedding_cache import EmbeddingCache
 
-    def __init__(self, base_url: str, model_uid: str):
+class EmbeddingClient(Embeddings):
+
+    def __init__(self, base_url: str, model_uid: str, cache: EmbeddingCache | None = None):
+        """
+
+        :param base_url: xinference 服务地址
+        :param model_uid: 嵌入模型 uid
+        :param cache: 向量缓存, 不为空时仅对未命中缓存的切片请求嵌入模型
+        """
         self.__base_url = base_url
         self.__model_uid = model_uid
+        self.__cache = cache
 
         self.__xinference_embeddings = XinferenceEmbeddings(server_url=self.__base_url, model_uid=self.__model_uid)
         self.__client: Client = self.__xinference_embeddings.client
@@ -20,6 +30,42 @@ class EmbeddingClient:
     def xinference_embeddings(self) -> XinferenceEmbeddings:
         return self.__xinference_embeddings
 
+    @property
+    def model_uid(self) -> str:
+        return self.__model_uid
+
+    @property
+    def cache(self) -> EmbeddingCache | None:
+        return self.__cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量向量化文本, 整个批次只请求一次嵌入模型(XinferenceEmbeddings.embed_documents 为逐条请求)
+        :param texts: 需要向量化的文本列表
+        :return: 与 texts 顺序一致的向量列表
+        """
+        if not texts: return []
+        if not self.__cache: return self.__embed_documents(texts)
+
+        vectors = self.__cache.get_many(self.__model_uid, texts)
+        miss_texts = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if not miss_texts: return vectors
+
+        miss_vector_map = dict(zip(miss_texts, self.__embed_documents(miss_texts)))
+        self.__cache.put_many(self.__model_uid, list(miss_vector_map.keys()), list(miss_vector_map.values()))
+
+        return [vector if vector is not None else miss_vector_map[text] for text, vector in zip(texts, vectors)]
+
+    def __embed_documents(self, texts: List[str]) -> List[List[float]]:
+
+        embedding_result = self.create_embedding(input=texts)
+        embedding_datas = sorted(embedding_result.get('data', []), key=lambda item: item.get('index', 0))
+        return [list(map(float, item.get('embedding', []))) for item in embedding_datas]
+
+    def embed_query(self, text: str) -> List[float]:
+        embeddings = self.embed_documents([text])
+        return embeddings[0] if embeddings else []
+
     def create_embedding(self, input: Union[str, List[str]], **kwargs) -> "Embedding":
         return self.__model.create_embedding(input=input, **kwargs)
 
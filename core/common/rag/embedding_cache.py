@@ -0,0 +1,152 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+
+class EmbeddingCache:
+
+    def __init__(self, db_path: str | None = None, max_size_mb: int = 2048):
+        """
+        本地持久化向量缓存, 以 (model_uid, 切片文本 sha256) 为键, 超出容量时按最近访问时间淘汰
+        :param db_path: sqlite 缓存文件地址, 默认 ../data/embedding_cache.db
+        :param max_size_mb: 缓存向量最大占用空间(单位: MB)
+        """
+        project_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+        self.__db_path = db_path if db_path else os.path.join(project_path, 'data', 'embedding_cache.db')
+        self.__max_size = max_size_mb * 1024 * 1024
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.__db_path)), exist_ok=True)
+        self.__conn = sqlite3.connect(self.__db_path, check_same_thread=False)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        self.__conn.execute(
+            'CREATE TABLE IF NOT EXISTS embedding ('
+            'model_uid TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, '
+            'size INTEGER NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (model_uid, text_hash))'
+        )
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_embedding_last_access ON embedding (last_access)')
+        self.__conn.commit()
+        self.__total_size = self.__conn.execute('SELECT COALESCE(SUM(size), 0) FROM embedding').fetchone()[0]
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    @property
+    def total_size(self) -> int:
+        return self.__total_size
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model_uid: str, texts: list[str]) -> list[list[float] | None]:
+        """
+        批量读取缓存向量
+        :param model_uid: 嵌入模型 uid
+        :param texts: 切片文本列表
+        :return: 与 texts 顺序一致的向量列表, 未命中的位置为 None
+        """
+        text_hashes = [self.text_hash(text) for text in texts]
+        vector_map = {}
+
+        with self.__lock:
+            # sqlite 单条语句变量数有上限, 分段查询
+            for index in range(0, len(text_hashes), 500):
+                hash_slice = list(set(text_hashes[index: index + 500]))
+                rows = self.__conn.execute(
+                    f'SELECT text_hash, vector FROM embedding WHERE model_uid = ? '
+                    f'AND text_hash IN ({",".join("?" * len(hash_slice))})',
+                    [model_uid, *hash_slice]
+                ).fetchall()
+                vector_map.update({text_hash: vector for text_hash, vector in rows})
+
+            if vector_map:
+                now = time.time()
+                self.__conn.executemany(
+                    'UPDATE embedding SET last_access = ? WHERE model_uid = ? AND text_hash = ?',
+                    [(now, model_uid, text_hash) for text_hash in vector_map]
+                )
+                self.__conn.commit()
+
+        vectors = []
+        for text_hash in text_hashes:
+            vector = vector_map.get(text_hash)
+            if vector is None:
+                self.__misses += 1
+                vectors.append(None)
+            else:
+                self.__hits += 1
+                vectors.append(array('f', vector).tolist())
+
+        return vectors
+
+    def put_many(self, model_uid: str, texts: list[str], vectors: list[list[float]]):
+        """
+        批量写入缓存向量, 超出容量时淘汰最久未访问的向量
+        :param model_uid: 嵌入模型 uid
+        :param texts: 切片文本列表
+        :param vectors: 与 texts 顺序一致的向量列表
+        :return:
+        """
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            text_hash = self.text_hash(text)
+            vector_bytes = array('f', vector).tobytes()
+            rows[text_hash] = (model_uid, text_hash, vector_bytes, len(vector_bytes), now)
+
+        text_hashes = list(rows.keys())
+        with self.__lock:
+            for index in range(0, len(text_hashes), 500):
+                hash_slice = text_hashes[index: index + 500]
+                replaced_size = self.__conn.execute(
+                    f'SELECT COALESCE(SUM(size), 0) FROM embedding WHERE model_uid = ? '
+                    f'AND text_hash IN ({",".join("?" * len(hash_slice))})',
+                    [model_uid, *hash_slice]
+                ).fetchone()[0]
+                self.__total_size -= replaced_size
+
+            self.__conn.executemany('INSERT OR REPLACE INTO embedding VALUES (?, ?, ?, ?, ?)', list(rows.values()))
+            self.__total_size += sum(row[3] for row in rows.values())
+
+            if self.__total_size > self.__max_size: self.__evict()
+            self.__conn.commit()
+
+    def __evict(self):
+        """
+        淘汰最久未访问的向量, 直到占用空间低于最大容量的 90%
+        :return:
+        """
+        target_size = self.__max_size * 0.9
+        while self.__total_size > target_size:
+            rows = self.__conn.execute(
+                'SELECT model_uid, text_hash, size FROM embedding ORDER BY last_access LIMIT 1000'
+            ).fetchall()
+            if not rows: break
+
+            evict_rows = []
+            for model_uid, text_hash, size in rows:
+                evict_rows.append((model_uid, text_hash))
+                self.__total_size -= size
+                if self.__total_size <= target_size: break
+
+            self.__conn.executemany('DELETE FROM embedding WHERE model_uid = ? AND text_hash = ?', evict_rows)
+
+    def clear(self):
+        with self.__lock:
+            self.__conn.execute('DELETE FROM embedding')
+            self.__conn.commit()
+            self.__total_size = 0
+
+    def close(self):
+        self.__conn.close()
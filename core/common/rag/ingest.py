@@ -0,0 +1,322 @@
+import logging
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Iterable, Iterator, Union
+
+from langchain_core.documents import Document
+from pydantic import BaseModel, Field
+
+from common.error.load import UnLoadableError
+from common.file.file_walker import FileWalker
+from common.logger.logging import Logger
+from core.common.rag.dedup import ChunkDedup
+from core.common.rag.base_vector_store import BaseVectorStore
+
+logger = Logger.get_instance(__file__)
+
+
+class IngestReport(BaseModel):
+    files: int = Field(default=0, description='写入文件数')
+    failed_files: dict[str, str] = Field(default_factory=dict, description='写入失败文件 {文件地址: 失败原因}')
+    chunks: int = Field(default=0, description='写入切片数')
+    batches: int = Field(default=0, description='嵌入批次数')
+    failed_chunks: int = Field(default=0, description='写入失败切片数')
+    failed_uuids: dict[str, list[str]] = Field(default_factory=dict, description='写入失败的切片 {文件地址: [切片 uuid]}')
+    exact_duplicates: int = Field(default=0, description='跳过的完全重复切片数')
+    near_duplicates: int = Field(default=0, description='跳过的近似重复切片数')
+    skipped_chunks: dict[str, int] = Field(default_factory=dict, description='跳过的重复切片 {文件地址: 切片数}')
+    stage_times: dict[str, float] = Field(
+        default_factory=lambda: {'load_split': 0.0, 'embed': 0.0, 'insert': 0.0},
+        description='各阶段耗时(单位: s), embed 为各批次请求耗时累加'
+    )
+    total_time: float = Field(default=0.0, description='总耗时(单位: s)')
+
+    @property
+    def throughput(self) -> float:
+        """
+        吞吐量(单位: 切片/s)
+        """
+        return self.chunks / self.total_time if self.total_time else 0.0
+
+
+class IngestPipeline:
+
+    def __init__(
+        self,
+        vector_store: BaseVectorStore,
+        chunk_size: int = 200,
+        chunk_overlap: int = 20,
+        embed_batch_size: int = 64,
+        embed_concurrency: int = 4,
+        file_walker: FileWalker | None = None,
+        code_max_tokens: int = 512,
+        tokenizer: str | None = None,
+        deduplicator: ChunkDedup | None = None
+    ):
+        """
+        知识库流式写入流程: 文件懒加载 -> 切片 -> 去重 -> 按批次并发请求嵌入模型 -> weaviate gRPC 批量写入
+        :param vector_store: 向量数据库
+        :param chunk_size: 切片大小
+        :param chunk_overlap: 切片重合度
+        :param embed_batch_size: 单次请求嵌入模型的切片数
+        :param embed_concurrency: 同时请求嵌入模型的批次数(内存中最多保留 2 倍该值的批次)
+        :param file_walker: 文件遍历(排除规则/大小过滤), 默认排除 .git、node_modules、venv 等目录及 .gitignore 排除的文件
+        :param code_max_tokens: python 代码按函数/类切片的最大 token 数
+        :param tokenizer: 嵌入模型 tokenizer 名称或 tokenizer.json 地址(需安装 tokenizers), 为空时使用近似 token 计数
+        :param deduplicator: 切片去重(精确 + 近似重复), 为空时不去重
+        """
+        if embed_batch_size < 1 or embed_concurrency < 1:
+            raise ValueError('embed_batch_size 和 embed_concurrency 必须大于0')
+
+        self.__vector_store = vector_store
+        self.__chunk_size = chunk_size
+        self.__chunk_overlap = chunk_overlap
+        self.__embed_batch_size = embed_batch_size
+        self.__embed_concurrency = embed_concurrency
+        self.__file_walker = file_walker if file_walker else FileWalker()
+        self.__code_max_tokens = code_max_tokens
+        self.__tokenizer = tokenizer
+        self.__deduplicator = deduplicator
+
+    @property
+    def vector_store(self) -> BaseVectorStore:
+        return self.__vector_store
+
+    @property
+    def file_walker(self) -> FileWalker:
+        return self.__file_walker
+
+    @property
+    def deduplicator(self) -> ChunkDedup | None:
+        return self.__deduplicator
+
+    def iter_chunks(self, file_paths: Iterable[Union[str, Path]], report: IngestReport) -> Iterator[Document]:
+        """
+        [懒加载]迭代输出文件/文件夹下所有文件的切片
+        :param file_paths: 文件/文件夹地址列表
+        :param report: 写入报告(记录文件数和失败文件)
+        :return:
+        """
+        for file_path in file_paths:
+            for file_info in self.__file_walker.iter_files(file_path):
+                yield from self.iter_file_chunks(
+                    file_path=file_info.get('file_path', ''),
+                    file_type=file_info.get('file_type', 'txt'),
+                    report=report
+                )
+
+    def iter_file_chunks(self, file_path: Union[str, Path], file_type: str, report: IngestReport) -> Iterator[Document]:
+        """
+        [懒加载]迭代输出单个文件的切片, 不可上传的文件记录到写入报告
+        :param file_path: 文件地址
+        :param file_type: 文件类型
+        :param report: 写入报告
+        :return:
+        """
+        try:
+            yield from self.__vector_store.lazy_load_file(
+                file_path=file_path,
+                file_type=file_type,
+                chunk_size=self.__chunk_size,
+                chunk_overlap=self.__chunk_overlap,
+                max_tokens=self.__code_max_tokens,
+                tokenizer=self.__tokenizer
+            )
+            report.files += 1
+        except UnLoadableError as e:
+            report.failed_files[str(file_path)] = str(e)
+            logger.warning(f'* 文件: {file_path} 出现异常: {str(e)}', extra={'file_path': str(file_path)})
+
+    def run(self, file_paths: Iterable[Union[str, Path]], index_name: str, tenant: str | None = None) -> IngestReport:
+        """
+        加载文件并写入向量数据库
+        :param file_paths: 文件/文件夹地址列表
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :return: 写入报告
+        """
+        report = IngestReport()
+        return self.write(split_docs=self.iter_chunks(file_paths, report=report), index_name=index_name, tenant=tenant, report=report)
+
+    def write(
+        self,
+        split_docs: Iterable[Document],
+        index_name: str,
+        tenant: str | None = None,
+        report: IngestReport | None = None
+    ) -> IngestReport:
+        """
+        切片按批次并发向量化后写入向量数据库
+        :param split_docs: 切片迭代器
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :param report: 写入报告, 为空时新建
+        :return: 写入报告
+        """
+        report = report if report else IngestReport()
+        s_time = time.time()
+        self.__vector_store.get_store(index_name=index_name, tenant=tenant)
+        # 去重状态: 已加入去重索引但尚未确认写入的切片 uuid, 重复切片 {保留副本 uuid: {切片 uuid: (切片, 相似度)}}(保留副本尚未确认写入),
+        # 保留副本写入失败需要重新写入的切片
+        dedup_state = {'unconfirmed': set(), 'skipped': {}, 'requeue': []}
+        insert_kwargs = {'index_name': index_name, 'tenant': tenant, 'report': report, 's_time': s_time, 'dedup_state': dedup_state}
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.__embed_concurrency) as executor:
+                while split_docs:
+                    if self.__deduplicator:
+                        split_docs = self.__iter_unique(split_docs, index_name=index_name, tenant=tenant, report=report, dedup_state=dedup_state)
+
+                    pending: deque[tuple[list[Document], Future]] = deque()
+                    for batch_docs in self.__iter_batches(split_docs, report=report):
+                        pending.append((batch_docs, executor.submit(self.__embed_batch, batch_docs)))
+
+                        # 限制在途批次数, 防止加载速度大于嵌入速度时切片堆积在内存
+                        if len(pending) >= self.__embed_concurrency * 2:
+                            self.__insert_batch(*pending.popleft(), **insert_kwargs)
+
+                    while pending:
+                        self.__insert_batch(*pending.popleft(), **insert_kwargs)
+
+                    # 写入失败切片的重复切片重新去重后写入
+                    split_docs, dedup_state['requeue'] = dedup_state['requeue'], []
+        except BaseException:
+            # 写入中断时回滚未确认写入的去重索引, 避免切片被误判为重复而跳过
+            if self.__deduplicator and dedup_state['unconfirmed']:
+                self.__deduplicator.remove(index_name=index_name, uuids=list(dedup_state['unconfirmed']), tenant=tenant)
+            raise
+
+        if self.__deduplicator: self.__deduplicator.commit()
+        report.total_time = time.time() - s_time
+        logger.info(
+            f'* 写入完成: 文件【{report.files}】, 切片【{report.chunks}】, 失败切片【{report.failed_chunks}】, '
+            f'吞吐量【{round(report.throughput, 2)} 切片/s】, '
+            f'阶段耗时【{", ".join(f"{k}: {round(v, 3)}(s)" for k, v in report.stage_times.items())}】',
+            extra={'index_name': index_name, 'files': report.files, 'chunks': report.chunks, 'failed_chunks': report.failed_chunks}
+        )
+
+        return report
+
+    def __iter_unique(
+        self,
+        split_docs: Iterable[Document],
+        index_name: str,
+        tenant: str | None,
+        report: IngestReport,
+        dedup_state: dict
+    ) -> Iterator[Document]:
+        """
+        [懒加载]跳过与工作区内已有切片重复的切片, 并记录到写入报告
+        :param split_docs:
+        :param index_name:
+        :param tenant:
+        :param report:
+        :param dedup_state: 去重状态, 记录未确认写入的切片 uuid 和被跳过的切片(保留副本写入失败时重新写入)
+        :return:
+        """
+        for split_doc in split_docs:
+            # 去重索引以切片 id 为键, 未指定 id 的切片生成 uuid 作为写入 uuid
+            if not split_doc.id: split_doc.id = str(uuid.uuid4())
+
+            duplicate = self.__deduplicator.check(index_name=index_name, split_doc=split_doc, tenant=tenant)
+            if not duplicate:
+                dedup_state['unconfirmed'].add(split_doc.id)
+                yield split_doc
+                continue
+
+            # 保留副本尚未确认写入时暂存切片, 写入失败时重新写入
+            if duplicate[0] in dedup_state['unconfirmed']:
+                dedup_state['skipped'].setdefault(duplicate[0], {})[split_doc.id] = split_doc, duplicate[1]
+            self.__count_skipped(split_doc, similarity=duplicate[1], report=report, count=1)
+
+    @staticmethod
+    def __count_skipped(split_doc: Document, similarity: float, report: IngestReport, count: int):
+        source = str(split_doc.metadata.get('source', ''))
+        report.skipped_chunks[source] = report.skipped_chunks.get(source, 0) + count
+        if not report.skipped_chunks[source]: report.skipped_chunks.pop(source)
+        if similarity >= 1.0:
+            report.exact_duplicates += count
+        else:
+            report.near_duplicates += count
+
+    def __iter_batches(self, split_docs: Iterable[Document], report: IngestReport) -> Iterator[list[Document]]:
+        """
+        按 embed_batch_size 分组切片, 并统计加载切片耗时
+        :param split_docs:
+        :param report:
+        :return:
+        """
+        batch_docs = []
+        s_time = time.time()
+
+        for split_doc in split_docs:
+            batch_docs.append(split_doc)
+            if len(batch_docs) < self.__embed_batch_size: continue
+
+            report.stage_times['load_split'] += time.time() - s_time
+            yield batch_docs
+            batch_docs = []
+            s_time = time.time()
+
+        report.stage_times['load_split'] += time.time() - s_time
+        if batch_docs: yield batch_docs
+
+    def __embed_batch(self, batch_docs: list[Document]) -> tuple[list[list[float]], float]:
+        s_time = time.time()
+        vectors = self.__vector_store.embedding_client.embed_documents([doc.page_content for doc in batch_docs])
+        return vectors, time.time() - s_time
+
+    def __insert_batch(
+        self,
+        batch_docs: list[Document],
+        future: Future,
+        index_name: str,
+        tenant: str | None,
+        report: IngestReport,
+        s_time: float,
+        dedup_state: dict
+    ):
+        vectors, embed_time = future.result()
+        report.stage_times['embed'] += embed_time
+
+        insert_time = time.time()
+        failed_chunks = self.__vector_store.insert_vectors(
+            split_docs=batch_docs,
+            vectors=vectors,
+            index_name=index_name,
+            tenant=tenant
+        )
+        report.stage_times['insert'] += time.time() - insert_time
+
+        # 写入失败的切片不作为去重保留副本, 其重复切片重新写入
+        failed_uuids = [batch_docs[index].id for index in failed_chunks]
+        for index in failed_chunks:
+            source = str(batch_docs[index].metadata.get('source', ''))
+            report.failed_uuids.setdefault(source, []).append(batch_docs[index].id)
+        if self.__deduplicator and failed_uuids:
+            orphans = self.__deduplicator.remove(index_name=index_name, uuids=failed_uuids, tenant=tenant)
+            orphan_uuids = {orphan_uuid for uuids in orphans.values() for orphan_uuid in uuids}
+            for failed_uuid in failed_uuids:
+                for chunk_uuid, (split_doc, similarity) in dedup_state['skipped'].pop(failed_uuid, {}).items():
+                    if chunk_uuid not in orphan_uuids: continue
+                    self.__count_skipped(split_doc, similarity=similarity, report=report, count=-1)
+                    dedup_state['requeue'].append(split_doc)
+
+        # 写入成功的切片已有保留副本, 不再暂存其重复切片
+        for split_doc in batch_docs:
+            dedup_state['unconfirmed'].discard(split_doc.id)
+            dedup_state['skipped'].pop(split_doc.id, None)
+
+        report.batches += 1
+        report.chunks += len(batch_docs) - len(failed_chunks)
+        report.failed_chunks += len(failed_chunks)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            cost_time = time.time() - s_time
+            logger.debug(
+                f'\t-> 已写入批次【{report.batches}】, 切片【{report.chunks}】, '
+                f'吞吐量【{round(report.chunks / cost_time, 2) if cost_time else 0} 切片/s】'
+            )
@@ -0,0 +1,844 @@
+import datetime
+import heapq
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from collections import Counter
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from core.common.rag.base_vector_store import BaseVectorStore, IndexStats
+from core.common.rag.bm25 import tokenize, bm25_score, fuse_scores
+from core.common.rag.quantization import QUANTIZATION_TYPES, create_quantizer
+from core.common.rag.query_cache import QueryCache
+from core.common.rag.rerank import RerankClient, AdaptiveReranker
+
+VECTOR_DTYPES = {'float32': np.float32, 'float16': np.float16}
+DEFAULT_TENANT = '_default'
+# 检索期间索引被压缩时的重试次数
+SEARCH_RETRIES = 3
+
+
+class LocalCollection:
+
+    def __init__(
+        self,
+        collection_dir: str,
+        dtype: str = 'float32',
+        hnsw_threshold: int = 20000,
+        hnsw_m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        hybrid_candidates: int = 100,
+        search_batch_rows: int = 65536,
+        compact_ratio: float = 0.3,
+        quantization: str = 'none',
+        pq_segments: int = 64,
+        training_limit: int = 20000,
+        rescore_factor: int = 4
+    ):
+        """
+        本地索引(单个工作区/租户): 向量按行保存在内存映射文件(float32/float16, 写入前归一化), 切片文本、元数据和 BM25 倒排表保存在 sqlite;
+        删除切片时标记删除, 标记删除的行超过 compact_ratio 时压缩; 有效切片数超过 hnsw_threshold 且安装 hnswlib 时使用 HNSW 图检索, 否则分块暴力检索;
+        开启量化(int8/pq)时不使用 HNSW(HNSW 在内存中保存完整向量), 检索时扫描内存中的量化编码, 再读取候选行的原始向量重新计算分数
+        :param collection_dir: 索引目录
+        :param dtype: 向量存储类型 float32/float16(已有索引以索引创建时的类型为准)
+        :param hnsw_threshold: 使用 HNSW 的最小切片数
+        :param hnsw_m: HNSW 每个节点的连接数
+        :param ef_construction: HNSW 构建时的候选数
+        :param ef_search: HNSW 检索时的候选数(小于检索个数时使用检索个数)
+        :param hybrid_candidates: 混合检索时向量、关键字各自召回的候选数
+        :param search_batch_rows: 暴力检索单次计算的行数(限制内存占用)
+        :param compact_ratio: 标记删除行数占比超过该值时压缩索引文件
+        :param quantization: 量化类型 none/int8/pq, 修改后重新打开索引时重新训练
+        :param pq_segments: pq 分段数(每个向量编码字节数)
+        :param training_limit: 有效切片数达到该值时训练量化器(训练样本数)
+        :param rescore_factor: 量化检索召回 k * rescore_factor 个候选, 使用原始向量重新计算分数
+        """
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f'向量存储类型必须为【{"/".join(VECTOR_DTYPES)}】')
+        if quantization not in QUANTIZATION_TYPES:
+            raise ValueError(f'量化类型必须为【{"/".join(QUANTIZATION_TYPES)}】')
+
+        self.__dir = collection_dir
+        self.__hnsw_threshold = hnsw_threshold
+        self.__hnsw_m = hnsw_m
+        self.__ef_construction = ef_construction
+        self.__ef_search = ef_search
+        self.__hybrid_candidates = hybrid_candidates
+        self.__search_batch_rows = search_batch_rows
+        self.__compact_ratio = compact_ratio
+        self.__pq_segments = pq_segments
+        self.__training_limit = training_limit
+        self.__rescore_factor = max(rescore_factor, 1)
+        self.__lock = threading.RLock()
+        # 压缩代数: 压缩索引时行号重新编号, 检索开始后代数变化的结果失效
+        self.__generation = 0
+
+        os.makedirs(self.__dir, exist_ok=True)
+        self.__meta_path = os.path.join(self.__dir, 'collection.json')
+        self.__meta = {'dim': None, 'dtype': dtype, 'capacity': 0, 'hnsw_rows': 0, 'quantization': 'none', 'trained': False}
+        if os.path.exists(self.__meta_path):
+            with open(self.__meta_path, 'r', encoding='utf-8') as f:
+                self.__meta.update(json.load(f))
+        self.__dtype = VECTOR_DTYPES[self.__meta['dtype']]
+
+        # 量化类型变化时删除旧的量化编码; 开启量化时删除 HNSW 图
+        if self.__meta['quantization'] != quantization:
+            for path in [self.__quantizer_path, self.__codes_path]:
+                if os.path.exists(path): os.remove(path)
+            self.__meta.update({'quantization': quantization, 'trained': False})
+        if quantization != 'none' and os.path.exists(self.__hnsw_path):
+            os.remove(self.__hnsw_path)
+
+        self.__conn = sqlite3.connect(os.path.join(self.__dir, 'chunks.db'), check_same_thread=False)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        self.__conn.execute(
+            'CREATE TABLE IF NOT EXISTS chunk ('
+            'row INTEGER PRIMARY KEY, uuid TEXT NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL, '
+            'length INTEGER NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)'
+        )
+        self.__conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_chunk_uuid ON chunk (uuid) WHERE deleted = 0')
+        self.__conn.execute('CREATE TABLE IF NOT EXISTS posting (term TEXT NOT NULL, row INTEGER NOT NULL, tf INTEGER NOT NULL, length INTEGER NOT NULL)')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_posting_term ON posting (term)')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_posting_row ON posting (row)')
+        self.__conn.commit()
+
+        self.__count = self.__conn.execute('SELECT COALESCE(MAX(row) + 1, 0) FROM chunk').fetchone()[0]
+        self.__doc_count, self.__total_length = self.__conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunk WHERE deleted = 0'
+        ).fetchone()
+        self.__alive = np.zeros(max(self.__meta['capacity'], self.__count), dtype=bool)
+        for (row,) in self.__conn.execute('SELECT row FROM chunk WHERE deleted = 0'):
+            self.__alive[row] = True
+
+        self.__vectors: np.memmap | None = None
+        if self.__meta['dim']:
+            self.__vectors = np.memmap(self.__vector_path, dtype=self.__dtype, mode='r+', shape=(self.__meta['capacity'], self.__meta['dim']))
+
+        self.__quantizer = None
+        self.__codes: np.memmap | None = None
+        if self.__meta['trained']:
+            with np.load(self.__quantizer_path) as state:
+                self.__quantizer = create_quantizer(quantization, self.__meta['dim'], pq_segments=pq_segments, state=dict(state))
+            self.__codes = np.memmap(
+                self.__codes_path, dtype=self.__quantizer.code_dtype, mode='r+', shape=(self.__meta['capacity'], self.__quantizer.code_size)
+            )
+
+        self.__hnsw = None
+        self.__load_hnsw()
+        if self.__hnsw is None and self.__vectors is not None: self.__build_hnsw()
+        if self.__vectors is not None: self.__train_quantizer()
+
+    @property
+    def __vector_path(self) -> str:
+        return os.path.join(self.__dir, f'vectors.{self.__meta["dtype"]}')
+
+    @property
+    def __hnsw_path(self) -> str:
+        return os.path.join(self.__dir, 'hnsw.bin')
+
+    @property
+    def __quantizer_path(self) -> str:
+        return os.path.join(self.__dir, 'quantizer.npz')
+
+    @property
+    def __codes_path(self) -> str:
+        return os.path.join(self.__dir, 'codes.bin')
+
+    @property
+    def count(self) -> int:
+        """
+        有效切片数
+        """
+        return self.__doc_count
+
+    @property
+    def use_hnsw(self) -> bool:
+        return self.__hnsw is not None
+
+    @property
+    def quantization(self) -> str:
+        """
+        已生效的量化类型(未达到训练样本数时为 none)
+        """
+        return self.__meta['quantization'] if self.__quantizer is not None else 'none'
+
+    def __save_meta(self):
+        tmp_path = f'{self.__meta_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.__meta, f)
+        os.replace(tmp_path, self.__meta_path)
+
+    def __ensure_capacity(self, dim: int, rows: int):
+        """
+        向量文件容量不足时按 2 倍扩容
+        :param dim: 向量维度
+        :param rows: 需要的总行数
+        :return:
+        """
+        if self.__meta['dim'] is None:
+            self.__meta['dim'] = dim
+        if rows <= self.__meta['capacity']: return
+
+        capacity = max(rows, self.__meta['capacity'] * 2, 1024)
+        if self.__vectors is not None: self.__vectors.flush()
+        with open(self.__vector_path, 'ab') as f:
+            f.truncate(capacity * dim * np.dtype(self.__dtype).itemsize)
+        self.__vectors = np.memmap(self.__vector_path, dtype=self.__dtype, mode='r+', shape=(capacity, dim))
+
+        if self.__codes is not None:
+            self.__codes.flush()
+            self.__codes = self.__open_codes(capacity)
+
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self.__alive)] = self.__alive
+        self.__alive = alive
+        self.__meta['capacity'] = capacity
+        if self.__hnsw is not None: self.__hnsw.resize_index(capacity)
+        self.__save_meta()
+
+    def __open_codes(self, capacity: int) -> np.memmap:
+        """
+        打开量化编码文件(不足容量时扩容)
+        :param capacity:
+        :return:
+        """
+        code_dtype, code_size = self.__quantizer.code_dtype, self.__quantizer.code_size
+        with open(self.__codes_path, 'ab') as f:
+            f.truncate(capacity * code_size * np.dtype(code_dtype).itemsize)
+        return np.memmap(self.__codes_path, dtype=code_dtype, mode='r+', shape=(capacity, code_size))
+
+    def __train_quantizer(self):
+        """
+        有效切片数达到训练样本数时训练量化器, 并编码所有已写入的向量
+        :return:
+        """
+        quantization = self.__meta['quantization']
+        if quantization == 'none' or self.__quantizer is not None or self.__doc_count < self.__training_limit: return
+
+        rows = np.flatnonzero(self.__alive[:self.__count])
+        sample_rows = np.sort(np.random.RandomState(0).choice(rows, min(len(rows), self.__training_limit), replace=False))
+        quantizer = create_quantizer(quantization, self.__meta['dim'], pq_segments=self.__pq_segments)
+        quantizer.train(np.asarray(self.__vectors[sample_rows], dtype=np.float32))
+
+        self.__quantizer = quantizer
+        self.__codes = self.__open_codes(self.__meta['capacity'])
+        for start in range(0, self.__count, self.__search_batch_rows):
+            end = min(start + self.__search_batch_rows, self.__count)
+            self.__codes[start: end] = quantizer.encode(np.asarray(self.__vectors[start: end], dtype=np.float32))
+        self.__codes.flush()
+
+        np.savez(self.__quantizer_path, **quantizer.state())
+        self.__meta['trained'] = True
+        self.__save_meta()
+
+    @staticmethod
+    def __import_hnswlib():
+        try:
+            import hnswlib
+            return hnswlib
+        except ImportError:
+            return None
+
+    def __load_hnsw(self):
+        """
+        加载已保存的 HNSW 图, 并补齐保存后写入和删除的切片
+        :return:
+        """
+        hnswlib = self.__import_hnswlib()
+        if not hnswlib or not self.__meta['dim'] or not os.path.exists(self.__hnsw_path): return
+        if self.__meta['quantization'] != 'none': return
+
+        self.__hnsw = hnswlib.Index(space='ip', dim=self.__meta['dim'])
+        self.__hnsw.load_index(self.__hnsw_path, max_elements=self.__meta['capacity'])
+        self.__hnsw.set_ef(self.__ef_search)
+
+        hnsw_rows = min(self.__meta['hnsw_rows'], self.__count)
+        new_rows = np.flatnonzero(self.__alive[hnsw_rows: self.__count]) + hnsw_rows
+        if len(new_rows): self.__hnsw.add_items(np.asarray(self.__vectors[new_rows], dtype=np.float32), new_rows)
+        for (row,) in self.__conn.execute('SELECT row FROM chunk WHERE deleted = 1 AND row < ?', [hnsw_rows]):
+            try:
+                self.__hnsw.mark_deleted(row)
+            except RuntimeError:
+                pass
+
+    def __build_hnsw(self):
+        """
+        有效切片数达到阈值时构建 HNSW 图
+        :return:
+        """
+        hnswlib = self.__import_hnswlib()
+        if not hnswlib or self.__hnsw is not None or self.__doc_count < self.__hnsw_threshold: return
+        if self.__meta['quantization'] != 'none': return
+
+        self.__hnsw = hnswlib.Index(space='ip', dim=self.__meta['dim'])
+        self.__hnsw.init_index(max_elements=self.__meta['capacity'], M=self.__hnsw_m, ef_construction=self.__ef_construction)
+        self.__hnsw.set_ef(self.__ef_search)
+        rows = np.flatnonzero(self.__alive[:self.__count])
+        for index in range(0, len(rows), self.__search_batch_rows):
+            batch_rows = rows[index: index + self.__search_batch_rows]
+            self.__hnsw.add_items(np.asarray(self.__vectors[batch_rows], dtype=np.float32), batch_rows)
+        self.save()
+
+    def save(self):
+        """
+        持久化向量文件、量化编码和 HNSW 图
+        :return:
+        """
+        with self.__lock:
+            if self.__vectors is not None: self.__vectors.flush()
+            if self.__codes is not None: self.__codes.flush()
+            if self.__hnsw is not None:
+                self.__hnsw.save_index(self.__hnsw_path)
+                self.__meta['hnsw_rows'] = self.__count
+            self.__save_meta()
+
+    def upsert(self, split_docs: List[Document], vectors: List[List[float]]) -> dict:
+        """
+        写入切片(相同 uuid 的旧切片标记删除)
+        :param split_docs: 切片数据, 切片 id 为空时生成 uuid
+        :param vectors: 切片对应的向量
+        :return: 写入失败的切片 {切片下标: 失败原因}
+        """
+        if not split_docs: return {}
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(split_docs):
+            return {index: '向量数量与切片数量不一致' for index in range(len(split_docs))}
+        if self.__meta['dim'] and vectors.shape[1] != self.__meta['dim']:
+            return {index: f'向量维度【{vectors.shape[1]}】与索引维度【{self.__meta["dim"]}】不一致' for index in range(len(split_docs))}
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        chunk_uuids = [split_doc.id if split_doc.id else str(uuid.uuid4()) for split_doc in split_docs]
+        # 同一批次内 uuid 重复时只保留最后一个
+        last_index = {chunk_uuid: index for index, chunk_uuid in enumerate(chunk_uuids)}
+        indexes = sorted(last_index.values())
+
+        with self.__lock:
+            self.__delete_rows(self.__alive_rows(chunk_uuids))
+
+            start = self.__count
+            self.__ensure_capacity(vectors.shape[1], start + len(indexes))
+            self.__vectors[start: start + len(indexes)] = vectors[indexes]
+            if self.__codes is not None: self.__codes[start: start + len(indexes)] = self.__quantizer.encode(vectors[indexes])
+
+            chunk_rows, posting_rows = [], []
+            for row, index in enumerate(indexes, start=start):
+                split_doc = split_docs[index]
+                tokens = tokenize(split_doc.page_content)
+                metadata = {key: val.isoformat() if isinstance(val, datetime.datetime) else val for key, val in split_doc.metadata.items()}
+                chunk_rows.append((row, chunk_uuids[index], split_doc.page_content, json.dumps(metadata, ensure_ascii=False, default=str), len(tokens)))
+                posting_rows.extend((term, row, tf, len(tokens)) for term, tf in Counter(tokens).items())
+                self.__total_length += len(tokens)
+
+            self.__conn.executemany('INSERT INTO chunk (row, uuid, text, metadata, length) VALUES (?, ?, ?, ?, ?)', chunk_rows)
+            self.__conn.executemany('INSERT INTO posting (term, row, tf, length) VALUES (?, ?, ?, ?)', posting_rows)
+            self.__conn.commit()
+
+            self.__alive[start: start + len(indexes)] = True
+            self.__count += len(indexes)
+            self.__doc_count += len(indexes)
+
+            if self.__hnsw is not None:
+                self.__hnsw.add_items(vectors[indexes], np.arange(start, start + len(indexes)))
+            else:
+                self.__build_hnsw()
+            self.__train_quantizer()
+
+        return {}
+
+    def __alive_rows(self, chunk_uuids: list[str]) -> list[int]:
+        rows = []
+        for index in range(0, len(chunk_uuids), 500):
+            batch = chunk_uuids[index: index + 500]
+            rows.extend(row for (row,) in self.__conn.execute(
+                f'SELECT row FROM chunk WHERE deleted = 0 AND uuid IN ({", ".join("?" * len(batch))})', batch
+            ))
+        return rows
+
+    def __delete_rows(self, rows: list[int]):
+        if not rows: return
+
+        for index in range(0, len(rows), 500):
+            batch = rows[index: index + 500]
+            placeholders = ', '.join('?' * len(batch))
+            self.__total_length -= self.__conn.execute(
+                f'SELECT COALESCE(SUM(length), 0) FROM chunk WHERE row IN ({placeholders})', batch
+            ).fetchone()[0]
+            self.__conn.execute(f'UPDATE chunk SET deleted = 1 WHERE row IN ({placeholders})', batch)
+            self.__conn.execute(f'DELETE FROM posting WHERE row IN ({placeholders})', batch)
+
+        self.__alive[rows] = False
+        self.__doc_count -= len(rows)
+        if self.__hnsw is not None:
+            for row in rows:
+                self.__hnsw.mark_deleted(row)
+
+    def delete(self, chunk_uuids: list[str]) -> int:
+        """
+        按 uuid 删除切片
+        :param chunk_uuids:
+        :return: 删除的切片数
+        """
+        with self.__lock:
+            rows = self.__alive_rows(chunk_uuids)
+            self.__delete_rows(rows)
+            self.__conn.commit()
+
+            if self.__count and (self.__count - self.__doc_count) / self.__count > self.__compact_ratio:
+                self.compact()
+        return len(rows)
+
+    def compact(self):
+        """
+        压缩索引: 删除标记删除的行, 有效行按原顺序重新编号并重建 HNSW 图
+        :return:
+        """
+        with self.__lock:
+            rows = np.flatnonzero(self.__alive[:self.__count])
+            if len(rows) == self.__count: return
+
+            # 有效行按升序前移, 目标行号不大于源行号, 分块复制不会覆盖未复制的行
+            if self.__vectors is not None:
+                for start in range(0, len(rows), self.__search_batch_rows):
+                    batch_rows = rows[start: start + self.__search_batch_rows]
+                    self.__vectors[start: start + len(batch_rows)] = self.__vectors[batch_rows]
+                    if self.__codes is not None: self.__codes[start: start + len(batch_rows)] = self.__codes[batch_rows]
+                self.__vectors.flush()
+                if self.__codes is not None: self.__codes.flush()
+
+            # 先改为负数再改回, 避免重新编号时主键冲突
+            self.__conn.execute('DELETE FROM chunk WHERE deleted = 1')
+            self.__conn.execute('CREATE TEMP TABLE row_map AS SELECT row AS old_row, ROW_NUMBER() OVER (ORDER BY row) - 1 AS new_row FROM chunk')
+            self.__conn.execute('CREATE INDEX temp.idx_row_map ON row_map (old_row)')
+            for table in ['chunk', 'posting']:
+                self.__conn.execute(f'UPDATE {table} SET row = -1 - (SELECT new_row FROM row_map WHERE old_row = {table}.row)')
+                self.__conn.execute(f'UPDATE {table} SET row = -1 - row')
+            self.__conn.execute('DROP TABLE temp.row_map')
+            self.__conn.commit()
+
+            self.__count = len(rows)
+            self.__alive[:] = False
+            self.__alive[:self.__count] = True
+            self.__generation += 1
+
+            if self.__hnsw is not None:
+                self.__hnsw = None
+                if os.path.exists(self.__hnsw_path): os.remove(self.__hnsw_path)
+            self.__build_hnsw()
+            self.save()
+
+    def __filter_rows(self, filter: dict | None) -> np.ndarray | None:
+        """
+        元数据过滤: {元数据键: 值 或 值列表}, 多个键同时满足
+        :param filter:
+        :return: 满足条件的行号, 无过滤条件时返回 None
+        """
+        if not filter: return None
+        if not isinstance(filter, dict):
+            raise TypeError('本地向量库过滤条件必须为 {元数据键: 值 或 值列表}')
+
+        conditions, params = ['deleted = 0'], []
+        for key, val in filter.items():
+            values = list(val) if isinstance(val, (list, tuple, set)) else [val]
+            conditions.append(f'json_extract(metadata, ?) IN ({", ".join("?" * len(values))})')
+            params.extend([f'$."{key}"', *values])
+
+        with self.__lock:
+            rows = [row for (row,) in self.__conn.execute(f'SELECT row FROM chunk WHERE {" AND ".join(conditions)}', params)]
+        return np.asarray(rows, dtype=np.int64)
+
+    def vector_search(self, query_vector: list[float], k: int, rows: np.ndarray | None = None, exact: bool = False) -> dict[int, float]:
+        """
+        向量检索(余弦相似度): 优先使用 HNSW 图或量化编码, 无法使用时分块暴力检索
+        :param query_vector: 问题向量
+        :param k: 返回结果个数
+        :param rows: 只检索这些行, 为空时检索所有有效行
+        :param exact: 是否使用原始向量暴力检索(用于计算召回率)
+        :return: {行号: 相似度}
+        """
+        with self.__lock:
+            vectors, codes, quantizer = self.__vectors, self.__codes, self.__quantizer
+            count, alive, hnsw = self.__count, self.__alive, self.__hnsw
+            if vectors is None or not self.__doc_count or k <= 0: return {}
+
+            query = np.asarray(query_vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm: query = query / norm
+
+            k = min(k, self.__doc_count)
+            if hnsw is not None and rows is None and not exact:
+                hnsw.set_ef(max(self.__ef_search, k))
+                try:
+                    labels, distances = hnsw.knn_query(query, k=k)
+                    return {int(label): 1 - float(distance) for label, distance in zip(labels[0], distances[0])}
+                except RuntimeError:
+                    # 标记删除过多时 HNSW 可能返回不足 k 个结果, 使用暴力检索
+                    pass
+
+        if quantizer is None or exact:
+            return dict(self.__scan(vectors, lambda block: np.asarray(block, dtype=np.float32) @ query, count, alive, k, rows))
+
+        # 量化编码召回候选, 原始向量重新计算候选分数
+        candidates = self.__scan(codes, lambda block: quantizer.scores(block, query), count, alive, k * self.__rescore_factor, rows)
+        candidate_rows = np.sort(np.asarray([row for row, _ in candidates], dtype=np.int64))
+        if not len(candidate_rows): return {}
+        scores = np.asarray(vectors[candidate_rows], dtype=np.float32) @ query
+        top = np.argsort(-scores)[:k]
+        return {int(candidate_rows[index]): float(scores[index]) for index in top}
+
+    def __scan(self, matrix: np.ndarray, score_func, count: int, alive: np.ndarray, k: int, rows: np.ndarray | None) -> list[tuple[int, float]]:
+        """
+        分块计算分数, 每块只保留 top k
+        :param matrix: 原始向量或量化编码
+        :param score_func: 分块计算分数的方法
+        :param count: 总行数
+        :param alive: 有效行标记
+        :param k: 返回结果个数
+        :param rows: 只计算这些行, 为空时计算所有行
+        :return: 按分数降序的 [(行号, 分数)]
+        """
+        candidates: list[tuple[float, int]] = []
+        row_blocks = (
+            [np.arange(start, min(start + self.__search_batch_rows, count)) for start in range(0, count, self.__search_batch_rows)]
+            if rows is None else [rows[start: start + self.__search_batch_rows] for start in range(0, len(rows), self.__search_batch_rows)]
+        )
+        for block_rows in row_blocks:
+            block_rows = block_rows[alive[block_rows]]
+            if not len(block_rows): continue
+
+            block = matrix[block_rows[0]: block_rows[-1] + 1] if rows is None else matrix[block_rows]
+            if rows is None: block = block[block_rows - block_rows[0]]
+            scores = score_func(block)
+            top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+            candidates.extend((float(scores[index]), int(block_rows[index])) for index in top)
+
+        return [(row, score) for score, row in heapq.nlargest(k, candidates)]
+
+    def stats(self, k: int = 10, samples: int = 100) -> dict:
+        """
+        索引内存占用和召回率: 以随机抽样的切片向量作为问题, 对比当前检索方式(HNSW/量化)与原始向量暴力检索的 top k 重合率
+        :param k: 召回率计算的检索个数
+        :param samples: 抽样问题数, 为0时不计算召回率
+        :return:
+        """
+        with self.__lock:
+            count, doc_count, dim = self.__count, self.__doc_count, self.__meta['dim'] or 0
+            rows = np.flatnonzero(self.__alive[:count])
+            vector_bytes = count * dim * np.dtype(self.__dtype).itemsize
+            code_bytes = count * self.__quantizer.code_size * np.dtype(self.__quantizer.code_dtype).itemsize if self.__quantizer else 0
+            # hnswlib 每个节点保存 float32 向量和第0层 2M 个连接
+            hnsw_bytes = count * (dim * 4 + self.__hnsw_m * 2 * 4 + 8) if self.__hnsw is not None else 0
+
+        recall = None
+        if samples > 0 and len(rows) and (self.__quantizer is not None or self.__hnsw is not None):
+            sample_rows = np.random.RandomState(0).choice(rows, min(samples, len(rows)), replace=False)
+            hits = 0
+            for row in sample_rows:
+                query = np.asarray(self.__vectors[row], dtype=np.float32)
+                expected = self.vector_search(query, k, exact=True)
+                hits += len(expected.keys() & self.vector_search(query, k).keys()) / max(len(expected), 1)
+            recall = hits / len(sample_rows)
+        elif samples > 0 and len(rows):
+            recall = 1.0
+
+        return {
+            'count': doc_count,
+            'dim': dim,
+            'dtype': self.__meta['dtype'],
+            'quantization': self.quantization,
+            'use_hnsw': self.use_hnsw,
+            'vector_bytes': vector_bytes,
+            # 检索时常驻内存: 量化编码 / HNSW 图 / 暴力检索时扫描的全部向量
+            'memory_bytes': (code_bytes or hnsw_bytes or vector_bytes) + len(self.__alive),
+            'recall_at_k': recall
+        }
+
+    def keyword_search(self, query: str, k: int, rows: np.ndarray | None = None) -> dict[int, float]:
+        """
+        BM25 关键字检索
+        :param query: 问题
+        :param k: 返回结果个数
+        :param rows: 只检索这些行, 为空时检索所有有效行
+        :return: {行号: BM25 分数}
+        """
+        allowed = set(rows.tolist()) if rows is not None else None
+        scores: dict[int, float] = {}
+
+        with self.__lock:
+            doc_count, total_length = self.__doc_count, self.__total_length
+            if not doc_count: return {}
+            avg_length = total_length / doc_count
+
+            for term in set(tokenize(query)):
+                postings = self.__conn.execute('SELECT row, tf, length FROM posting WHERE term = ?', [term]).fetchall()
+                df = len(postings)
+                for row, tf, length in postings:
+                    if allowed is not None and row not in allowed: continue
+                    scores[row] = scores.get(row, 0.0) + bm25_score(tf, df, doc_count, length, avg_length)
+
+        return dict(heapq.nlargest(k, scores.items(), key=lambda item: item[1]))
+
+    def hybrid_search(
+        self,
+        query: str,
+        query_vector: list[float] | None,
+        alpha: float = 0.75,
+        k: int = 5,
+        filter: dict | None = None
+    ) -> list[tuple[Document, float]]:
+        """
+        混合检索: 向量和 BM25 各自召回候选, 分数归一化后按 alpha 加权融合
+        :param query: 问题
+        :param query_vector: 问题向量(alpha 为 0 时可为空)
+        :param alpha: 向量和关键字比重, 范围: [0,1], 1 表示完全使用向量
+        :param k: 返回结果个数
+        :param filter: 元数据过滤条件 {元数据键: 值 或 值列表}
+        :return: 按融合分数降序的 [(切片, 分数)]
+        """
+        # 向量分块扫描不持锁, 检索期间索引被压缩(向量移动、行号重新编号)时丢弃结果重新检索, 多次失效后持锁检索
+        search_kwargs = {'query': query, 'query_vector': query_vector, 'alpha': alpha, 'k': k, 'filter': filter}
+        for _ in range(SEARCH_RETRIES):
+            generation = self.__generation
+            results = self.__load_chunks(self.__search_rows(**search_kwargs), generation=generation)
+            if results is not None: return results
+
+        with self.__lock:
+            return self.__load_chunks(self.__search_rows(**search_kwargs), generation=self.__generation)
+
+    def __search_rows(
+        self,
+        query: str,
+        query_vector: list[float] | None,
+        alpha: float,
+        k: int,
+        filter: dict | None
+    ) -> list[tuple[int, float]]:
+        rows = self.__filter_rows(filter)
+        if rows is not None and not len(rows): return []
+
+        candidate_k = max(k, self.__hybrid_candidates)
+        vector_scores = self.vector_search(query_vector, candidate_k, rows=rows) if alpha > 0 and query_vector is not None else {}
+        keyword_scores = self.keyword_search(query, candidate_k, rows=rows) if alpha < 1 else {}
+        scores = fuse_scores(vector_scores, keyword_scores, alpha=alpha)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def __load_chunks(self, top_rows: list[tuple[int, float]], generation: int) -> list[tuple[Document, float]] | None:
+        """
+        按行号读取切片
+        :param top_rows: [(行号, 分数)]
+        :param generation: 检索开始时的压缩代数
+        :return: [(切片, 分数)], 检索期间索引被压缩时返回 None
+        """
+        with self.__lock:
+            if generation != self.__generation: return None
+            if not top_rows: return []
+
+            chunk_map = {
+                row: (chunk_uuid, text, metadata) for row, chunk_uuid, text, metadata in self.__conn.execute(
+                    f'SELECT row, uuid, text, metadata FROM chunk WHERE deleted = 0 AND row IN ({", ".join("?" * len(top_rows))})',
+                    [row for row, _ in top_rows]
+                )
+            }
+
+        results = []
+        for row, score in top_rows:
+            if row not in chunk_map: continue
+            chunk_uuid, text, metadata = chunk_map[row]
+            results.append((Document(page_content=text, metadata=json.loads(metadata), id=chunk_uuid), score))
+        return results
+
+    def close(self):
+        with self.__lock:
+            self.save()
+            self.__conn.close()
+            self.__vectors = None
+            self.__hnsw = None
+
+
+class LocalVectorStore(BaseVectorStore):
+
+    def __init__(
+        self,
+        embedding_client: Embeddings = None,
+        rerank_client: RerankClient = None,
+        root_dir: str | None = None,
+        dtype: str = 'float32',
+        hnsw_threshold: int = 20000,
+        hnsw_m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        hybrid_candidates: int = 100,
+        quantization: str = 'none',
+        pq_segments: int = 64,
+        training_limit: int = 20000,
+        rescore_factor: int = 4,
+        query_cache: QueryCache | None = None,
+        reranker: AdaptiveReranker | None = None
+    ):
+        """
+        进程内本地向量数据库(无需部署 weaviate), 每个工作区/租户一个本地索引目录: {root_dir}/{索引名}/{租户名};
+        检索语义与 WeaviateClient 一致(向量 + BM25 混合检索, alpha 加权融合), 过滤条件为 {元数据键: 值 或 值列表}
+        :param embedding_client: 嵌入模型客户端
+        :param rerank_client: 重排模型客户端
+        :param root_dir: 索引根目录, 默认 ../data/local_vector
+        :param dtype: 向量存储类型 float32/float16
+        :param hnsw_threshold: 切片数达到该值且安装 hnswlib 时使用 HNSW 图检索
+        :param hnsw_m: HNSW 每个节点的连接数
+        :param ef_construction: HNSW 构建时的候选数
+        :param ef_search: HNSW 检索时的候选数
+        :param hybrid_candidates: 混合检索时向量、关键字各自召回的候选数
+        :param quantization: 量化类型 none/int8(每个向量 dim 字节)/pq(每个向量 pq_segments 字节), 开启后不使用 HNSW
+        :param pq_segments: pq 分段数
+        :param training_limit: 工作区切片数达到该值时训练量化器
+        :param rescore_factor: 量化检索召回 k * rescore_factor 个候选后使用原始向量重新计算分数
+        :param query_cache: 检索结果缓存, 为空时不缓存
+        :param reranker: 自适应重排, 为空时使用 rerank_client 直接重排
+        """
+        super().__init__(
+            embedding_client=embedding_client, rerank_client=rerank_client, query_cache=query_cache, reranker=reranker
+        )
+        project_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+        self.__root_dir = root_dir if root_dir else os.path.join(project_path, 'data', 'local_vector')
+        self.__collection_config = {
+            'dtype': dtype,
+            'hnsw_threshold': hnsw_threshold,
+            'hnsw_m': hnsw_m,
+            'ef_construction': ef_construction,
+            'ef_search': ef_search,
+            'hybrid_candidates': hybrid_candidates,
+            'quantization': quantization,
+            'pq_segments': pq_segments,
+            'training_limit': training_limit,
+            'rescore_factor': rescore_factor
+        }
+        self.__collections: dict[tuple[str, str], LocalCollection] = {}
+        self.__lock = threading.Lock()
+        self.__index_name: str | None = None
+
+        os.makedirs(self.__root_dir, exist_ok=True)
+
+    @property
+    def index_name(self) -> str | None:
+        return self.__index_name
+
+    def collection(self, index_name: str, tenant: str | None = None) -> LocalCollection:
+        """
+        获取本地索引(不存在时创建)
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :return:
+        """
+        key = (index_name, tenant if tenant else DEFAULT_TENANT)
+        with self.__lock:
+            if key not in self.__collections:
+                self.__collections[key] = LocalCollection(os.path.join(self.__root_dir, *key), **self.__collection_config)
+            return self.__collections[key]
+
+    def get_store(self, index_name: str, tenant: str | None = None) -> LocalCollection:
+        self.__index_name = index_name
+        return self.collection(index_name=index_name, tenant=tenant)
+
+    def insert_vectors(
+        self,
+        split_docs: List[Document],
+        vectors: List[List[float]],
+        index_name: str,
+        tenant: str | None = None,
+    ) -> dict:
+        failed_chunks = self.collection(index_name=index_name, tenant=tenant).upsert(split_docs=split_docs, vectors=vectors)
+        if self.query_cache: self.query_cache.bump_version(index_name)
+        return failed_chunks
+
+    def similarity_search(
+        self,
+        query: str,
+        query_vector: list[float] | None = None,
+        alpha: float = 0.75,
+        k: int = 5,
+        filter: dict | None = None,
+        tenant: str | None = None,
+        index_name: str | None = None
+    ) -> list[tuple[Document, float]]:
+        index_name = index_name if index_name else self.__index_name
+        if not index_name:
+            raise Exception('本地向量数据库未加载向量!!')
+
+        if query_vector is None and alpha > 0:
+            query_vector = self.embedding_client.embed_query(query)
+        return self.collection(index_name=index_name, tenant=tenant).hybrid_search(
+            query=query,
+            query_vector=query_vector,
+            alpha=alpha,
+            k=k,
+            filter=filter
+        )
+
+    def delete_by_ids(self, index_name: str, uuids: list[str], tenant: str | None = None, batch_size: int = 1000) -> int:
+        if not uuids or index_name not in self.all_collections(): return 0
+
+        collection = self.collection(index_name=index_name, tenant=tenant)
+        delete_count = 0
+        for index in range(0, len(uuids), batch_size):
+            delete_count += collection.delete(uuids[index: index + batch_size])
+
+        if self.query_cache: self.query_cache.bump_version(index_name)
+        return delete_count
+
+    def index_stats(self, index_name: str, tenant: str | None = None, k: int = 10, samples: int = 100) -> IndexStats:
+        """
+        工作区索引的内存占用和召回率(与原始向量暴力检索结果对比)
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :param k: 召回率计算的检索个数
+        :param samples: 抽样问题数, 为0时不计算召回率
+        :return:
+        """
+        stats = self.collection(index_name=index_name, tenant=tenant).stats(k=k, samples=samples)
+        return IndexStats(
+            index_name=index_name,
+            tenant=tenant,
+            count=stats['count'],
+            dim=stats['dim'],
+            quantization=stats['quantization'],
+            vector_bytes=stats['vector_bytes'],
+            memory_bytes=stats['memory_bytes'],
+            k=k,
+            recall_at_k=stats['recall_at_k']
+        )
+
+    def delete_collection(self, collection_name: str):
+        with self.__lock:
+            for key in [key for key in self.__collections if key[0] == collection_name]:
+                self.__collections.pop(key).close()
+        shutil.rmtree(os.path.join(self.__root_dir, collection_name), ignore_errors=True)
+        if self.query_cache: self.query_cache.bump_version(collection_name)
+
+    def clear_collections(self):
+        for collection_name in self.all_collections():
+            self.delete_collection(collection_name)
+
+    def all_collections(self) -> list:
+        return sorted(
+            name for name in os.listdir(self.__root_dir)
+            if os.path.isdir(os.path.join(self.__root_dir, name))
+        )
+
+    def close(self):
+        """
+        保存并关闭所有本地索引
+        :return:
+        """
+        with self.__lock:
+            for collection in self.__collections.values():
+                collection.close()
+            self.__collections = {}
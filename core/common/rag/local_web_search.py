@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from core.common.rag.base_web_search import BaseWebSearch
+from core.common.rag.bm25 import BM25Index
+from core.common.rag.web_search_cache import WebSearchCache
+
+# 离线语料支持的文件类型
+CORPUS_FILE_TYPES = ['.jsonl', '.json', '.html', '.htm', '.md', '.txt']
+
+
+class LocalWebSearch(BaseWebSearch):
+
+    name = 'local'
+
+    def __init__(
+        self,
+        corpus_dir: str | None = None,
+        max_results: int = 2,
+        max_chars: int | None = None,
+        cache: WebSearchCache | None = None,
+        passage_size: int = 500,
+        passage_overlap: int = 50
+    ):
+        """
+        离线网页搜索: 预先爬取的网页语料按段落切分后建立 BM25 索引, 每个网页返回与问题最相关的段落, 用于内网部署和测试;
+        语料文件: jsonl(每行 {"title", "url", "content"})/json(同格式列表)/html/md/txt, 首次搜索时加载
+        :param corpus_dir: 语料目录, 默认 ../data/web_corpus
+        :param max_results: 每个问题返回的网页个数
+        :param max_chars: 摘要最大字符数, 为空时不截断
+        :param cache: 搜索结果缓存, 为空时不缓存
+        :param passage_size: 段落字符数
+        :param passage_overlap: 相邻段落重合字符数
+        """
+        super().__init__(max_results=max_results, max_chars=max_chars, cache=cache)
+        project_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+        self.__corpus_dir = corpus_dir if corpus_dir else os.path.join(project_path, 'data', 'web_corpus')
+        self.__passage_size = max(passage_size, 1)
+        self.__passage_step = max(passage_size - passage_overlap, 1)
+        self.__lock = threading.Lock()
+        self.__load_lock = threading.Lock()
+        self.__index: BM25Index | None = None
+        self.__pages: list[dict] = []
+        self.__passages: list[tuple[int, str]] = []
+
+    @property
+    def page_count(self) -> int:
+        return len(self.__pages)
+
+    @staticmethod
+    def read_corpus_file(file_path: str) -> list[dict]:
+        """
+        读取语料文件
+        :param file_path: 文件地址
+        :return: [{'title': 标题, 'url': 网页地址, 'content': 正文}]
+        """
+        suffix = Path(file_path).suffix.lower()
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            if suffix == '.jsonl':
+                pages = [json.loads(line) for line in f if line.strip()]
+            elif suffix == '.json':
+                pages = json.load(f)
+                pages = pages if isinstance(pages, list) else [pages]
+            elif suffix in ['.html', '.htm']:
+                soup = BeautifulSoup(f.read(), 'html.parser')
+                for tag in soup(['script', 'style', 'noscript']):
+                    tag.decompose()
+                title = soup.title.get_text(strip=True) if soup.title else Path(file_path).stem
+                pages = [{'title': title, 'content': soup.get_text('\n', strip=True)}]
+            else:
+                pages = [{'title': Path(file_path).stem, 'content': f.read()}]
+
+        url = Path(os.path.abspath(file_path)).as_uri()
+        return [
+            {'title': page.get('title', ''), 'url': page.get('url') or url, 'content': page.get('content', '')}
+            for page in pages if isinstance(page, dict) and page.get('content')
+        ]
+
+    def __split_passages(self, content: str) -> list[str]:
+        content = ' '.join(content.split())
+        if len(content) <= self.__passage_size: return [content]
+        return [
+            content[start: start + self.__passage_size]
+            for start in range(0, len(content) - self.__passage_size + self.__passage_step, self.__passage_step)
+        ]
+
+    def reload(self) -> int:
+        """
+        重新加载语料并建立索引
+        :return: 网页数
+        """
+        index, pages, passages = BM25Index(), [], []
+        if os.path.isdir(self.__corpus_dir):
+            for root, _, file_names in os.walk(self.__corpus_dir):
+                for file_name in sorted(file_names):
+                    if Path(file_name).suffix.lower() not in CORPUS_FILE_TYPES: continue
+                    pages.extend(self.read_corpus_file(os.path.join(root, file_name)))
+
+        for page_index, page in enumerate(pages):
+            for passage in self.__split_passages(page['content']):
+                index.add(len(passages), f'{page["title"]}\n{passage}')
+                passages.append((page_index, passage))
+
+        with self.__lock:
+            self.__index, self.__pages, self.__passages = index, pages, passages
+        return len(pages)
+
+    def fetch(self, query: str, max_results: int) -> list[dict]:
+        with self.__load_lock:
+            if self.__index is None: self.reload()
+        with self.__lock:
+            index, pages, passages = self.__index, self.__pages, self.__passages
+
+        # 同一网页可能命中多个段落, 多召回段落后按网页去重
+        results, seen_pages = [], set()
+        for passage_index, _ in index.search(query, k=max_results * 10):
+            page_index, passage = passages[passage_index]
+            if page_index in seen_pages: continue
+
+            seen_pages.add(page_index)
+            page = pages[page_index]
+            results.append({'title': page['title'], 'url': page['url'], 'content': passage})
+            if len(results) >= max_results: break
+
+        return results
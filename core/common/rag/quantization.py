@@ -0,0 +1,163 @@
+import numpy as np
+
+QUANTIZATION_TYPES = ['none', 'int8', 'pq']
+
+
+class ScalarQuantizer:
+
+    name = 'int8'
+
+    def __init__(self, dim: int, scale: np.ndarray | None = None):
+        """
+        int8 标量量化: 每个维度按训练样本的最大绝对值缩放到 [-127, 127], 每个向量占 dim 字节
+        :param dim: 向量维度
+        :param scale: 每个维度的缩放系数, 为空时需要先训练
+        """
+        self.__dim = dim
+        self.__scale = scale
+
+    @property
+    def code_size(self) -> int:
+        return self.__dim
+
+    @property
+    def code_dtype(self):
+        return np.int8
+
+    def train(self, vectors: np.ndarray):
+        # 使用 99.9 分位数作为最大值, 避免个别离群值降低其它向量的精度
+        scale = np.quantile(np.abs(vectors), 0.999, axis=0).astype(np.float32)
+        self.__scale = np.where(scale == 0, 1e-6, scale)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint(np.asarray(vectors, dtype=np.float32) / self.__scale * 127)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        近似内积
+        :param codes: 向量编码 (n, dim)
+        :param query: 问题向量 (dim,)
+        :return:
+        """
+        return np.asarray(codes, dtype=np.float32) @ (query * self.__scale / 127)
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {'scale': self.__scale}
+
+
+class ProductQuantizer:
+
+    name = 'pq'
+
+    def __init__(
+        self,
+        dim: int,
+        segments: int = 64,
+        centroids: int = 256,
+        iterations: int = 20,
+        codebooks: np.ndarray | None = None
+    ):
+        """
+        乘积量化(PQ): 向量按维度均分为 segments 段, 每段使用 k-means 聚类中心编号(1 字节)编码, 每个向量占 segments 字节;
+        检索时按段计算问题向量与聚类中心的内积表, 查表累加得到近似内积
+        :param dim: 向量维度
+        :param segments: 分段数(不能整除 dim 时使用不大于该值的最大约数)
+        :param centroids: 每段聚类中心数(不超过 256)
+        :param iterations: k-means 迭代次数
+        :param codebooks: 聚类中心 (segments, centroids, dim / segments), 为空时需要先训练
+        """
+        segments = max(1, min(segments, dim))
+        while dim % segments: segments -= 1
+
+        self.__dim = dim
+        self.__segments = segments
+        self.__sub_dim = dim // segments
+        self.__centroids = min(centroids, 256)
+        self.__iterations = iterations
+        self.__codebooks = codebooks
+
+    @property
+    def code_size(self) -> int:
+        return self.__segments
+
+    @property
+    def code_dtype(self):
+        return np.uint8
+
+    def __split(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.__segments, self.__sub_dim)
+
+    @staticmethod
+    def __assign(vectors: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        # |x - c|^2 = |x|^2 - 2xc + |c|^2, |x|^2 不影响最近中心
+        distances = (centers ** 2).sum(axis=1) - 2 * vectors @ centers.T
+        return distances.argmin(axis=1)
+
+    def train(self, vectors: np.ndarray):
+        random_state = np.random.RandomState(0)
+        sub_vectors = self.__split(vectors)
+        centroids = min(self.__centroids, len(vectors))
+        codebooks = np.zeros((self.__segments, self.__centroids, self.__sub_dim), dtype=np.float32)
+
+        for segment in range(self.__segments):
+            points = sub_vectors[:, segment, :]
+            centers = points[random_state.choice(len(points), centroids, replace=False)].copy()
+            for _ in range(self.__iterations):
+                labels = self.__assign(points, centers)
+                counts = np.bincount(labels, minlength=centroids)
+                sums = np.zeros_like(centers)
+                np.add.at(sums, labels, points)
+                empty = counts == 0
+                centers[~empty] = sums[~empty] / counts[~empty, None]
+                # 空簇重新随机选择样本作为中心
+                if empty.any(): centers[empty] = points[random_state.choice(len(points), int(empty.sum()))]
+            codebooks[segment, :centroids] = centers
+            # 样本数少于聚类中心数时, 多余的中心复制已有中心
+            if centroids < self.__centroids: codebooks[segment, centroids:] = centers[0]
+
+        self.__codebooks = codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        sub_vectors = self.__split(vectors)
+        codes = np.empty((len(vectors), self.__segments), dtype=np.uint8)
+        for segment in range(self.__segments):
+            codes[:, segment] = self.__assign(sub_vectors[:, segment, :], self.__codebooks[segment])
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        近似内积(查表累加)
+        :param codes: 向量编码 (n, segments)
+        :param query: 问题向量 (dim,)
+        :return:
+        """
+        table = np.einsum('scd,sd->sc', self.__codebooks, query.reshape(self.__segments, self.__sub_dim).astype(np.float32))
+        codes = np.asarray(codes)
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for segment in range(self.__segments):
+            scores += table[segment, codes[:, segment]]
+        return scores
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {'codebooks': self.__codebooks}
+
+
+def create_quantizer(quantization: str, dim: int, pq_segments: int = 64, state: dict | None = None):
+    """
+    创建量化器
+    :param quantization: 量化类型 int8/pq
+    :param dim: 向量维度
+    :param pq_segments: pq 分段数
+    :param state: 已训练的量化参数(state() 的返回值), 为空时需要训练
+    :return:
+    """
+    state = state if state else {}
+    if quantization == 'int8':
+        return ScalarQuantizer(dim=dim, scale=state.get('scale'))
+    if quantization == 'pq':
+        codebooks = state.get('codebooks')
+        segments = codebooks.shape[0] if codebooks is not None else pq_segments
+        return ProductQuantizer(dim=dim, segments=segments, centroids=256, codebooks=codebooks)
+
+    raise ValueError(f'量化类型必须为【{"/".join(QUANTIZATION_TYPES)}】')
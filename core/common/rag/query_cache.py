@@ -0,0 +1,115 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from common.redis.redis_client import RedisClient
+
+
+class QueryCache:
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: int = 600,
+        redis_client: RedisClient | None = None,
+        key_prefix: str = 'sbg:query_cache'
+    ):
+        """
+        检索结果两级缓存: 进程内 LRU + 可选的 redis 共享缓存,
+        缓存键包含索引版本号, 索引写入/删除数据时版本号自增, 旧缓存自然失效
+        :param max_size: 进程内缓存最大条数
+        :param ttl: 缓存过期时间(单位: s)
+        :param redis_client: redis 客户端, 为空时仅使用进程内缓存
+        :param key_prefix: redis 缓存键前缀
+        """
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__redis_client = redis_client
+        self.__key_prefix = key_prefix
+        self.__lock = threading.Lock()
+        self.__local_cache: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+        self.__local_versions: dict[str, int] = {}
+        self.__stats = {'local_hits': 0, 'redis_hits': 0, 'misses': 0}
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """
+        缓存命中统计: {'local_hits': 进程内命中数, 'redis_hits': redis 命中数, 'misses': 未命中数}
+        """
+        return dict(self.__stats)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return re.sub(r'\s+', ' ', query).strip().lower()
+
+    def version(self, collection: str) -> int:
+        if self.__redis_client:
+            version = self.__redis_client.read_str([f'{self.__key_prefix}:version:{collection}'], type_trans_func=int)
+            return version[0] if version else 0
+
+        return self.__local_versions.get(collection, 0)
+
+    def bump_version(self, collection: str):
+        """
+        索引数据变化时自增版本号
+        :param collection: 索引名
+        :return:
+        """
+        if self.__redis_client:
+            self.__redis_client.instances.incr(f'{self.__key_prefix}:version:{collection}')
+
+        with self.__lock:
+            self.__local_versions[collection] = self.__local_versions.get(collection, 0) + 1
+
+    def make_key(
+        self,
+        collection: str,
+        tenant: str | None,
+        query: str,
+        alpha: float,
+        k: int,
+        rerank_topn: int,
+        is_rerank: bool
+    ) -> str:
+        query_hash = hashlib.sha256(self.normalize_query(query).encode('utf-8')).hexdigest()
+        version = self.version(collection)
+        return (f'{self.__key_prefix}:{collection}:{tenant or ""}:v{version}:'
+                f'{query_hash}:{alpha}:{k}:{rerank_topn if is_rerank else 0}')
+
+    def get(self, key: str) -> list[dict] | None:
+        with self.__lock:
+            cache_item = self.__local_cache.get(key)
+            if cache_item and cache_item[0] > time.time():
+                self.__local_cache.move_to_end(key)
+                self.__stats['local_hits'] += 1
+                return cache_item[1]
+            if cache_item: self.__local_cache.pop(key)
+
+        if self.__redis_client:
+            cache_values = self.__redis_client.read_str([key], type_trans_func=json.loads)
+            if cache_values:
+                self.__set_local(key, cache_values[0])
+                with self.__lock: self.__stats['redis_hits'] += 1
+                return cache_values[0]
+
+        with self.__lock: self.__stats['misses'] += 1
+        return None
+
+    def set(self, key: str, value: list[dict]):
+        self.__set_local(key, value)
+        if self.__redis_client:
+            self.__redis_client.save_str(key, json.dumps(value, ensure_ascii=False), time=self.__ttl)
+
+    def __set_local(self, key: str, value: list[dict]):
+        with self.__lock:
+            self.__local_cache[key] = (time.time() + self.__ttl, value)
+            self.__local_cache.move_to_end(key)
+            while len(self.__local_cache) > self.__max_size:
+                self.__local_cache.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__local_cache.clear()
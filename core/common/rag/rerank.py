@@ -1,9 +1,13 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
 
 from xinference.client import Client
 from xinference.client.restful.restful_client import RESTfulRerankModelHandle
 from xinference.types import Rerank
 
+from core.common.split_document.token_counter import token_counter
+
 class RerankClient:
 
     def __init__(self, base_url: str, model_uid: str):
@@ -19,6 +23,7 @@ class RerankClient:
         query: str,
         top_n: Optional[int] = None,
         max_chunks_per_doc: Optional[int] = None,
+        return_documents: bool = True,
         **kwargs
     ) -> Rerank:
         return self.__model.rerank(
@@ -26,10 +31,182 @@ class RerankClient:
             query=query,
             top_n=top_n,
             max_chunks_per_doc=max_chunks_per_doc,
-            return_documents=True,
+            return_documents=return_documents,
             return_len=True,
             **kwargs
         )
 
     def get_rerank_meta(self, rerank_result: Rerank) -> dict:
-        return rerank_result.get('meta', {})
\ No newline at end of file
+        return rerank_result.get('meta', {})
+
+
+class AdaptiveReranker:
+
+    def __init__(
+        self,
+        rerank_client: RerankClient,
+        max_length: int | None = None,
+        skip_margin: float | None = None,
+        max_pairs: int | None = None,
+        max_workers: int = 4,
+        tokenizer: str | None = None
+    ):
+        """
+        自适应重排, 参数为空时与直接调用重排模型一致:
+        1) 混合检索分数在第 top_n 个结果处已明显断开(与下一个结果的分差不小于 skip_margin * 最高分)时跳过重排;
+        2) 候选文本按重排模型最大长度(减去问题 token 数)截断后发送, 按下标返回原文, 不回传文档;
+        3) 多个问题的重排请求去重后在线程池中并发发送;
+        4) 单次检索请求最多重排 max_pairs 个 (问题, 候选) 对, 按问题均分, 每个问题保留混合检索分数最高的候选,
+           额度不足时靠后的问题不重排(保持混合检索顺序), 重排结果不足 top_n 时用未重排的候选补齐;
+        结果中 reranked 标记分数来源: True 为重排分数, False 为混合检索分数(跳过重排或补齐的候选), 两者不可直接比较
+        :param rerank_client: 重排模型客户端
+        :param max_length: 重排模型最大输入 token 数(问题 + 候选), 为空时不截断
+        :param skip_margin: 跳过重排的相对分差, 为空时不跳过
+        :param max_pairs: 单次检索请求的重排候选总数上限, 为空时不限制
+        :param max_workers: 最大并发重排请求数
+        :param tokenizer: 重排模型 tokenizer(需安装 tokenizers), 为空时使用近似 token 计数
+        """
+        self.__rerank_client = rerank_client
+        self.__max_length = max_length
+        self.__skip_margin = skip_margin
+        self.__max_pairs = max_pairs
+        self.__max_workers = max(max_workers, 1)
+        self.__token_counter = token_counter(tokenizer)
+        self.__lock = threading.Lock()
+        self.__stats = {'requests': 0, 'skipped': 0, 'pairs': 0, 'truncated': 0}
+
+    @property
+    def rerank_client(self) -> RerankClient:
+        return self.__rerank_client
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """
+        重排统计: {'requests': 重排请求数, 'skipped': 跳过重排的问题数, 'pairs': 重排候选总数, 'truncated': 截断的候选数}
+        """
+        return dict(self.__stats)
+
+    def __count(self, key: str, value: int = 1):
+        with self.__lock:
+            self.__stats[key] += value
+
+    def should_skip(self, candidates: list[dict], top_n: int) -> bool:
+        """
+        混合检索结果是否无需重排: 候选数不超过 top_n, 或第 top_n 个与第 top_n + 1 个结果的分差足够大
+        :param candidates: 按混合检索分数降序的候选 [{'score': 分数, 'content': 文本}]
+        :param top_n: 保留的结果个数
+        :return:
+        """
+        if self.__skip_margin is None: return False
+        if len(candidates) <= top_n: return True
+
+        scores = [candidate.get('score') or 0.0 for candidate in candidates]
+        return scores[top_n - 1] - scores[top_n] >= self.__skip_margin * max(abs(scores[0]), 1e-9)
+
+    def __allocate(self, sizes: list[int]) -> list[int]:
+        """
+        按问题均分重排候选总数, 候选少的问题剩余的额度分给其它问题, 均分后的余数按问题顺序(优先级)逐个分配,
+        总数不超过 max_pairs, 额度不足时靠后的问题分配 0 个
+        :param sizes: 每个问题的候选数(按优先级排序)
+        :return: 每个问题重排的候选数
+        """
+        if self.__max_pairs is None: return sizes
+
+        # 均分水位: 候选数不超过均分额度的问题全部重排, 其余问题按水位截断
+        level, remaining = max(sizes, default=0), max(self.__max_pairs, 0)
+        for position, size in enumerate(sorted(sizes)):
+            share = remaining // (len(sizes) - position)
+            if size > share:
+                level = share
+                break
+            remaining -= size
+
+        limits = [min(size, level) for size in sizes]
+        remaining = max(self.__max_pairs, 0) - sum(limits)
+        while remaining:
+            allocated = False
+            for index in range(len(sizes)):
+                if not remaining: break
+                if limits[index] >= sizes[index]: continue
+                limits[index] += 1
+                remaining -= 1
+                allocated = True
+            if not allocated: break
+        return limits
+
+    def __truncate(self, query: str, text: str) -> str:
+        if self.__max_length is None: return text
+
+        # 预留 [CLS]/[SEP] 等特殊 token
+        max_tokens = max(self.__max_length - self.__token_counter.count(query) - 4, 16)
+        truncated = self.__token_counter.truncate(text, max_tokens)
+        if len(truncated) < len(text): self.__count('truncated')
+        return truncated
+
+    def __rerank_one(self, query: str, candidates: list[dict], top_n: int) -> list[dict]:
+        self.__count('requests')
+        self.__count('pairs', len(candidates))
+        rerank_result = self.__rerank_client.rerank(
+            [self.__truncate(query, candidate['content']) for candidate in candidates],
+            query,
+            top_n=min(top_n, len(candidates)),
+            return_documents=False
+        )
+        return [
+            {'score': item.get('relevance_score'), 'content': candidates[item.get('index')]['content'], 'reranked': True}
+            for item in rerank_result.get('results', [])
+        ]
+
+    @staticmethod
+    def __unranked(candidates: list[dict]) -> list[dict]:
+        return [{**candidate, 'reranked': False} for candidate in candidates]
+
+    def rerank(self, query: str, candidates: list[dict], top_n: int = 5) -> list[dict]:
+        return self.rerank_many([query], [candidates], top_n=top_n)[0]
+
+    def rerank_many(self, queries: list[str], candidates_list: list[list[dict]], top_n: int = 5) -> list[list[dict]]:
+        """
+        批量重排
+        :param queries: 问题列表
+        :param candidates_list: 与 queries 顺序一致的混合检索结果 [[{'score': 分数, 'content': 文本}]]
+        :param top_n: 每个问题保留的结果个数
+        :return: 与 queries 顺序一致的重排结果, 格式同混合检索结果
+        """
+        candidates_list = [[candidate for candidate in candidates if candidate.get('content')] for candidates in candidates_list]
+        results: list[list[dict] | None] = [None] * len(queries)
+
+        pending = []
+        for index, candidates in enumerate(candidates_list):
+            if not candidates:
+                results[index] = []
+            elif self.should_skip(candidates, top_n):
+                results[index] = self.__unranked(candidates[:top_n])
+                self.__count('skipped')
+            else:
+                pending.append(index)
+        if not pending: return results
+
+        # 相同问题和候选只请求一次, 去重后再分配候选数
+        requests: dict[tuple, list[int]] = {}
+        for index in pending:
+            request_key = (queries[index], tuple(candidate['content'] for candidate in candidates_list[index]))
+            requests.setdefault(request_key, []).append(index)
+        request_indexes = list(requests.values())
+        limits = self.__allocate([len(candidates_list[indexes[0]]) for indexes in request_indexes])
+
+        def rerank_request(indexes: list[int], limit: int) -> list[dict]:
+            # 未分配到重排额度的问题保持混合检索顺序
+            if not limit:
+                self.__count('skipped', len(indexes))
+                return []
+            return self.__rerank_one(queries[indexes[0]], candidates_list[indexes[0]][:limit], top_n)
+
+        with ThreadPoolExecutor(max_workers=min(self.__max_workers, len(request_indexes))) as executor:
+            for indexes, limit, reranked in zip(
+                request_indexes, limits, executor.map(rerank_request, request_indexes, limits)
+            ):
+                rest = self.__unranked(candidates_list[indexes[0]][limit:][:max(top_n - len(reranked), 0)])
+                for index in indexes:
+                    results[index] = reranked + [dict(candidate) for candidate in rest]
+
+        return results
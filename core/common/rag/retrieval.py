@@ -0,0 +1,85 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Callable
+
+from pydantic import BaseModel, Field
+
+
+class RetrievalResult(BaseModel):
+    refer: dict[str, dict[str, list[str]]] = Field(default_factory=dict, description='检索结果 {检索源: {问题: [参考资料]}}')
+    partial: dict[str, list[str]] = Field(default_factory=dict, description='截止时间内未完成的问题 {检索源: [问题]}')
+    errors: dict[str, dict[str, str]] = Field(default_factory=dict, description='检索异常 {检索源: {问题: 异常原因}}')
+    total_time: float = Field(default=0.0, description='总耗时(单位: s)')
+
+    @property
+    def is_partial(self) -> bool:
+        return any(self.partial.values())
+
+
+class RetrievalOrchestrator:
+
+    def __init__(self, max_workers: int = 8, deadline: float = 15):
+        """
+        检索编排: 所有 问题 x 检索源 在有界线程池中并发执行, 超过截止时间后返回已完成的结果, 未完成的问题标记为部分结果;
+        超时的检索不会被中断(由检索源自身的请求超时结束), 只是不再等待其结果
+        :param max_workers: 最大并发检索数
+        :param deadline: 默认截止时间(单位: s)
+        """
+        self.__deadline = deadline
+        self.__executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix='retrieval')
+
+    def retrieve(
+        self,
+        queries: list[str],
+        sources: dict[str, Callable[[str], list[str]]] | None = None,
+        deadline: float | None = None,
+        batch_sources: dict[str, Callable[[list[str]], list[list[str]]]] | None = None
+    ) -> RetrievalResult:
+        """
+        并发检索
+        :param queries: 问题列表
+        :param sources: 检索源 {检索源名: 检索函数(问题) -> [参考资料]}
+        :param deadline: 截止时间(单位: s), 为空时使用初始化配置
+        :param batch_sources: 批量检索源 {检索源名: 检索函数([问题]) -> [[参考资料]]}, 所有问题作为一个任务执行,
+                              超时/异常时所有问题一起标记
+        :return: 检索结果, refer 中问题顺序与 queries 一致, 未完成/异常的问题不在 refer 中
+        """
+        s_time = time.time()
+        queries = list(dict.fromkeys(queries))
+        sources, batch_sources = sources or {}, batch_sources or {}
+        futures: dict[tuple[str, str], Future] = {
+            (source_name, query): self.__executor.submit(search_func, query)
+            for source_name, search_func in sources.items()
+            for query in queries
+        }
+        batch_futures: dict[str, Future] = {
+            source_name: self.__executor.submit(search_func, queries)
+            for source_name, search_func in batch_sources.items()
+        }
+        wait([*futures.values(), *batch_futures.values()], timeout=deadline if deadline is not None else self.__deadline)
+
+        result = RetrievalResult(refer={source_name: {} for source_name in [*sources, *batch_sources]})
+        for (source_name, query), future in futures.items():
+            if not future.done():
+                # 未开始执行的检索直接取消, 释放线程池
+                future.cancel()
+                result.partial.setdefault(source_name, []).append(query)
+            elif future.exception():
+                result.errors.setdefault(source_name, {})[query] = str(future.exception())
+            else:
+                result.refer[source_name][query] = future.result()
+
+        for source_name, future in batch_futures.items():
+            if not future.done():
+                future.cancel()
+                result.partial[source_name] = list(queries)
+            elif future.exception():
+                result.errors[source_name] = {query: str(future.exception()) for query in queries}
+            else:
+                result.refer[source_name] = dict(zip(queries, future.result()))
+
+        result.total_time = time.time() - s_time
+        return result
+
+    def close(self):
+        self.__executor.shutdown(wait=False, cancel_futures=True)
@@ -1,25 +1,32 @@
-from pathlib import Path
-from typing import Optional, Dict, Union, List
+import datetime
+import threading
+from typing import Optional, Dict, List
 
 import weaviate
-from langchain_community.embeddings import XinferenceEmbeddings
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_weaviate import WeaviateVectorStore
 from weaviate.auth import AuthCredentials
+from weaviate.collections.classes.config import _BQConfig, _PQConfig, _SQConfig
 from weaviate.collections.classes.filters import _Filters
 from weaviate.config import AdditionalConfig
 from weaviate.classes.query import Filter
+from weaviate.classes.data import DataObject
 
-from core.common.format_result.format_result import vector_results, transform_rerank_texts, transform_rerank_results
-from core.common.rag.rerank import RerankClient
-from core.common.load_document.load_document import LoadDocument
-from core.common.split_document.split_document import SplitDocument
+from core.common.rag.base_vector_store import BaseVectorStore, IndexStats
+from core.common.rag.query_cache import QueryCache
+from core.common.rag.rerank import RerankClient, AdaptiveReranker
+from core.common.rag.weaviate_pool import acquire_pool, release_pool
 
-class WeaviateClient:
+# weaviate 向量压缩类型
+WEAVIATE_QUANTIZATION_TYPES = ['none', 'pq', 'bq', 'sq']
+
+
+class WeaviateClient(BaseVectorStore):
 
     def __init__(
         self,
-        embedding_client: XinferenceEmbeddings = None,
+        embedding_client: Embeddings = None,
         rerank_client: RerankClient = None,
         host: str = "localhost",
         port: int = 8080,
@@ -28,6 +35,12 @@ class WeaviateClient:
         additional_config: Optional[AdditionalConfig] = None,
         skip_init_checks: bool = False,
         auth_credentials: Optional[AuthCredentials] = None,
+        query_cache: QueryCache | None = None,
+        quantization: dict | None = None,
+        collection_quantization: dict[str, dict] | None = None,
+        pool_size: int = 2,
+        health_check_interval: float = 30,
+        reranker: AdaptiveReranker | None = None,
     ):
         """
 
@@ -40,50 +53,190 @@ class WeaviateClient:
         :param additional_config:
         :param skip_init_checks:
         :param auth_credentials:
+        :param query_cache: 检索结果缓存, 为空时不缓存
+        :param reranker: 自适应重排, 为空时使用 rerank_client 直接重排
+        :param quantization: 新建索引时的向量压缩配置, 如: {'type': 'pq', 'segments': 0, 'centroids': 256, 'training_limit': 100000};
+            type 为 none/pq/bq/sq, 为空时不压缩; 已存在的索引不会修改
+        :param collection_quantization: 按索引名单独设置的向量压缩配置 {索引名: 压缩配置}, 优先于 quantization
+        :param pool_size: 连接池客户端数, 相同 (host, port, grpc_port) 的实例共享连接池(仅第一个实例的连接参数生效)
+        :param health_check_interval: 连接健康检查间隔(单位: s), 连接断开时自动重连
         """
-        self.__rerank_client = rerank_client
-        self.__embedding_client = embedding_client
-        self.__db: WeaviateVectorStore | None = None
-        self.__dbs: list[WeaviateVectorStore] = []
-        self.__client = weaviate.connect_to_local(
+        for config in [quantization, *(collection_quantization or {}).values()]:
+            if config and config.get('type', 'none') not in WEAVIATE_QUANTIZATION_TYPES:
+                raise ValueError(f'weaviate 向量压缩类型必须为【{"/".join(WEAVIATE_QUANTIZATION_TYPES)}】')
+
+        super().__init__(
+            embedding_client=embedding_client, rerank_client=rerank_client, query_cache=query_cache, reranker=reranker
+        )
+        # 当前检索的索引句柄按线程保存, 并发请求检索不同工作区时互不影响
+        self.__local = threading.local()
+        # 索引句柄缓存 {(客户端下标, 索引名, 是否多租户): 句柄}, 同一索引的不同租户通过检索参数区分, 共用句柄
+        self.__stores: dict[tuple[int, str, bool], WeaviateVectorStore] = {}
+        self.__stores_lock = threading.Lock()
+        self.__quantization = quantization or {}
+        self.__collection_quantization = collection_quantization or {}
+        self.__pool = acquire_pool(
             host=host,
             port=port,
             grpc_port=grpc_port,
+            pool_size=pool_size,
+            health_check_interval=health_check_interval,
             headers=headers,
             additional_config=additional_config,
             skip_init_checks=skip_init_checks,
             auth_credentials=auth_credentials
         )
+        self.__closed = False
 
     @property
-    def client(self):
-        return self.__client
+    def client(self) -> weaviate.WeaviateClient:
+        return self.__pool.get()[1]
 
     @property
     def collections(self):
-        return self.__client.collections
+        return self.client.collections
+
+    @property
+    def __db(self) -> WeaviateVectorStore | None:
+        return getattr(self.__local, 'db', None)
+
+    @property
+    def index_name(self) -> str | None:
+        return getattr(self.__local, 'index_name', None)
 
     @property
     def collection_keys(self) -> list:
-        return list(self.__client.collections.list_all().keys())
+        return self.all_collections()
+
+    def get_store(self, index_name: str, tenant: str | None = None) -> WeaviateVectorStore:
+        """
+        获取索引对应的向量库句柄(索引不存在时创建空索引), 不写入任何数据
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :return:
+        """
+        store = self.__get_store(index_name=index_name, tenant=tenant)
+        self.__local.db = store
+        self.__local.index_name = index_name
+
+        return store
+
+    def __get_store(self, index_name: str, tenant: str | None = None) -> WeaviateVectorStore:
+        """
+        从缓存获取索引句柄(不存在时创建), 不修改当前线程的索引
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :return:
+        """
+        slot, client = self.__pool.get()
+        store_key = (slot, index_name, tenant is not None)
+        store = self.__stores.get(store_key)
+        if store is None:
+            with self.__stores_lock:
+                store = self.__stores.get(store_key)
+                if store is None:
+                    is_new = not client.collections.exists(index_name)
+                    if is_new: self.__create_collection(client=client, index_name=index_name, tenant=tenant)
+                    store = self.__stores[store_key] = WeaviateVectorStore(
+                        client=client,
+                        index_name=index_name,
+                        text_key='text',
+                        embedding=self.embedding_client,
+                        use_multi_tenancy=tenant is not None
+                    )
+                    # 同名索引被(其它进程)删除后重新创建, 旧索引的检索缓存失效
+                    if is_new and self.query_cache: self.query_cache.bump_version(index_name)
+        return store
+
+    def __evict_stores(self, index_name: str | None = None):
+        """
+        删除索引后清除句柄缓存(句柄只在创建时建索引), 下次获取时重新创建索引和句柄
+        :param index_name: 索引名, 为空时清除全部
+        :return:
+        """
+        with self.__stores_lock:
+            for store_key in [key for key in self.__stores if index_name is None or key[1] == index_name]:
+                del self.__stores[store_key]
 
-    def load_file(
+    def __vector_index_config(self, index_name: str) -> dict | None:
+        """
+        索引的 HNSW 向量压缩配置(weaviate schema 格式)
+        :param index_name: 索引名
+        :return: 不压缩时返回 None
+        """
+        config = self.__collection_quantization.get(index_name, self.__quantization)
+        quantization = config.get('type', 'none')
+        if quantization == 'pq':
+            return {'pq': {
+                'enabled': True,
+                # segments 为 0 时由 weaviate 按向量维度自动设置
+                'segments': config.get('segments', 0),
+                'centroids': config.get('centroids', 256),
+                'trainingLimit': config.get('training_limit', 100000),
+                'encoder': {'type': 'kmeans', 'distribution': 'log-normal'}
+            }}
+        if quantization == 'bq':
+            return {'bq': {'enabled': True, 'rescoreLimit': config.get('rescore_limit', -1)}}
+        if quantization == 'sq':
+            return {'sq': {
+                'enabled': True,
+                'trainingLimit': config.get('training_limit', 100000),
+                'rescoreLimit': config.get('rescore_limit', 20)
+            }}
+        return None
+
+    def __create_collection(self, client: weaviate.WeaviateClient, index_name: str, tenant: str | None = None):
+        """
+        按向量压缩配置创建索引(schema 与 langchain 默认一致), 未配置压缩时由 langchain 创建
+        :param client: weaviate 客户端
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :return:
+        """
+        vector_index_config = self.__vector_index_config(index_name)
+        if not vector_index_config: return
+
+        use_multi_tenancy = tenant is not None
+        client.collections.create_from_dict({
+            'class': index_name,
+            'properties': [{'name': 'text', 'dataType': ['text']}],
+            'MultiTenancyConfig': {
+                'enabled': use_multi_tenancy,
+                'autoTenantCreation': use_multi_tenancy,
+                'autoTenantActivation': use_multi_tenancy
+            },
+            'vectorIndexType': 'hnsw',
+            'vectorIndexConfig': vector_index_config
+        })
+
+    def insert_vectors(
         self,
-        file_path: Union[str, Path],
-        file_type: str,
-        chunk_size: int = 200,
-        chunk_overlap: int = 10,
-        separators: list = ['\n', ' ']
-    ):
-        loader = LoadDocument(
-            file_path=file_path,
-            file_type=file_type
-        )
-        docs = loader.load()
-        spliter = SplitDocument(file_type=file_type, chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=separators)
-        split_docs = spliter.split_documents(docs)
+        split_docs: List[Document],
+        vectors: List[List[float]],
+        index_name: str,
+        tenant: str | None = None,
+    ) -> dict:
+        """
+        通过 weaviate gRPC 批量写入接口写入已向量化的切片
+        :param split_docs: 切片数据, 切片 id 不为空时作为 uuid(相同 uuid 覆盖写入)
+        :param vectors: 切片对应的向量
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :return: 写入失败的切片 {切片下标: 失败原因}
+        """
+        collection = self.collections.get(index_name)
+        if tenant: collection = collection.with_tenant(tenant)
+
+        data_objects = []
+        for split_doc, vector in zip(split_docs, vectors):
+            properties = {'text': split_doc.page_content}
+            for key, val in split_doc.metadata.items():
+                properties[key] = val.isoformat() if isinstance(val, datetime.datetime) else val
+            data_objects.append(DataObject(properties=properties, vector=vector, uuid=split_doc.id))
 
-        return split_docs
+        insert_result = collection.data.insert_many(data_objects)
+        if self.query_cache: self.query_cache.bump_version(index_name)
+        return {index: error.message for index, error in insert_result.errors.items()}
 
     def init_vector(
         self,
@@ -103,75 +256,137 @@ class WeaviateClient:
         """
         if uuids: kwargs['uuids'] = uuids
 
-        self.__db = WeaviateVectorStore.from_documents(
-            split_docs,
-            embedding=self.__embedding_client,
-            client=self.__client,
-            index_name=index_name,
+        store = self.get_store(index_name=index_name, tenant=tenant)
+        if not split_docs: return store
+
+        store.add_texts(
+            [split_doc.page_content for split_doc in split_docs],
+            [split_doc.metadata for split_doc in split_docs],
             tenant=tenant,
             **kwargs
         )
-        self.__dbs.append(self.__db)
+        if self.query_cache: self.query_cache.bump_version(index_name)
 
-        return self.__db
+        return store
 
-    # [todo] 以后需要统一wrap验证
-    # [todo] 该结果之后用 pydantic 表示, 并封装对应输出格式的方法
-    def search(
+    def similarity_search(
         self,
         query: str,
-        alpha = 0.75,
+        query_vector: list[float] | None = None,
+        alpha: float = 0.75,
         k: int = 5,
-        rerank_topn: int = 5,
-        is_rerank: bool = False,
         filter: _Filters | None = None,
         tenant: str | None = None,
-    ) -> list[dict]:
+        index_name: str | None = None
+    ) -> list[tuple[Document, float]]:
         """
-        查询向量数据库数据, 返回可信度最高的 k 个结果
+        weaviate 混合检索
         :param query: 需要查询的问题
-        :param alpha: 向量和关键字比重, 范围: [0,1], 1 表示完全使用向量, 默认值 0.75
+        :param query_vector: 问题向量, 为空时由 langchain 调用嵌入模型向量化
+        :param alpha: 向量和关键字比重, 范围: [0,1], 1 表示完全使用向量
         :param k: 需要返回的结果个数
-        :param rerank_topn: rerank 需要返回的结果个数
-        :param is_rerank: 查询结果是否再次使用 rerank 结果
         :param filter: weaviate 过滤表达式
-        :return:
+        :param tenant: 租户名
+        :param index_name: 索引名, 为空时使用当前线程的索引(get_store/init_vector 设置)
+        :return: [(切片, 分数)]
         """
-        if not self.__db:
+        db = self.__get_store(index_name=index_name, tenant=tenant) if index_name else self.__db
+        if not db:
             raise Exception('Weaviate 向量数据库未加载向量!!')
 
-        # similarity_search_with_score 返回的结果分数越小可信度越高
-        docs = self.__db.similarity_search_with_score(query, alpha=alpha, k=k, filters=filter, tenant=tenant)
-        search_results = vector_results(docs)
+        kwargs = {'vector': query_vector} if query_vector is not None else {}
+        return db.similarity_search_with_score(query, alpha=alpha, k=k, filters=filter, tenant=tenant, **kwargs)
 
-        if is_rerank and self.__rerank_client:
-            search_results = transform_rerank_results(self.rerank(query=query, vector_results=search_results, top_n=rerank_topn))
+    def delete_by_ids(self, index_name: str, uuids: list[str], tenant: str | None = None, batch_size: int = 1000) -> int:
+        """
+        按 uuid 删除索引中的切片
+        :param index_name: 索引名
+        :param uuids: 需要删除的切片 uuid 列表
+        :param tenant: 租户名
+        :param batch_size: 单次删除的 uuid 数
+        :return: 删除成功的切片数
+        """
+        if not uuids or index_name not in self.all_collections(): return 0
+
+        collection = self.collections.get(index_name)
+        if tenant: collection = collection.with_tenant(tenant)
+
+        delete_count = 0
+        for index in range(0, len(uuids), batch_size):
+            delete_result = collection.data.delete_many(
+                where=Filter.by_id().contains_any(uuids[index: index + batch_size])
+            )
+            delete_count += delete_result.successful
+
+        if self.query_cache: self.query_cache.bump_version(index_name)
+        return delete_count
+
+    def index_stats(self, index_name: str, tenant: str | None = None, k: int = 10, samples: int = 100) -> IndexStats:
+        """
+        工作区索引的内存占用估算和召回率;
+        内存按压缩编码 + HNSW 图连接(每个向量 max_connections * 10 字节)估算, 召回率为自召回率: 抽样切片使用自身向量检索, 统计自身出现在前 k 个结果的比例
+        :param index_name: 索引名
+        :param tenant: 租户名
+        :param k: 召回率计算的检索个数
+        :param samples: 抽样切片数, 为0时不计算召回率
+        :return:
+        """
+        stats = IndexStats(index_name=index_name, tenant=tenant, k=k)
+        if index_name not in self.all_collections(): return stats
+
+        collection = self.collections.get(index_name)
+        vector_index_config = collection.config.get().vector_index_config
+        if tenant: collection = collection.with_tenant(tenant)
+
+        stats.count = collection.aggregate.over_all(total_count=True).total_count or 0
+        sample_objects = collection.query.fetch_objects(limit=max(samples, 1), include_vector=True).objects
+        sample_vectors = [(obj.uuid, obj.vector.get('default')) for obj in sample_objects if obj.vector.get('default')]
+        if not sample_vectors: return stats
 
-        return search_results
+        stats.dim = len(sample_vectors[0][1])
+        stats.vector_bytes = stats.count * stats.dim * 4
+        quantizer = getattr(vector_index_config, 'quantizer', None)
+        if isinstance(quantizer, _PQConfig):
+            stats.quantization, code_size = 'pq', quantizer.segments or stats.dim // 4
+        elif isinstance(quantizer, _BQConfig):
+            stats.quantization, code_size = 'bq', (stats.dim + 7) // 8
+        elif isinstance(quantizer, _SQConfig):
+            stats.quantization, code_size = 'sq', stats.dim
+        else:
+            code_size = stats.dim * 4
+        max_connections = getattr(vector_index_config, 'max_connections', None) or 32
+        stats.memory_bytes = stats.count * (code_size + max_connections * 10)
 
-    def rerank(self, query: str, vector_results: list[dict], top_n: int = 5) -> list[dict]:
-        if not self.__rerank_client: return vector_results
-        rerank_texts = transform_rerank_texts(vector_results)
-        return self.__rerank_client.rerank(rerank_texts, query, top_n=top_n).get('results', [])
+        if samples > 0:
+            hits = 0
+            for object_uuid, vector in sample_vectors[:samples]:
+                results = collection.query.near_vector(near_vector=vector, limit=k).objects
+                hits += any(result.uuid == object_uuid for result in results)
+            stats.recall_at_k = hits / len(sample_vectors[:samples])
+
+        return stats
 
     def delete_collection(self, collection_name: str):
-        self.__client.collections.delete(collection_name)
+        self.collections.delete(collection_name)
+        self.__evict_stores(collection_name)
+        if self.query_cache: self.query_cache.bump_version(collection_name)
 
     def clear_collections(self):
-        self.__client.collections.delete_all()
+        collection_names = self.all_collections() if self.query_cache else []
+        self.collections.delete_all()
+        self.__evict_stores()
+        for collection_name in collection_names:
+            self.query_cache.bump_version(collection_name)
 
     def all_collections(self) -> list:
-        return list(self.__client.collections.list_all().keys())
+        return list(self.collections.list_all().keys())
 
     def close(self):
         """
-        关闭 weaviate 连接防止内存溢出
+        释放连接池引用, 共享连接池的实例全部关闭后断开 weaviate 连接
         :return:
         """
-        self.__client.close()
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.close()
\ No newline at end of file
+        if self.__closed: return
+        self.__closed = True
+        self.__evict_stores()
+        release_pool(self.__pool)
@@ -0,0 +1,149 @@
+import itertools
+import threading
+import time
+from typing import Optional, Dict
+
+import weaviate
+from weaviate.auth import AuthCredentials
+from weaviate.config import AdditionalConfig
+
+
+class WeaviateConnectionPool:
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 8080,
+        grpc_port: int = 50051,
+        pool_size: int = 2,
+        health_check_interval: float = 30,
+        headers: Optional[Dict[str, str]] = None,
+        additional_config: Optional[AdditionalConfig] = None,
+        skip_init_checks: bool = False,
+        auth_credentials: Optional[AuthCredentials] = None
+    ):
+        """
+        weaviate 连接池: 保持 pool_size 个长连接客户端(weaviate 同步客户端线程安全, 请求按轮询分配到各客户端);
+        获取客户端时距上次健康检查超过 health_check_interval 秒则检查连接, 断开时在原客户端对象上重连, 已创建的索引句柄继续可用
+        :param host: weaviate 地址
+        :param port: weaviate http 端口
+        :param grpc_port: weaviate grpc 端口
+        :param pool_size: 客户端数
+        :param health_check_interval: 健康检查间隔(单位: s)
+        :param headers:
+        :param additional_config:
+        :param skip_init_checks:
+        :param auth_credentials:
+        """
+        self.__key = (host, port, grpc_port)
+        self.__health_check_interval = health_check_interval
+        self.__clients: list[weaviate.WeaviateClient] = [
+            weaviate.connect_to_local(
+                host=host,
+                port=port,
+                grpc_port=grpc_port,
+                headers=headers,
+                additional_config=additional_config,
+                skip_init_checks=skip_init_checks,
+                auth_credentials=auth_credentials
+            )
+            for _ in range(max(pool_size, 1))
+        ]
+        self.__checked_at = [time.time()] * len(self.__clients)
+        self.__slot_locks = [threading.Lock() for _ in self.__clients]
+        self.__cursor = itertools.count()
+        self.__refs = 0
+
+    @property
+    def key(self) -> tuple[str, int, int]:
+        return self.__key
+
+    @property
+    def size(self) -> int:
+        return len(self.__clients)
+
+    def get(self) -> tuple[int, weaviate.WeaviateClient]:
+        """
+        轮询获取健康的客户端
+        :return: (客户端下标, 客户端)
+        """
+        slot = next(self.__cursor) % len(self.__clients)
+        return slot, self.client(slot)
+
+    def client(self, slot: int) -> weaviate.WeaviateClient:
+        """
+        获取指定下标的客户端, 需要健康检查时检查连接并自动重连
+        :param slot: 客户端下标
+        :return:
+        """
+        client = self.__clients[slot]
+        if client.is_connected() and time.time() - self.__checked_at[slot] < self.__health_check_interval:
+            return client
+
+        with self.__slot_locks[slot]:
+            if client.is_connected() and time.time() - self.__checked_at[slot] < self.__health_check_interval:
+                return client
+
+            try:
+                is_live = client.is_connected() and client.is_live()
+            except Exception:
+                is_live = False
+            if not is_live:
+                try:
+                    client.close()
+                except Exception:
+                    pass
+                client.connect()
+            self.__checked_at[slot] = time.time()
+
+        return client
+
+    def retain(self) -> int:
+        self.__refs += 1
+        return self.__refs
+
+    def release(self) -> int:
+        self.__refs -= 1
+        return self.__refs
+
+    def close(self):
+        for client in self.__clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+
+# 进程内共享的连接池 {(host, port, grpc_port): 连接池}
+WEAVIATE_POOLS: dict[tuple[str, int, int], WeaviateConnectionPool] = {}
+WEAVIATE_POOLS_LOCK = threading.Lock()
+
+
+def acquire_pool(host: str = "localhost", port: int = 8080, grpc_port: int = 50051, **pool_kwargs) -> WeaviateConnectionPool:
+    """
+    获取 (host, port, grpc_port) 对应的共享连接池, 不存在时创建; 使用完需调用 release_pool
+    :param host: weaviate 地址
+    :param port: weaviate http 端口
+    :param grpc_port: weaviate grpc 端口
+    :param pool_kwargs: WeaviateConnectionPool 其它参数(仅创建连接池时生效)
+    :return:
+    """
+    key = (host, port, grpc_port)
+    with WEAVIATE_POOLS_LOCK:
+        pool = WEAVIATE_POOLS.get(key)
+        if pool is None:
+            pool = WEAVIATE_POOLS[key] = WeaviateConnectionPool(host=host, port=port, grpc_port=grpc_port, **pool_kwargs)
+        pool.retain()
+    return pool
+
+
+def release_pool(pool: WeaviateConnectionPool):
+    """
+    释放连接池引用, 没有引用时关闭所有连接
+    :param pool: 连接池
+    :return:
+    """
+    with WEAVIATE_POOLS_LOCK:
+        if pool.release() > 0: return
+        if WEAVIATE_POOLS.get(pool.key) is pool: WEAVIATE_POOLS.pop(pool.key)
+    pool.close()
@@ -0,0 +1,60 @@
+import httpx
+
+from core.common.rag.base_web_search import BaseWebSearch
+from core.common.rag.web_search_cache import WebSearchCache
+
+TAVILY_API_URL = 'https://api.tavily.com'
+
+
+class TavilySearch(BaseWebSearch):
+
+    name = 'tavily'
+
+    def __init__(
+        self,
+        api_key: str,
+        max_results: int = 2,
+        max_chars: int | None = None,
+        cache: WebSearchCache | None = None,
+        search_depth: str = 'basic',
+        timeout: float = 10,
+        max_connections: int = 8,
+        base_url: str = TAVILY_API_URL
+    ):
+        """
+        tavily 网页搜索: 所有请求共用一个 httpx 客户端(线程安全, 复用 TCP/TLS 连接), 替代每次搜索新建连接的 TavilySearchResults
+        :param api_key: tavily 搜索引擎 api_key
+        :param max_results: 每个问题返回的结果个数
+        :param max_chars: 摘要最大字符数, 为空时不截断
+        :param cache: 搜索结果缓存, 为空时不缓存
+        :param search_depth: 搜索深度 basic/advanced
+        :param timeout: 单次请求超时时间(单位: s)
+        :param max_connections: 最大连接数(不小于检索并发数)
+        :param base_url: tavily 接口地址
+        """
+        super().__init__(max_results=max_results, max_chars=max_chars, cache=cache)
+        self.__api_key = api_key
+        self.__search_depth = search_depth
+        self.__client = httpx.Client(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    def fetch(self, query: str, max_results: int) -> list[dict]:
+        response = self.__client.post('/search', json={
+            'api_key': self.__api_key,
+            'query': query,
+            'max_results': max_results,
+            'search_depth': self.__search_depth
+        })
+        response.raise_for_status()
+
+        return [
+            {'title': item.get('title', ''), 'url': item.get('url', ''), 'content': item.get('content', '')}
+            for item in response.json().get('results', [])
+        ]
+
+    def close(self):
+        self.__client.close()
+        super().close()
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+class WebSearchCache:
+
+    def __init__(self, db_path: str | None = None, ttl: int = 86400, max_size_mb: int = 256):
+        """
+        本地持久化网页搜索结果缓存, 以 (搜索源, 结果个数, 归一化问题) 为键, 过期后重新搜索, 超出容量时按最近访问时间淘汰
+        :param db_path: sqlite 缓存文件地址, 默认 ../data/web_search_cache.db
+        :param ttl: 缓存过期时间(单位: s), 0 表示不过期
+        :param max_size_mb: 缓存最大占用空间(单位: MB)
+        """
+        project_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+        self.__db_path = db_path if db_path else os.path.join(project_path, 'data', 'web_search_cache.db')
+        self.__ttl = ttl
+        self.__max_size = max_size_mb * 1024 * 1024
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.__db_path)), exist_ok=True)
+        self.__conn = sqlite3.connect(self.__db_path, check_same_thread=False)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        self.__conn.execute(
+            'CREATE TABLE IF NOT EXISTS web_search ('
+            'provider TEXT NOT NULL, query_hash TEXT NOT NULL, query TEXT NOT NULL, results TEXT NOT NULL, '
+            'size INTEGER NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (provider, query_hash))'
+        )
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_web_search_last_access ON web_search (last_access)')
+        self.__conn.commit()
+        self.__total_size = self.__conn.execute('SELECT COALESCE(SUM(size), 0) FROM web_search').fetchone()[0]
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    @property
+    def total_size(self) -> int:
+        return self.__total_size
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """
+        问题归一化: 全角转半角、合并空白、转小写, 如: 'Python  读取Excel' -> 'python 读取excel'
+        :param query:
+        :return:
+        """
+        return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', query)).strip().lower()
+
+    def query_hash(self, query: str, max_results: int) -> str:
+        return hashlib.sha256(f'{max_results}:{self.normalize_query(query)}'.encode('utf-8')).hexdigest()
+
+    def get(self, provider: str, query: str, max_results: int) -> list[dict] | None:
+        """
+        读取缓存的搜索结果
+        :param provider: 搜索源名
+        :param query: 搜索问题
+        :param max_results: 结果个数
+        :return: 未命中或已过期时返回 None
+        """
+        query_hash = self.query_hash(query, max_results)
+        now = time.time()
+
+        with self.__lock:
+            row = self.__conn.execute(
+                'SELECT results, size, created_at FROM web_search WHERE provider = ? AND query_hash = ?',
+                [provider, query_hash]
+            ).fetchone()
+            # 只在删除过期结果或更新访问时间后提交, 未命中时不产生写事务
+            if row and self.__ttl and now - row[2] > self.__ttl:
+                self.__conn.execute('DELETE FROM web_search WHERE provider = ? AND query_hash = ?', [provider, query_hash])
+                self.__conn.commit()
+                self.__total_size -= row[1]
+                row = None
+            elif row:
+                self.__conn.execute(
+                    'UPDATE web_search SET last_access = ? WHERE provider = ? AND query_hash = ?',
+                    [now, provider, query_hash]
+                )
+                self.__conn.commit()
+
+        if not row:
+            self.__misses += 1
+            return None
+
+        self.__hits += 1
+        return json.loads(row[0])
+
+    def put(self, provider: str, query: str, max_results: int, results: list[dict]):
+        """
+        写入搜索结果, 超出容量时淘汰最久未访问的结果
+        :param provider: 搜索源名
+        :param query: 搜索问题
+        :param max_results: 结果个数
+        :param results: 搜索结果
+        :return:
+        """
+        query_hash = self.query_hash(query, max_results)
+        results_text = json.dumps(results, ensure_ascii=False)
+        size = len(results_text.encode('utf-8'))
+        now = time.time()
+
+        with self.__lock:
+            row = self.__conn.execute(
+                'SELECT size FROM web_search WHERE provider = ? AND query_hash = ?', [provider, query_hash]
+            ).fetchone()
+            if row: self.__total_size -= row[0]
+
+            self.__conn.execute(
+                'INSERT OR REPLACE INTO web_search VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [provider, query_hash, self.normalize_query(query), results_text, size, now, now]
+            )
+            self.__total_size += size
+
+            if self.__total_size > self.__max_size: self.__evict()
+            self.__conn.commit()
+
+    def __evict(self):
+        """
+        先删除已过期的结果, 再淘汰最久未访问的结果, 直到占用空间低于最大容量的 90%
+        :return:
+        """
+        if self.__ttl:
+            self.__conn.execute('DELETE FROM web_search WHERE created_at < ?', [time.time() - self.__ttl])
+            self.__total_size = self.__conn.execute('SELECT COALESCE(SUM(size), 0) FROM web_search').fetchone()[0]
+
+        target_size = self.__max_size * 0.9
+        while self.__total_size > target_size:
+            rows = self.__conn.execute(
+                'SELECT provider, query_hash, size FROM web_search ORDER BY last_access LIMIT 1000'
+            ).fetchall()
+            if not rows: break
+
+            evict_rows = []
+            for provider, query_hash, size in rows:
+                evict_rows.append((provider, query_hash))
+                self.__total_size -= size
+                if self.__total_size <= target_size: break
+
+            self.__conn.executemany('DELETE FROM web_search WHERE provider = ? AND query_hash = ?', evict_rows)
+
+    def clear(self):
+        with self.__lock:
+            self.__conn.execute('DELETE FROM web_search')
+            self.__conn.commit()
+            self.__total_size = 0
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
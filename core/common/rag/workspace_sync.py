@@ -0,0 +1,324 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Iterable, Iterator, Union
+
+from langchain_core.documents import Document
+from pydantic import BaseModel, Field
+
+from common.file.file_walker import FileIndex, FileWalker
+from common.file.hash_file import calculate_file_hash
+from common.logger.logging import Logger
+from core.common.rag.ingest import IngestPipeline, IngestReport
+
+logger = Logger.get_instance(__file__)
+
+# 切片 uuid 命名空间, 同一文件中相同内容第 n 次出现的切片 uuid 固定(与切片位置无关)
+CHUNK_NAMESPACE = uuid.UUID('6f1d3c1e-1f5b-4a52-9d0c-3b9a6c2f5e71')
+# 清单版本, 切片 uuid 规则变化时递增, 旧版本清单记录的切片删除后重新写入
+MANIFEST_VERSION = 2
+
+
+class SyncReport(BaseModel):
+    added_files: list[str] = Field(default_factory=list, description='新增文件')
+    updated_files: list[str] = Field(default_factory=list, description='修改文件')
+    removed_files: list[str] = Field(default_factory=list, description='删除文件')
+    unchanged_files: int = Field(default=0, description='未修改文件数')
+    deleted_chunks: int = Field(default=0, description='删除切片数')
+    rewritten_chunks: int = Field(default=0, description='重复切片的保留副本被删除后重新写入的切片数')
+    ingest: IngestReport = Field(default_factory=IngestReport, description='切片写入报告')
+    total_time: float = Field(default=0.0, description='总耗时(单位: s)')
+
+
+class WorkspaceManifest:
+
+    def __init__(self, workspace: str, tenant: str | None = None, manifest_dir: str | None = None):
+        """
+        工作区清单, 记录工作区内每个文件的哈希值和切片 uuid 列表: {文件地址: {'file_hash': str, 'chunk_uuids': list[str]}}
+        :param workspace: 工作区名(向量数据库索引名)
+        :param tenant: 租户名
+        :param manifest_dir: 清单保存目录, 默认 ../data/manifest
+        """
+        project_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+        manifest_dir = manifest_dir if manifest_dir else os.path.join(project_path, 'data', 'manifest')
+        file_name = f'{workspace}.json' if not tenant else f'{workspace}.{tenant}.json'
+
+        self.__manifest_path = os.path.join(manifest_dir, file_name)
+        self.__index_path = os.path.join(manifest_dir, f'{os.path.splitext(file_name)[0]}.index.json')
+        self.__files: dict[str, dict] = {}
+        self.__version = MANIFEST_VERSION
+
+        if os.path.exists(self.__manifest_path):
+            with open(self.__manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.__files = manifest.get('files', {})
+            self.__version = manifest.get('version', 1)
+
+    @property
+    def files(self) -> dict[str, dict]:
+        return self.__files
+
+    @property
+    def is_outdated(self) -> bool:
+        """
+        清单切片 uuid 规则是否为旧版本
+        """
+        return self.__version < MANIFEST_VERSION
+
+    @property
+    def exists(self) -> bool:
+        """
+        清单文件是否存在(工作区是否已按清单同步过)
+        """
+        return os.path.exists(self.__manifest_path)
+
+    @property
+    def index_path(self) -> str:
+        """
+        工作区文件索引地址(记录文件大小和修改时间, 未变化的文件不重新计算哈希值)
+        """
+        return self.__index_path
+
+    def save(self):
+        """
+        先写临时文件再替换, 防止写入中断导致清单损坏
+        :return:
+        """
+        os.makedirs(os.path.dirname(self.__manifest_path), exist_ok=True)
+        tmp_path = f'{self.__manifest_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.__version, 'files': self.__files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.__manifest_path)
+
+    def clear(self):
+        self.__files = {}
+        self.__version = MANIFEST_VERSION
+
+
+class WorkspaceSync:
+
+    def __init__(self, ingest_pipeline: IngestPipeline, manifest_dir: str | None = None):
+        """
+        工作区增量同步: 只写入新增/修改文件中变化的切片, 删除已删除文件和修改文件中失效的切片, 不删除索引
+        :param ingest_pipeline: 知识库写入流程
+        :param manifest_dir: 工作区清单保存目录
+        """
+        self.__ingest_pipeline = ingest_pipeline
+        self.__vector_store = ingest_pipeline.vector_store
+        self.__manifest_dir = manifest_dir
+
+    @staticmethod
+    def chunk_uuid(file_path: str, content: str, occurrence: int = 0) -> str:
+        """
+        切片 uuid: 文件地址 + 切片内容哈希 + 相同内容在文件中的出现序号, 文件中插入/删除切片时其余切片 uuid 不变
+        :param file_path: 文件地址
+        :param content: 切片内容
+        :param occurrence: 相同内容在文件中第几次出现(从 0 开始)
+        :return:
+        """
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        return str(uuid.uuid5(CHUNK_NAMESPACE, f'{file_path}:{content_hash}:{occurrence}'))
+
+    def __iter_file_chunks(self, file_path: str, file_type: str, report: IngestReport) -> Iterator[Document]:
+        """
+        [懒加载]迭代输出文件切片, 并按 chunk_uuid 设置切片 id
+        :param file_path:
+        :param file_type:
+        :param report:
+        :return:
+        """
+        occurrences: dict[str, int] = {}
+        for split_doc in self.__ingest_pipeline.iter_file_chunks(file_path=file_path, file_type=file_type, report=report):
+            occurrence = occurrences.get(split_doc.page_content, 0)
+            occurrences[split_doc.page_content] = occurrence + 1
+            split_doc.id = self.chunk_uuid(file_path, split_doc.page_content, occurrence)
+            yield split_doc
+
+    def sync(
+        self,
+        workspace: str,
+        file_paths: Iterable[Union[str, Path]],
+        tenant: str | None = None,
+        remove_missing: bool = True
+    ) -> SyncReport:
+        """
+        同步文件到工作区
+        :param workspace: 工作区名(向量数据库索引名)
+        :param file_paths: 文件/文件夹地址列表
+        :param tenant: 租户名
+        :param remove_missing: 是否删除工作区中不在 file_paths 内的文件切片(False 时为追加模式)
+        :return: 同步报告
+        """
+        s_time = time.time()
+        report = SyncReport()
+        manifest = WorkspaceManifest(workspace=workspace, tenant=tenant, manifest_dir=self.__manifest_dir)
+        file_index = FileIndex(manifest.index_path)
+
+        # 无清单的已有索引(增量同步前创建)切片 uuid 随机, 无法按清单删除旧切片, 删除索引后全量写入;
+        # 租户清单不存在时可能只是同一索引下的新租户, 不删除索引
+        all_collections = self.__vector_store.all_collections()
+        if tenant is None and workspace in all_collections and not manifest.exists:
+            self.__vector_store.delete_collection(collection_name=workspace)
+            all_collections = self.__vector_store.all_collections()
+
+        # 旧版本清单的切片 uuid 规则不同, 删除清单记录的切片后全部文件按新增处理
+        deduplicator = self.__ingest_pipeline.deduplicator
+        if workspace in all_collections and manifest.is_outdated:
+            self.__vector_store.delete_by_ids(
+                index_name=workspace,
+                uuids=[chunk_uuid for record in manifest.files.values() for chunk_uuid in record.get('chunk_uuids', [])],
+                tenant=tenant
+            )
+            manifest.clear()
+            file_index.clear()
+            if deduplicator: deduplicator.clear(index_name=workspace, tenant=tenant)
+
+        # 索引已被删除时清单和去重索引失效, 全部文件按新增处理
+        if workspace not in all_collections:
+            if manifest.files:
+                manifest.clear()
+                file_index.clear()
+            if deduplicator: deduplicator.clear(index_name=workspace, tenant=tenant)
+
+        # 大小和修改时间未变化且已在清单内的文件直接视为未修改, 其余文件计算哈希值与清单对比
+        scan_result = self.__ingest_pipeline.file_walker.scan(file_paths=list(file_paths), index=file_index)
+        file_types: dict[str, str] = {}
+        check_files: list[dict] = list(scan_result.changed)
+        for file_info in scan_result.unchanged:
+            if file_info['file_path'] in manifest.files:
+                report.unchanged_files += 1
+            else:
+                check_files.append(file_info)
+        for file_info in scan_result.changed + scan_result.unchanged:
+            file_types[file_info['file_path']] = file_info['file_type']
+
+        changed_files: dict[str, str] = {}
+        changed_infos: dict[str, dict] = {}
+        for file_info in check_files:
+            file_path = file_info['file_path']
+            file_hash = calculate_file_hash(file_path)
+            old_record = manifest.files.get(file_path)
+            if old_record and old_record.get('file_hash') == file_hash:
+                report.unchanged_files += 1
+                file_index.update(file_info)
+                continue
+
+            changed_files[file_path] = file_hash
+            changed_infos[file_path] = file_info
+            (report.updated_files if old_record else report.added_files).append(file_path)
+
+        # 流式写入变化的切片, 同时记录各文件最新的切片 uuid
+        new_chunk_uuids: dict[str, list[str]] = {}
+        if changed_files:
+            self.__ingest_pipeline.write(
+                split_docs=self.__iter_changed_chunks(changed_files, file_types, manifest, new_chunk_uuids, report.ingest),
+                index_name=workspace,
+                tenant=tenant,
+                report=report.ingest
+            )
+
+        stale_uuids = []
+        for file_path, file_hash in changed_files.items():
+            if file_path in report.ingest.failed_files: continue
+            old_uuids = set(manifest.files.get(file_path, {}).get('chunk_uuids', []))
+            chunk_uuids = new_chunk_uuids.get(file_path, [])
+            stale_uuids.extend(old_uuids.difference(chunk_uuids))
+            manifest.files[file_path] = {'file_hash': file_hash, 'chunk_uuids': chunk_uuids}
+            file_index.update(changed_infos[file_path])
+
+        if remove_missing:
+            for file_path in list(manifest.files.keys()):
+                if file_path in file_types: continue
+                stale_uuids.extend(manifest.files.pop(file_path).get('chunk_uuids', []))
+                report.removed_files.append(file_path)
+            for file_path in scan_result.removed:
+                file_index.remove(file_path)
+
+        report.deleted_chunks = self.__vector_store.delete_by_ids(index_name=workspace, uuids=stale_uuids, tenant=tenant)
+
+        # 被删除切片是其它切片的去重保留副本时, 重新写入这些重复切片
+        orphans = deduplicator.remove(index_name=workspace, uuids=stale_uuids, tenant=tenant) if deduplicator else {}
+        orphans = {file_path: uuids for file_path, uuids in orphans.items() if file_path in manifest.files}
+        if orphans:
+            chunks = report.ingest.chunks
+            self.__ingest_pipeline.write(
+                split_docs=self.__iter_orphan_chunks(orphans, file_types),
+                index_name=workspace,
+                tenant=tenant,
+                report=report.ingest
+            )
+            report.rewritten_chunks = report.ingest.chunks - chunks
+
+        # 写入失败的切片不记录到清单, 文件哈希置空并移出文件索引, 下次同步时重新写入
+        for file_path, failed_uuids in report.ingest.failed_uuids.items():
+            if file_path not in manifest.files: continue
+            failed_uuids = set(failed_uuids)
+            record = manifest.files[file_path]
+            record['chunk_uuids'] = [chunk_uuid for chunk_uuid in record.get('chunk_uuids', []) if chunk_uuid not in failed_uuids]
+            record['file_hash'] = ''
+            file_index.remove(file_path)
+        manifest.save()
+        file_index.save()
+
+        report.total_time = time.time() - s_time
+        logger.info(
+            f'* 工作区【{workspace}】同步完成: 新增文件【{len(report.added_files)}】, 修改文件【{len(report.updated_files)}】, '
+            f'删除文件【{len(report.removed_files)}】, 未修改文件【{report.unchanged_files}】, '
+            f'写入切片【{report.ingest.chunks}】, 删除切片【{report.deleted_chunks}】, '
+            f'跳过重复切片【{report.ingest.exact_duplicates + report.ingest.near_duplicates}】, 耗时【{round(report.total_time, 3)}(s)】',
+            extra={'workspace': workspace, 'chunks': report.ingest.chunks, 'deleted_chunks': report.deleted_chunks}
+        )
+
+        return report
+
+    def rebuild(self, workspace: str, file_paths: Iterable[Union[str, Path]], tenant: str | None = None) -> SyncReport:
+        """
+        删除工作区索引后全量写入
+        :param workspace: 工作区名(向量数据库索引名)
+        :param file_paths: 文件/文件夹地址列表
+        :param tenant: 租户名
+        :return: 同步报告
+        """
+        if workspace in self.__vector_store.all_collections():
+            self.__vector_store.delete_collection(collection_name=workspace)
+
+        return self.sync(workspace=workspace, file_paths=file_paths, tenant=tenant)
+
+    def __iter_changed_chunks(
+        self,
+        changed_files: dict[str, str],
+        file_types: dict[str, str],
+        manifest: WorkspaceManifest,
+        new_chunk_uuids: dict[str, list[str]],
+        ingest_report: IngestReport
+    ) -> Iterator[Document]:
+        """
+        [懒加载]迭代输出变化文件中 uuid 不在清单内的切片(内容未变的切片无需重复写入)
+        :return:
+        """
+        for file_path in changed_files:
+            old_uuids = set(manifest.files.get(file_path, {}).get('chunk_uuids', []))
+            chunk_uuids = new_chunk_uuids.setdefault(file_path, [])
+
+            for split_doc in self.__iter_file_chunks(file_path, file_type=file_types[file_path], report=ingest_report):
+                chunk_uuids.append(split_doc.id)
+                if split_doc.id in old_uuids: continue
+                yield split_doc
+
+    def __iter_orphan_chunks(self, orphans: dict[str, list[str]], file_types: dict[str, str]) -> Iterator[Document]:
+        """
+        [懒加载]重新切片文件, 输出 uuid 在 orphans 内的切片
+        :param orphans: 需要重新写入的切片 {文件地址: [切片 uuid]}
+        :param file_types: 本次扫描的文件类型
+        :return:
+        """
+        for file_path, uuids in orphans.items():
+            if not os.path.isfile(file_path): continue
+
+            orphan_uuids = set(uuids)
+            file_type = file_types.get(file_path, FileWalker.file_type(file_path))
+            for split_doc in self.__iter_file_chunks(file_path, file_type=file_type, report=IngestReport()):
+                if split_doc.id in orphan_uuids: yield split_doc
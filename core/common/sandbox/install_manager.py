@@ -0,0 +1,448 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+from collections.abc import Callable
+
+from pydantic import BaseModel, Field
+
+from core.common.sandbox.sandbox import RunResult, OutputCallback
+
+# pip 需要参数值的选项
+PIP_VALUE_OPTIONS = {
+    '-i', '--index-url', '--extra-index-url', '-f', '--find-links', '-c', '--constraint',
+    '-r', '--requirement', '-t', '--target', '--trusted-host', '--prefix', '--root', '-e', '--editable',
+    '--platform', '--python-version', '--implementation', '--abi', '--src', '--progress-bar'
+}
+# pip 依赖文件选项(依赖集哈希包含文件内容)
+PIP_FILE_OPTIONS = {'-r', '--requirement', '-c', '--constraint'}
+# pip 索引相关选项(离线安装时去除, 下载 wheel 时保留)
+PIP_INDEX_OPTIONS = {'-i', '--index-url', '--extra-index-url', '--trusted-host'}
+# 无法通过已安装版本判断是否满足的 pip 选项
+PIP_UNCHECKABLE_OPTIONS = {
+    '-U', '--upgrade', '--force-reinstall', '-e', '--editable', '-t', '--target',
+    '--prefix', '--root', '--user', '--platform', '--python-version', '--implementation', '--abi'
+}
+NPM_INSTALL_ACTIONS = {'install', 'i', 'add'}
+
+# 在目标环境解释器中检查依赖是否已满足, 输出未满足(或无法判断)的依赖列表
+CHECK_SCRIPT = '''
+import json, sys
+from importlib import metadata
+try:
+    from packaging.requirements import Requirement
+except ImportError:
+    from pip._vendor.packaging.requirements import Requirement
+unsatisfied = []
+for line in json.loads(sys.argv[1]):
+    try:
+        req = Requirement(line)
+        if req.url or (req.marker and not req.marker.evaluate()):
+            if req.url: unsatisfied.append(line)
+            continue
+        version = metadata.version(req.name)
+        if req.specifier and not req.specifier.contains(version, prereleases=True): unsatisfied.append(line)
+    except Exception:
+        unsatisfied.append(line)
+print(json.dumps(unsatisfied))
+'''
+
+
+class InstallStep(BaseModel):
+    tool: str = Field(description='安装工具: pip/npm/shell(无法解析的命令)')
+    command: str = Field(description='原命令')
+    requirements: list[str] = Field(default_factory=list, description='依赖列表')
+    options: list[str] = Field(default_factory=list, description='安装选项')
+    checkable: bool = Field(default=False, description='是否可以通过已安装版本判断依赖是否满足')
+
+
+class InstallResult(BaseModel):
+    command: str = Field(description='安装命令')
+    status: str = Field(description='执行状态: memoized(已执行过相同依赖集)/satisfied(依赖已满足)/installed(安装成功)/failed(安装失败)')
+    stdout: str = Field(default='', description='标准输出')
+    stderr: str = Field(default='', description='标准错误输出')
+    cost_time: float = Field(default=0.0, description='耗时(单位: s)')
+
+    @property
+    def skipped(self) -> bool:
+        return self.status in ['memoized', 'satisfied']
+
+
+def parse_install_command(command: str) -> list[InstallStep]:
+    """
+    解析安装命令, 按 && 和 ; 拆分为多个安装步骤, 解析 pip/npm 安装命令的依赖和选项
+    :param command: 安装命令
+    :return:
+    """
+    # 管道、或运算、命令替换等复杂命令不拆分
+    if re.search(r'\|\||\||`|\$\(', command):
+        return [InstallStep(tool='shell', command=command.strip())]
+
+    steps = []
+    for sub_command in re.split(r'&&|;', command):
+        sub_command = sub_command.strip()
+        if not sub_command: continue
+
+        try:
+            tokens = shlex.split(sub_command)
+        except ValueError:
+            steps.append(InstallStep(tool='shell', command=sub_command))
+            continue
+
+        steps.append(parse_pip_command(sub_command, tokens) or parse_npm_command(sub_command, tokens) or InstallStep(tool='shell', command=sub_command))
+
+    return steps
+
+
+def parse_pip_command(command: str, tokens: list[str]) -> InstallStep | None:
+    """
+    解析 pip install / python -m pip install 命令, 不是 pip 安装命令时返回 None
+    :param command: 命令
+    :param tokens: shlex 拆分后的命令
+    :return:
+    """
+    if tokens[:1] and re.fullmatch(r'pip3?(\.\d+)?', os.path.basename(tokens[0])):
+        args = tokens[1:]
+    elif len(tokens) > 2 and re.fullmatch(r'python[\d.]*(\.exe)?', os.path.basename(tokens[0])) and tokens[1:3] == ['-m', 'pip']:
+        args = tokens[3:]
+    else:
+        return None
+
+    if not args or args[0] != 'install': return None
+
+    requirements, options = [], []
+    checkable = True
+    index = 1
+    while index < len(args):
+        arg = args[index]
+        option = arg.split('=', 1)[0]
+        if arg.startswith('-'):
+            if option in PIP_UNCHECKABLE_OPTIONS: checkable = False
+            options.append(arg)
+            if option in PIP_VALUE_OPTIONS and '=' not in arg and index + 1 < len(args):
+                index += 1
+                options.append(args[index])
+        else:
+            requirements.append(arg)
+        index += 1
+
+    return InstallStep(tool='pip', command=command, requirements=requirements, options=options, checkable=checkable)
+
+
+def parse_npm_command(command: str, tokens: list[str]) -> InstallStep | None:
+    """
+    解析 npm install/i/add 命令, 不是 npm 安装命令时返回 None
+    :param command: 命令
+    :param tokens: shlex 拆分后的命令
+    :return:
+    """
+    if len(tokens) < 2 or os.path.basename(tokens[0]) not in ['npm', 'npm.cmd'] or tokens[1] not in NPM_INSTALL_ACTIONS:
+        return None
+
+    requirements = [token for token in tokens[2:] if not token.startswith('-')]
+    options = [token for token in tokens[2:] if token.startswith('-')]
+    # 全局安装或按 package.json 安装时无法判断
+    checkable = bool(requirements) and not any(option in ['-g', '--global'] for option in options)
+    return InstallStep(tool='npm', command=command, requirements=requirements, options=options, checkable=checkable)
+
+
+def resolve_python(running_command: str | None) -> str | None:
+    """
+    解析运行命令使用的 python 解释器地址(如 python -W ignore -> /usr/bin/python), 不是 python 命令或无法解析时返回 None
+    :param running_command: 运行命令
+    :return:
+    """
+    try:
+        tokens = shlex.split(running_command or '')
+    except ValueError:
+        return None
+    if not tokens or not re.fullmatch(r'python[\d.]*(\.exe)?', os.path.basename(tokens[0])): return None
+
+    python_path = shutil.which(tokens[0])
+    return os.path.abspath(python_path) if python_path else None
+
+
+class InstallManager:
+
+    def __init__(
+        self,
+        python_path: str | None = None,
+        run_command: Callable[..., RunResult] | None = None,
+        cache_dir: str | None = None,
+        enable_wheel_cache: bool = True
+    ):
+        """
+        依赖安装管理: 解析 pip/npm 安装命令, 跳过目标环境已满足的依赖, pip 依赖优先从本地 wheel 缓存离线安装,
+        并按依赖集哈希缓存本次会话的成功安装结果(重试时相同依赖集不再重复执行, 失败的依赖集重新安装)
+        :param python_path: 目标环境解释器地址, 为空时无法确定目标环境: pip 命令按原命令执行, 不检查依赖是否满足, 不使用 wheel 缓存
+        :param run_command: 命令执行方法 run_command(command, cwd=, on_output=, cancel_event=) -> RunResult, 默认新建 shell 进程执行
+        :param cache_dir: wheel 缓存目录, 默认 ../data/wheel_cache
+        :param enable_wheel_cache: 是否使用 wheel 缓存
+        """
+        project_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+        self.__python_path = python_path
+        self.__run_command = run_command if run_command else self.__shell_run
+        self.__wheel_dir = cache_dir if cache_dir else os.path.join(project_path, 'data', 'wheel_cache')
+        self.__enable_wheel_cache = enable_wheel_cache
+
+        self.__lock = threading.Lock()
+        self.__step_locks: dict[str, threading.Lock] = {}
+        self.__memo: dict[str, InstallResult] = {}
+
+    @staticmethod
+    def __shell_run(
+        command: str,
+        cwd: str | None = None,
+        on_output: OutputCallback | None = None,
+        timeout: int = 300,
+        **kwargs
+    ) -> RunResult:
+        s_time = time.time()
+        try:
+            sp_command = subprocess.run(
+                command,
+                shell=True,
+                cwd=cwd,
+                capture_output=True,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                timeout=timeout
+            )
+        except subprocess.TimeoutExpired as e:
+            return RunResult(stdout=str(e.stdout or ''), stderr=str(e.stderr or ''), timed_out=True, cost_time=time.time() - s_time)
+
+        if on_output:
+            if sp_command.stdout: on_output('stdout', sp_command.stdout)
+            if sp_command.stderr: on_output('stderr', sp_command.stderr)
+        return RunResult(
+            stdout=sp_command.stdout,
+            stderr=sp_command.stderr,
+            returncode=sp_command.returncode,
+            cost_time=time.time() - s_time
+        )
+
+    def step_hash(self, step: InstallStep, cwd: str | None = None) -> str:
+        """
+        依赖集哈希: 目标环境 + 安装工具 + 排序后的依赖和选项 + 依赖文件(-r/-c)内容(npm 依赖安装到运行目录, 同时包含运行目录)
+        :param step:
+        :param cwd:
+        :return:
+        """
+        files = {}
+        for file_path in self.__requirement_files(step):
+            file_path = os.path.join(cwd, file_path) if cwd else file_path
+            try:
+                with open(file_path, 'rb') as f:
+                    files[os.path.abspath(file_path)] = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                files[os.path.abspath(file_path)] = ''
+
+        key = {
+            'python_path': self.__python_path,
+            'tool': step.tool,
+            'requirements': sorted(step.requirements),
+            'options': sorted(step.options),
+            'command': step.command if step.tool == 'shell' else '',
+            'cwd': os.path.abspath(cwd) if cwd and step.tool != 'pip' else '',
+            'files': files
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def __requirement_files(step: InstallStep) -> list[str]:
+        """
+        pip 安装选项中的依赖文件地址(-r requirements.txt / --requirement=requirements.txt / -c constraints.txt)
+        :param step:
+        :return:
+        """
+        if step.tool != 'pip': return []
+
+        files = []
+        for index, option in enumerate(step.options):
+            name, _, value = option.partition('=')
+            if name not in PIP_FILE_OPTIONS: continue
+            if value: files.append(value)
+            elif index + 1 < len(step.options): files.append(step.options[index + 1])
+        return files
+
+    def install(
+        self,
+        command: str,
+        cwd: str | None = None,
+        on_output: OutputCallback | None = None,
+        cancel_event: threading.Event | None = None
+    ) -> list[InstallResult]:
+        """
+        执行安装命令
+        :param command: 安装命令
+        :param cwd: 运行目录
+        :param on_output: 输出回调
+        :param cancel_event: 取消事件
+        :return: 每个安装步骤的执行结果
+        """
+        results = []
+        for step in parse_install_command(command):
+            if cancel_event and cancel_event.is_set(): break
+
+            step_hash = self.step_hash(step, cwd=cwd)
+            with self.__lock:
+                step_lock = self.__step_locks.setdefault(step_hash, threading.Lock())
+
+            # 同一依赖集并发安装时, 后到的请求等待先到的请求完成后直接使用其结果
+            with step_lock:
+                memo_result = self.__memo.get(step_hash)
+                if memo_result:
+                    result = memo_result.model_copy(update={'status': 'memoized', 'cost_time': 0.0})
+                else:
+                    result = self.__install_step(step, cwd=cwd, on_output=on_output, cancel_event=cancel_event)
+                    # 只缓存成功结果, 安装失败(如网络异常)时重试会重新执行
+                    if result.status in ['installed', 'satisfied'] and not (cancel_event and cancel_event.is_set()):
+                        self.__memo[step_hash] = result
+
+            if on_output and result.skipped:
+                on_output('stdout', f'[{result.status}] 跳过安装: {step.command}\n')
+            results.append(result)
+
+        return results
+
+    def __install_step(
+        self,
+        step: InstallStep,
+        cwd: str | None,
+        on_output: OutputCallback | None,
+        cancel_event: threading.Event | None
+    ) -> InstallResult:
+        s_time = time.time()
+        if step.checkable and self.is_satisfied(step, cwd=cwd):
+            return InstallResult(command=step.command, status='satisfied', cost_time=time.time() - s_time)
+
+        run_kwargs = {'cwd': cwd, 'on_output': on_output, 'cancel_event': cancel_event}
+        if step.tool == 'pip':
+            run_result = self.__pip_install(step, **run_kwargs)
+        elif step.tool == 'npm' and '--prefer-offline' not in step.options:
+            run_result = self.__run_command(f'{step.command} --prefer-offline', **run_kwargs)
+        else:
+            run_result = self.__run_command(step.command, **run_kwargs)
+
+        return InstallResult(
+            command=step.command,
+            status='installed' if run_result.returncode == 0 else 'failed',
+            stdout=run_result.stdout,
+            stderr=run_result.error,
+            cost_time=time.time() - s_time
+        )
+
+    def __pip_install(self, step: InstallStep, **run_kwargs) -> RunResult:
+        """
+        pip 安装: 先从 wheel 缓存离线安装, 失败时下载 wheel 到缓存后再离线安装, 仍失败时执行原安装选项在线安装
+        :param step:
+        :param run_kwargs:
+        :return:
+        """
+        if not self.__python_path: return self.__run_command(step.command, **run_kwargs)
+
+        pip = f'{shlex.quote(self.__python_path)} -m pip'
+        requirements = ' '.join(shlex.quote(requirement) for requirement in step.requirements)
+        online_command = f'{pip} install {" ".join(shlex.quote(option) for option in step.options)} {requirements}'
+        if not self.__enable_wheel_cache or not step.checkable:
+            return self.__run_command(online_command, **run_kwargs)
+
+        os.makedirs(self.__wheel_dir, exist_ok=True)
+        wheel_dir = shlex.quote(self.__wheel_dir)
+        offline_options, index_options = self.__split_index_options(step.options)
+        offline_command = f'{pip} install --no-index --find-links {wheel_dir} {offline_options} {requirements}'
+
+        run_result = self.__run_command(offline_command, **{**run_kwargs, 'on_output': None})
+        if run_result.returncode == 0: return run_result
+
+        wheel_command = f'{pip} wheel --wheel-dir {wheel_dir} --find-links {wheel_dir} {index_options} {offline_options} {requirements}'
+        run_result = self.__run_command(wheel_command, **run_kwargs)
+        if run_result.returncode == 0:
+            run_result = self.__run_command(offline_command, **run_kwargs)
+            if run_result.returncode == 0: return run_result
+
+        return self.__run_command(online_command, **run_kwargs)
+
+    @staticmethod
+    def __split_index_options(options: list[str]) -> tuple[str, str]:
+        """
+        拆分索引选项和其它选项
+        :param options:
+        :return: (其它选项, 索引选项)
+        """
+        other_options, index_options = [], []
+        index = 0
+        while index < len(options):
+            option = options[index].split('=', 1)[0]
+            target = index_options if option in PIP_INDEX_OPTIONS else other_options
+            target.append(shlex.quote(options[index]))
+            if option in PIP_VALUE_OPTIONS and '=' not in options[index] and index + 1 < len(options):
+                index += 1
+                target.append(shlex.quote(options[index]))
+            index += 1
+
+        return ' '.join(other_options), ' '.join(index_options)
+
+    def is_satisfied(self, step: InstallStep, cwd: str | None = None) -> bool:
+        """
+        判断安装步骤的依赖是否已在目标环境满足
+        :param step:
+        :param cwd: 运行目录(npm 依赖目录, pip -r 文件相对路径)
+        :return:
+        """
+        if step.tool == 'pip': return self.__pip_satisfied(step, cwd=cwd)
+        if step.tool == 'npm': return self.__npm_satisfied(step, cwd=cwd)
+        return False
+
+    def __pip_satisfied(self, step: InstallStep, cwd: str | None) -> bool:
+        if not self.__python_path: return False
+
+        requirements = list(step.requirements)
+        for index, option in enumerate(step.options):
+            option_name, _, option_value = option.partition('=')
+            if option_name not in ['-r', '--requirement']: continue
+            file_path = option_value or (step.options[index + 1] if index + 1 < len(step.options) else '')
+            file_path = os.path.join(cwd, file_path) if cwd and not os.path.isabs(file_path) else file_path
+            if not os.path.isfile(file_path): return False
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.split('#', 1)[0].strip()
+                    if not line: continue
+                    # 嵌套选项(-r/-c/-e 等)无法判断
+                    if line.startswith('-'): return False
+                    requirements.append(line)
+
+        if not requirements: return False
+        try:
+            sp_command = subprocess.run(
+                [self.__python_path, '-c', CHECK_SCRIPT, json.dumps(requirements)],
+                capture_output=True,
+                text=True,
+                encoding='utf-8',
+                timeout=60
+            )
+            return sp_command.returncode == 0 and json.loads(sp_command.stdout) == []
+        except (subprocess.TimeoutExpired, json.JSONDecodeError, OSError):
+            return False
+
+    @staticmethod
+    def __npm_satisfied(step: InstallStep, cwd: str | None) -> bool:
+        for requirement in step.requirements:
+            # 解析 name@spec / @scope/name@spec
+            name, _, spec = requirement[1:].partition('@') if requirement.startswith('@') else requirement.partition('@')
+            name = f'@{name}' if requirement.startswith('@') else name
+            package_file = os.path.join(cwd or os.getcwd(), 'node_modules', *name.split('/'), 'package.json')
+            if not os.path.isfile(package_file): return False
+            if spec in ['', 'latest', '*']: continue
+
+            with open(package_file, 'r', encoding='utf-8') as f:
+                version = json.load(f).get('version', '')
+            if spec.lstrip('=v') != version: return False
+
+        return True
@@ -0,0 +1,577 @@
+import json
+import os
+import queue
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import venv
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, Future
+from importlib.util import find_spec
+
+from pydantic import BaseModel, Field
+
+from common.error.sandbox import SandboxError
+
+# 预热进程脚本
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), 'worker.py')
+# 输出回调: (输出流名 stdout/stderr, 输出内容)
+OutputCallback = Callable[[str, str], None]
+
+
+class SandboxLimits(BaseModel):
+    cpu_time: int = Field(default=120, description='单次运行 CPU 时间上限(单位: s), 0 表示不限制')
+    memory_mb: int = Field(default=2048, description='单次运行虚拟内存上限(单位: MB), 0 表示不限制')
+    file_size_mb: int = Field(default=256, description='单个写入文件大小上限(单位: MB), 0 表示不限制')
+    open_files: int = Field(default=1024, description='打开文件数上限, 0 表示不限制')
+    max_output_kb: int = Field(default=1024, description='stdout/stderr 输出总大小上限(单位: KB), 超出后终止运行, 0 表示不限制')
+
+
+class RunResult(BaseModel):
+    stdout: str = Field(default='', description='标准输出')
+    stderr: str = Field(default='', description='标准错误输出')
+    returncode: int | None = Field(default=None, description='退出码')
+    timed_out: bool = Field(default=False, description='是否超时')
+    truncated: bool = Field(default=False, description='输出是否超出上限被终止')
+    cancelled: bool = Field(default=False, description='是否被取消')
+    cost_time: float = Field(default=0.0, description='耗时(单位: s)')
+
+    @property
+    def error(self) -> str:
+        """
+        运行异常描述(stderr 及超时/输出超限/取消提示)
+        """
+        notes = []
+        if self.timed_out: notes.append('运行超时, 已终止')
+        if self.truncated: notes.append('输出超出上限, 已终止')
+        if self.cancelled: notes.append('运行已取消')
+        return '\n'.join([self.stderr.strip(), *notes]).strip()
+
+
+class ProjectVenv:
+
+    def __init__(self, project_path: str, venv_dir: str = '.venv', enable: bool = True):
+        """
+        项目虚拟环境, 继承系统已安装的第三方依赖(system_site_packages), 依赖安装到项目虚拟环境内
+        :param project_path: 项目目录
+        :param venv_dir: 虚拟环境目录名(相对 project_path)
+        :param enable: 是否启用虚拟环境, False 时使用当前解释器
+        """
+        self.__project_path = project_path
+        self.__venv_path = os.path.join(project_path, venv_dir)
+        self.__enable = enable
+
+    @property
+    def venv_path(self) -> str:
+        return self.__venv_path
+
+    @property
+    def bin_dir(self) -> str:
+        return os.path.join(self.__venv_path, 'Scripts' if sys.platform.startswith('win') else 'bin')
+
+    @property
+    def python_path(self) -> str:
+        if not self.__enable: return sys.executable
+        return os.path.join(self.bin_dir, 'python.exe' if sys.platform.startswith('win') else 'python')
+
+    def ensure(self) -> str:
+        """
+        虚拟环境不存在时创建(当前解释器可导入 pip 时不在虚拟环境内重复安装 pip)
+        :return: 虚拟环境解释器地址
+        """
+        if self.__enable and not os.path.exists(self.python_path):
+            os.makedirs(self.__project_path, exist_ok=True)
+            venv.EnvBuilder(
+                system_site_packages=True,
+                with_pip=find_spec('pip') is None,
+                symlinks=not sys.platform.startswith('win')
+            ).create(self.__venv_path)
+
+        return self.python_path
+
+    def env(self) -> dict[str, str]:
+        """
+        运行命令使用的环境变量(虚拟环境 bin 目录优先)
+        :return:
+        """
+        env = dict(os.environ)
+        if not self.__enable: return env
+
+        env.pop('PYTHONHOME', None)
+        env['VIRTUAL_ENV'] = self.__venv_path
+        env['PATH'] = os.pathsep.join([self.bin_dir, env.get('PATH', '')])
+        return env
+
+    def wrap_command(self, command: str) -> str:
+        """
+        把命令中的 pip/pip3/python -m pip 替换为虚拟环境解释器执行 pip, 保证依赖安装到项目虚拟环境
+        :param command: 安装命令
+        :return:
+        """
+        if not self.__enable: return command
+        return re.sub(
+            r'(^|&&|\|\||;)(\s*)(?:pip3?|python3?\s+-m\s+pip)(?=\s|$)',
+            lambda match: f'{match.group(1)}{match.group(2)}"{self.python_path}" -m pip',
+            command
+        )
+
+
+def kill_process(proc: subprocess.Popen):
+    """
+    终止进程及其进程组(进程以 start_new_session 启动)
+    :param proc:
+    :return:
+    """
+    if proc.poll() is not None: return
+    try:
+        if sys.platform.startswith('win'):
+            proc.kill()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class SandboxWorker:
+
+    def __init__(
+        self,
+        python_path: str,
+        cwd: str,
+        env: dict[str, str] | None = None,
+        limits: SandboxLimits | None = None,
+        preload_modules: list[str] | None = None,
+        ignore_warnings: bool = True,
+        start_timeout: int = 60
+    ):
+        """
+        预热进程: 启动时导入常用模块, 每次运行 fork 子进程执行测试文件(子进程设置 rlimit), 流式回传输出
+        :param python_path: 解释器地址
+        :param cwd: 进程运行目录
+        :param env: 环境变量
+        :param limits: 资源限制
+        :param preload_modules: 预导入模块
+        :param ignore_warnings: 是否忽略 warnings 输出
+        :param start_timeout: 等待预热完成超时时间(单位: s)
+        """
+        self.__lock = threading.Lock()
+        self.__proc = subprocess.Popen(
+            [python_path, '-u', WORKER_SCRIPT],
+            cwd=cwd,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            start_new_session=True
+        )
+        self.__send({
+            'preload': preload_modules or [],
+            'limits': (limits or SandboxLimits()).model_dump(),
+            'ignore_warnings': ignore_warnings
+        })
+
+        ready = self.__read(timeout=start_timeout)
+        if not ready or ready.get('event') != 'ready':
+            self.kill()
+            raise SandboxError(f'沙箱进程启动失败, 解释器: {python_path}')
+
+    @property
+    def is_alive(self) -> bool:
+        return self.__proc.poll() is None
+
+    def __send(self, message: dict):
+        self.__proc.stdin.write(json.dumps(message, ensure_ascii=False) + '\n')
+        self.__proc.stdin.flush()
+
+    def __read(self, timeout: float | None = None) -> dict | None:
+        """
+        读取一条协议消息, 进程退出或超时返回 None
+        :param timeout: 超时时间(单位: s), 为空时阻塞读取
+        :return:
+        """
+        if timeout is None:
+            line = self.__proc.stdout.readline()
+            return json.loads(line) if line else None
+
+        result: list = []
+        reader = threading.Thread(target=lambda: result.append(self.__proc.stdout.readline()), daemon=True)
+        reader.start()
+        reader.join(timeout)
+        return json.loads(result[0]) if result and result[0] else None
+
+    def run(
+        self,
+        file_path: str,
+        cwd: str | None = None,
+        timeout: float = 300,
+        on_output: OutputCallback | None = None
+    ) -> RunResult:
+        """
+        运行测试文件
+        :param file_path: 测试文件地址
+        :param cwd: 运行目录, 默认测试文件所在目录
+        :param timeout: 超时时间(单位: s)
+        :param on_output: 输出回调, 每收到一段输出调用一次
+        :return:
+        """
+        s_time = time.time()
+        run_id = str(uuid.uuid1())
+        outputs = {'stdout': [], 'stderr': []}
+        result = RunResult()
+
+        with self.__lock:
+            self.__send({'id': run_id, 'file_path': os.path.abspath(file_path), 'cwd': cwd, 'timeout': timeout})
+            while True:
+                message = self.__read()
+                # 预热进程被终止(取消运行), 等待进程退出, 归还进程池时按 is_alive 重启
+                if message is None:
+                    result.cancelled = True
+                    try:
+                        self.__proc.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        self.kill()
+                    break
+                if message.get('id') != run_id: continue
+
+                if message.get('event') == 'output':
+                    outputs[message['stream']].append(message['data'])
+                    if on_output: on_output(message['stream'], message['data'])
+                elif message.get('event') == 'exit':
+                    result.returncode = message.get('returncode')
+                    result.timed_out = message.get('timed_out', False)
+                    result.truncated = message.get('truncated', False)
+                    break
+
+        result.stdout = ''.join(outputs['stdout'])
+        result.stderr = ''.join(outputs['stderr'])
+        result.cost_time = time.time() - s_time
+        return result
+
+    def kill(self):
+        kill_process(self.__proc)
+
+    def close(self):
+        try:
+            self.__proc.stdin.close()
+            self.__proc.wait(timeout=5)
+        except Exception:
+            self.kill()
+
+
+class SandboxPool:
+
+    def __init__(
+        self,
+        project_path: str,
+        size: int = 2,
+        limits: SandboxLimits | dict | None = None,
+        preload_modules: list[str] | None = None,
+        use_venv: bool = True,
+        ignore_warnings: bool = True,
+        run_timeout: int = 300,
+        install_timeout: int = 300,
+        acquire_timeout: int = 600
+    ):
+        """
+        项目沙箱进程池: 每个项目一个虚拟环境, 池内保持 size 个预热进程, 运行结束后进程复用, 被终止的进程自动重启
+        :param project_path: 项目目录
+        :param size: 预热进程数(同时运行的测试数)
+        :param limits: 资源限制
+        :param preload_modules: 预热进程预导入模块
+        :param use_venv: 是否为项目创建虚拟环境
+        :param ignore_warnings: 是否忽略 warnings 输出
+        :param run_timeout: 默认运行测试超时时间(单位: s)
+        :param install_timeout: 默认安装依赖超时时间(单位: s)
+        :param acquire_timeout: 等待空闲预热进程超时时间(单位: s)
+        """
+        if size < 1:
+            raise ValueError('size 必须大于0')
+
+        self.__project_path = project_path
+        self.__limits = SandboxLimits(**limits) if isinstance(limits, dict) else (limits or SandboxLimits())
+        self.__preload_modules = preload_modules or []
+        self.__ignore_warnings = ignore_warnings
+        self.__run_timeout = run_timeout
+        self.__install_timeout = install_timeout
+        self.__acquire_timeout = acquire_timeout
+        self.__closed = False
+        self.__command_lock = threading.Lock()
+
+        self.__venv = ProjectVenv(project_path=project_path, enable=use_venv)
+        self.__venv.ensure()
+
+        self.__workers: queue.Queue[SandboxWorker] = queue.Queue()
+        with ThreadPoolExecutor(max_workers=size) as executor:
+            for worker in executor.map(lambda _: self.__new_worker(), range(size)):
+                self.__workers.put(worker)
+
+    @property
+    def venv(self) -> ProjectVenv:
+        return self.__venv
+
+    def __new_worker(self) -> SandboxWorker:
+        return SandboxWorker(
+            python_path=self.__venv.python_path,
+            cwd=self.__project_path,
+            env=self.__venv.env(),
+            limits=self.__limits,
+            preload_modules=self.__preload_modules,
+            ignore_warnings=self.__ignore_warnings
+        )
+
+    @staticmethod
+    def __watch_cancel(cancel_event: threading.Event, done_event: threading.Event, kill: Callable[[], None]):
+        while not done_event.wait(0.1):
+            if cancel_event.is_set():
+                kill()
+                return
+
+    def run(
+        self,
+        file_path: str,
+        cwd: str | None = None,
+        timeout: float | None = None,
+        on_output: OutputCallback | None = None,
+        cancel_event: threading.Event | None = None
+    ) -> RunResult:
+        """
+        使用空闲预热进程运行测试文件(无空闲进程时等待)
+        :param file_path: 测试文件地址
+        :param cwd: 运行目录, 默认测试文件所在目录
+        :param timeout: 超时时间(单位: s), 为空时使用 run_timeout
+        :param on_output: 输出回调
+        :param cancel_event: 取消事件, 被设置时终止运行
+        :return:
+        """
+        worker = self.__acquire()
+        done_event = threading.Event()
+        try:
+            if cancel_event and cancel_event.is_set():
+                return RunResult(cancelled=True)
+            if cancel_event:
+                threading.Thread(target=self.__watch_cancel, args=(cancel_event, done_event, worker.kill), daemon=True).start()
+
+            return worker.run(file_path=file_path, cwd=cwd, timeout=timeout or self.__run_timeout, on_output=on_output)
+        finally:
+            done_event.set()
+            self.__release(worker)
+
+    def __acquire(self) -> SandboxWorker:
+        """
+        获取空闲预热进程, 进程池已关闭或等待超时(如预热进程持续重启失败)时抛出异常
+        :return:
+        """
+        deadline = time.time() + self.__acquire_timeout
+        while not self.__closed:
+            try:
+                return self.__workers.get(timeout=max(min(deadline - time.time(), 1), 0))
+            except queue.Empty:
+                if time.time() >= deadline:
+                    raise SandboxError(f'等待空闲沙箱进程超时({self.__acquire_timeout}s)')
+
+        raise SandboxError('沙箱进程池已关闭')
+
+    def __release(self, worker: SandboxWorker):
+        """
+        运行结束后归还预热进程, 进程已被终止时重启, 重启失败时后台重试, 保证进程池大小不变; 进程池已关闭时关闭进程
+        :param worker:
+        :return:
+        """
+        if self.__closed:
+            worker.close()
+            return
+        if worker.is_alive:
+            self.__put(worker)
+            return
+
+        try:
+            self.__put(self.__new_worker())
+        except Exception:
+            threading.Thread(target=self.__refill, daemon=True).start()
+
+    def __put(self, worker: SandboxWorker):
+        self.__workers.put(worker)
+        # 放回期间进程池被关闭
+        if self.__closed: self.__drain()
+
+    def __drain(self):
+        while True:
+            try:
+                self.__workers.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __refill(self, max_delay: float = 30):
+        delay = 1
+        while not self.__closed:
+            try:
+                worker = self.__new_worker()
+            except Exception:
+                time.sleep(delay)
+                delay = min(delay * 2, max_delay)
+                continue
+
+            self.__put(worker)
+            return
+
+    def run_command(
+        self,
+        command: str,
+        cwd: str | None = None,
+        timeout: float | None = None,
+        on_output: OutputCallback | None = None,
+        cancel_event: threading.Event | None = None
+    ) -> RunResult:
+        """
+        在项目虚拟环境中运行命令(如安装依赖命令), 流式读取输出
+        :param command: 命令
+        :param cwd: 运行目录, 默认项目目录
+        :param timeout: 超时时间(单位: s), 为空时使用 install_timeout
+        :param on_output: 输出回调
+        :param cancel_event: 取消事件, 被设置时终止运行
+        :return:
+        """
+        timeout = timeout or self.__install_timeout
+        result = RunResult()
+        if cancel_event and cancel_event.is_set():
+            return RunResult(cancelled=True)
+
+        # 候选共享项目进程池, 同一虚拟环境中的安装命令串行执行
+        with self.__command_lock:
+            s_time = time.time()
+            proc = subprocess.Popen(
+                self.__venv.wrap_command(command),
+                shell=True,
+                cwd=cwd or self.__project_path,
+                env=self.__venv.env(),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                start_new_session=True
+            )
+
+            outputs = {'stdout': [], 'stderr': []}
+            output_queue: queue.Queue = queue.Queue()
+
+            def read_stream(stream_name: str, stream):
+                for line in stream:
+                    output_queue.put((stream_name, line))
+                output_queue.put((stream_name, None))
+
+            threading.Thread(target=read_stream, args=('stdout', proc.stdout), daemon=True).start()
+            threading.Thread(target=read_stream, args=('stderr', proc.stderr), daemon=True).start()
+
+            open_streams = 2
+            deadline = s_time + timeout
+            while open_streams:
+                if cancel_event and cancel_event.is_set() and not result.cancelled:
+                    result.cancelled = True
+                    kill_process(proc)
+                if time.time() > deadline and not result.timed_out:
+                    result.timed_out = True
+                    kill_process(proc)
+
+                try:
+                    stream_name, line = output_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                if line is None:
+                    open_streams -= 1
+                    continue
+                outputs[stream_name].append(line)
+                if on_output: on_output(stream_name, line)
+
+            result.returncode = proc.wait()
+            result.stdout = ''.join(outputs['stdout'])
+            result.stderr = ''.join(outputs['stderr'])
+            result.cost_time = time.time() - s_time
+            return result
+
+    def close(self):
+        self.__closed = True
+        self.__drain()
+
+
+class SandboxManager:
+
+    def __init__(self, max_pools: int = 4, **pool_kwargs):
+        """
+        沙箱进程池管理, 按项目目录创建并缓存进程池(每个项目独立虚拟环境, 项目之间安装的依赖互不影响)
+        :param max_pools: 最多缓存的进程池数, 超出时关闭最久未使用的进程池(如 api 服务每次请求新建项目目录),
+                          应不小于同时执行的请求数, 否则被关闭进程池中正在运行的测试会失败
+        :param pool_kwargs: SandboxPool 参数(不包含 project_path)
+        """
+        self.__max_pools = max(max_pools, 1)
+        self.__pool_kwargs = pool_kwargs
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=2)
+        self.__pools: OrderedDict[str, Future] = OrderedDict()
+
+    def prewarm(self, project_path: str) -> Future:
+        """
+        后台创建项目虚拟环境和预热进程(与需求分析、代码生成等步骤并行)
+        :param project_path: 项目目录
+        :return:
+        """
+        project_path = os.path.abspath(project_path)
+        evicted: list[Future] = []
+        with self.__lock:
+            # 创建失败(如虚拟环境或预热进程启动失败)的进程池不缓存, 下次获取时重新创建
+            future = self.__pools.get(project_path)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self.__pools[project_path] = self.__executor.submit(
+                    SandboxPool, project_path=project_path, **self.__pool_kwargs
+                )
+            self.__pools.move_to_end(project_path)
+            while len(self.__pools) > self.__max_pools:
+                evicted.append(self.__pools.popitem(last=False)[1])
+
+        for pool in evicted:
+            pool.add_done_callback(self.__close_pool)
+        return future
+
+    def get_pool(self, project_path: str) -> SandboxPool:
+        """
+        获取项目进程池, 未预热时立即创建
+        :param project_path: 项目目录
+        :return:
+        """
+        return self.prewarm(project_path).result()
+
+    def release(self, project_path: str):
+        """
+        关闭并移除项目进程池(如 api 服务请求结束后), 进程池仍在创建时等待创建完成后关闭
+        :param project_path: 项目目录
+        :return:
+        """
+        with self.__lock:
+            pool = self.__pools.pop(os.path.abspath(project_path), None)
+
+        if pool:
+            self.__close_pool(pool)
+
+    @staticmethod
+    def __close_pool(pool: Future):
+        try:
+            pool.result().close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.__lock:
+            pools, self.__pools = list(self.__pools.values()), OrderedDict()
+
+        for pool in pools:
+            self.__close_pool(pool)
+        self.__executor.shutdown(wait=False)
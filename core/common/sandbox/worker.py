@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+沙箱预热进程(由 SandboxWorker 使用项目虚拟环境解释器启动, 不依赖项目内其它模块)
+
+通信协议(每行一个 json):
+    stdin:  {"preload": [模块名], "limits": {...}, "ignore_warnings": bool}   初始化(仅第一行)
+            {"id": str, "file_path": str, "cwd": str, "timeout": float}      运行测试文件
+    stdout: {"event": "ready", "preloaded": [模块名]}
+            {"id": str, "event": "output", "stream": "stdout"/"stderr", "data": str}
+            {"id": str, "event": "exit", "returncode": int, "timed_out": bool, "truncated": bool}
+
+支持 fork 的系统中, 每次运行从已导入常用模块的进程 fork 子进程执行, 子进程设置 rlimit 资源限制;
+不支持 fork 时(windows)使用当前解释器新建子进程执行, 只保留超时和输出大小限制
+"""
+import codecs
+import importlib
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ENABLE_FORK = hasattr(os, 'fork')
+
+# 协议输出使用复制出的文件描述符, 子进程的标准输出重定向到管道后不会写入协议通道
+PROTOCOL_OUT = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8', buffering=1)
+PROTOCOL_LOCK = threading.Lock()
+
+
+def send(message: dict):
+    with PROTOCOL_LOCK:
+        PROTOCOL_OUT.write(json.dumps(message, ensure_ascii=False) + '\n')
+        PROTOCOL_OUT.flush()
+
+
+def set_limits(limits: dict):
+    """
+    设置资源限制(值为空或0表示不限制, 超出硬限制时使用硬限制)
+    :param limits: {'cpu_time': s, 'memory_mb': MB, 'file_size_mb': MB, 'open_files': 个数}
+    :return:
+    """
+    if resource is None: return
+
+    limit_map = {
+        'cpu_time': (resource.RLIMIT_CPU, 1),
+        'memory_mb': (resource.RLIMIT_AS, 1024 * 1024),
+        'file_size_mb': (resource.RLIMIT_FSIZE, 1024 * 1024),
+        'open_files': (resource.RLIMIT_NOFILE, 1),
+    }
+    for limit_name, (limit_type, unit) in limit_map.items():
+        limit_value = limits.get(limit_name)
+        if not limit_value: continue
+
+        soft, hard = resource.getrlimit(limit_type)
+        value = int(limit_value * unit)
+        if hard != resource.RLIM_INFINITY: value = min(value, hard)
+        try:
+            resource.setrlimit(limit_type, (value, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def run_child(file_path: str, cwd: str, out_w: int, err_w: int, limits: dict, ignore_warnings: bool):
+    """
+    [fork 子进程]重定向标准输出后运行测试文件, 不返回
+    """
+    code = 0
+    try:
+        # 独立会话(进程组), 超时时终止测试文件启动的所有子进程
+        os.setsid()
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        sys.stdout = open(1, 'w', encoding='utf-8', buffering=1, closefd=False)
+        sys.stderr = open(2, 'w', encoding='utf-8', buffering=1, closefd=False)
+        PROTOCOL_OUT.close()
+
+        set_limits(limits)
+        os.chdir(cwd)
+        sys.argv = [file_path]
+        sys.path.insert(0, os.path.dirname(file_path))
+        if ignore_warnings:
+            import warnings
+            warnings.simplefilter('ignore')
+
+        import runpy
+        runpy.run_path(file_path, run_name='__main__')
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        if not isinstance(e.code, int) and e.code is not None: print(e.code, file=sys.stderr)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def read_stream(stream_name: str, stream, output_queue: queue.Queue):
+    while True:
+        data = os.read(stream, 4096) if isinstance(stream, int) else stream.read1(4096)
+        if not data: break
+        output_queue.put((stream_name, data))
+    output_queue.put((stream_name, None))
+
+
+def run(request: dict, limits: dict, ignore_warnings: bool, max_output: int):
+    run_id = request['id']
+    file_path = request['file_path']
+    cwd = request.get('cwd') or os.path.dirname(file_path)
+    timeout = request.get('timeout') or 300
+
+    if ENABLE_FORK:
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(out_r)
+            os.close(err_r)
+            run_child(file_path, cwd, out_w, err_w, limits, ignore_warnings)
+        os.close(out_w)
+        os.close(err_w)
+        streams = {'stdout': out_r, 'stderr': err_r}
+        proc = None
+    else:
+        command = [sys.executable, '-u'] + (['-W', 'ignore'] if ignore_warnings else []) + [file_path]
+        proc = subprocess.Popen(command, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        streams = {'stdout': proc.stdout, 'stderr': proc.stderr}
+        pid = proc.pid
+
+    def kill():
+        try:
+            if proc: proc.kill()
+            else: os.killpg(pid, 9)
+        except OSError:
+            # 子进程尚未调用 setsid 时还没有独立进程组(也没有启动其它进程)
+            try:
+                os.kill(pid, 9)
+            except OSError:
+                pass
+
+    # 按输出流增量解码, 防止多字节字符被读取块截断
+    decoders = {stream_name: codecs.getincrementaldecoder('utf-8')(errors='replace') for stream_name in streams}
+    output_queue: queue.Queue = queue.Queue()
+    for stream_name, stream in streams.items():
+        threading.Thread(target=read_stream, args=(stream_name, stream, output_queue), daemon=True).start()
+
+    deadline = time.time() + timeout
+    output_size = 0
+    timed_out = False
+    truncated = False
+    open_streams = len(streams)
+
+    while open_streams:
+        try:
+            stream_name, data = output_queue.get(timeout=max(deadline - time.time(), 0.01))
+        except queue.Empty:
+            timed_out = True
+            kill()
+            deadline = time.time() + 5
+            continue
+
+        if data is None:
+            open_streams -= 1
+            tail = decoders[stream_name].decode(b'', final=True)
+            if tail and not truncated: send({'id': run_id, 'event': 'output', 'stream': stream_name, 'data': tail})
+            continue
+
+        if truncated: continue
+        output_size += len(data)
+        if max_output and output_size > max_output:
+            truncated = True
+            kill()
+            continue
+        text = decoders[stream_name].decode(data)
+        if text: send({'id': run_id, 'event': 'output', 'stream': stream_name, 'data': text})
+
+    if proc:
+        returncode = proc.wait()
+    else:
+        for stream in streams.values(): os.close(stream)
+        returncode = os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+    send({'id': run_id, 'event': 'exit', 'returncode': returncode, 'timed_out': timed_out, 'truncated': truncated})
+
+
+def main():
+    init = json.loads(sys.stdin.readline() or '{}')
+    limits = init.get('limits', {})
+    ignore_warnings = init.get('ignore_warnings', True)
+    max_output = int((limits.get('max_output_kb') or 0) * 1024)
+
+    preloaded = []
+    for module_name in init.get('preload', []):
+        try:
+            importlib.import_module(module_name)
+            preloaded.append(module_name)
+        except Exception:
+            pass
+    send({'event': 'ready', 'preloaded': preloaded})
+
+    for line in sys.stdin:
+        if not line.strip(): continue
+        request = json.loads(line)
+        try:
+            run(request, limits, ignore_warnings, max_output)
+        except Exception:
+            send({'id': request.get('id'), 'event': 'output', 'stream': 'stderr', 'data': traceback.format_exc()})
+            send({'id': request.get('id'), 'event': 'exit', 'returncode': 1, 'timed_out': False, 'truncated': False})
+
+
+if __name__ == '__main__':
+    main()
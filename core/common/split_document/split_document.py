@@ -1,4 +1,5 @@
-import importlib
+import functools
+import json
 from pathlib import Path
 from typing import Iterator, Union, Iterable
 
@@ -6,7 +7,58 @@ from langchain_text_splitters import Language
 from langchain_text_splitters.character import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
-from common.inspect.inpect_instance import InpectInstance
+from common.file.sheet import SHEET_TYPES
+from common.inspect.inpect_instance import load_class
+from core.common.load_document.load_json import LoadJson
+from core.common.split_document.split_pycode import SplitPyCode
+
+JSON_TYPES = ['json', 'jsonl', 'ndjson']
+# 使用语法树切片的 python 文件类型
+PY_TYPES = ['py', 'python']
+
+
+def split_key(file_type: str) -> str:
+    """
+    文件类型对应的切片策略, 找不到对应文件的切片策略的话, 就使用默认切片策略
+    :param file_type:
+    :return: json/python_ast/md/编程语言名/default
+    """
+    file_type = file_type if file_type != 'py_module' else 'py'
+    if file_type in JSON_TYPES: return 'json'
+    if file_type in PY_TYPES: return 'python_ast'
+    if file_type == 'md' or file_type in Language._value2member_map_: return file_type
+    return 'default'
+
+
+@functools.lru_cache(maxsize=256)
+def cached_spliter(key: str, chunk_size: int, chunk_overlap: int, separators: tuple[str, ...], kwargs: tuple):
+    """
+    按 (切片策略, 切片大小, 切片重合度, 分隔符, 拓展参数) 复用切片器实例(切片器无状态, 可在多个文件/线程间共享)
+    :param key: 切片策略
+    :param chunk_size: 切片大小
+    :param chunk_overlap: 切片重合度
+    :param separators: 默认切片策略分隔符
+    :param kwargs: 切片器拓展参数 ((参数名, 参数值), ...)
+    :return:
+    """
+    kwargs = dict(kwargs)
+    if key == 'json':
+        split_cls = load_class('langchain_text_splitters.json', 'RecursiveJsonSplitter')
+        return split_cls(max_chunk_size=chunk_size, min_chunk_size=kwargs.pop('min_chunk_size', None), **kwargs)
+
+    if key == 'md':
+        split_cls = load_class('langchain_text_splitters.markdown', 'MarkdownTextSplitter')
+        return split_cls(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+
+    if key != 'default':
+        separators = RecursiveCharacterTextSplitter.get_separators_for_language(Language(key))
+    return RecursiveCharacterTextSplitter(separators=list(separators), chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+
+
+@functools.lru_cache(maxsize=16)
+def cached_py_spliter(max_tokens: int, tokenizer: str | None) -> SplitPyCode:
+    return SplitPyCode(max_tokens=max_tokens, tokenizer=tokenizer)
+
 
 class SplitDocument:
 
@@ -16,66 +68,36 @@ class SplitDocument:
         chunk_size: int = 200,
         chunk_overlap: int = 10,
         separators: list[str] = ['\n', ' '],
+        max_tokens: int = 512,
+        tokenizer: str | None = None,
         **kwargs
     ):
+        """
+
+        :param file_type: 文件类型
+        :param chunk_size: 切片大小(字符数)
+        :param chunk_overlap: 切片重合度
+        :param separators: 默认切片策略分隔符
+        :param max_tokens: python 代码切片最大 token 数(按函数/类语法树切片)
+        :param tokenizer: python 代码切片使用的嵌入模型 tokenizer 名称或 tokenizer.json 地址, 为空时使用近似计数
+        :param kwargs: 切片器拓展参数
+        """
         self.__file_type = file_type if file_type != 'py_module' else 'py'
         self.__chunk_size = chunk_size
         self.__chunk_overlap = chunk_overlap
-        self.__separators = separators
-        self.__kwargs = kwargs
-        # print(f'self.__file_type:', self.__file_type)
-
-        self.__default_spliter = {
-            'module_path': 'langchain_text_splitters.character',
-            'class_name': 'RecursiveCharacterTextSplitter',
-            'init_args': {
-                'separators': self.__separators,
-                'chunk_size': self.__chunk_size,
-                'chunk_overlap': self.__chunk_overlap,
-                **self.__kwargs
-            }
-        }
-
-        self.__code_spliter = {
-            'module_path': 'langchain_text_splitters.character',
-            'class_name': 'RecursiveCharacterTextSplitter',
-            'init_args': {
-                'separators': RecursiveCharacterTextSplitter.get_separators_for_language(
-                    Language(Language._value2member_map_.get(self.__file_type))
-                ) if Language._value2member_map_.get(self.__file_type) else None,
-                'chunk_size': self.__chunk_size,
-                'chunk_overlap': self.__chunk_overlap,
-                **self.__kwargs
-            }
-        }
-
-        self.__split_map = {
-            'json': {
-                'module_path': 'langchain_text_splitters.json',
-                'class_name': 'RecursiveJsonSplitter',
-                'init_args': {
-                    'max_chunk_size': self.__chunk_size,
-                    'min_chunk_size': self.__kwargs.pop('min_chunk_size') if 'min_chunk_size' in self.__kwargs.keys() else None,
-                    **self.__kwargs
-                }
-            },
-            'md': {
-                'module_path': 'langchain_text_splitters.markdown',
-                'class_name': 'MarkdownTextSplitter',
-                'init_args': {
-                    'chunk_size': self.__chunk_size,
-                    'chunk_overlap': self.__chunk_overlap,
-                    **self.__kwargs
-                }
-            },
-            'default': self.__default_spliter,
-            **dict.fromkeys(list(Language._value2member_map_.keys()), self.__code_spliter),
-        }
-
-        # 找不到对应文件的分割策略的话, 就使用默认分割策略
-        if not self.__split_map.get(self.__file_type): self.__split_map[self.__file_type] = self.__default_spliter
-
-        self.__split_instance = InpectInstance(module_map=self.__split_map, module_key=self.__file_type).load_instance
+        self.__json_types = JSON_TYPES
+        self.__sheet_types = SHEET_TYPES
+
+        key = split_key(self.__file_type)
+        if key == 'python_ast':
+            self.__split_instance = cached_py_spliter(max_tokens, tokenizer)
+            return
+
+        try:
+            self.__split_instance = cached_spliter(key, chunk_size, chunk_overlap, tuple(separators), tuple(sorted(kwargs.items())))
+        except TypeError:
+            # 拓展参数不可哈希时不复用切片器
+            self.__split_instance = cached_spliter.__wrapped__(key, chunk_size, chunk_overlap, tuple(separators), tuple(kwargs.items()))
 
     @property
     def split_instance(self):
@@ -83,12 +105,108 @@ class SplitDocument:
 
     @property
     def splittable_type(self) -> list[str]:
-        return list(self.__split_map.keys())
+        return JSON_TYPES + PY_TYPES + ['md', 'default'] + list(Language._value2member_map_.keys())
 
     def split_documents(self, documents: Union[str, Path, Iterable[Document]]) -> list[Document]:
-        if self.__file_type == 'json':
-            with open(documents, 'r') as f:
-                split_json_texts = self.__split_instance.split_json(json_data=f.read())
-                return self.__split_instance.create_documents(texts=split_json_texts)
+        if self.__file_type in self.__json_types + self.__sheet_types:
+            return list(self.lazy_split_documents(documents))
+
+        return self.__split_instance.split_documents(documents=documents)
+
+    def lazy_split_documents(self, documents: Union[str, Path, Iterable[Document]]) -> Iterator[Document]:
+        """
+        [懒加载]迭代输出切片, 逐个文档切片, 不在内存中保存所有文档;
+        json/jsonl 输入文件地址时流式加载, 相邻元素合并为不超过 chunk_size 的切片; 表格按行分组切片, 每个切片重复表头
+        :param documents: 文档列表(json/jsonl 可输入文件地址)
+        :return:
+        """
+        if self.__file_type in self.__json_types:
+            if isinstance(documents, (str, Path)):
+                documents = LoadJson(file_path=documents, json_lines=self.__file_type != 'json').lazy_load()
+            yield from self.__merge_json_documents(documents)
+            return
+
+        for document in documents:
+            if self.__file_type in self.__sheet_types and 'header' in document.metadata:
+                yield from self.__split_sheet_document(document)
+                continue
+            yield from self.__split_instance.split_documents(documents=[document])
+
+    def __split_sheet_document(self, document: Document) -> Iterator[Document]:
+        """
+        [懒加载]按行分组切片表格文档(LoadSheet 输出), 每个切片以表头开头, 单行超过 chunk_size 时该行单独切片
+        :param document: 表格文档, 元数据包含 header(表头 markdown)、start_row(起始行号)
+        :return:
+        """
+        metadata = dict(document.metadata)
+        header = metadata.pop('header')
+        start_row = metadata.get('start_row', 1)
+        rows = document.page_content[len(header) + 1:].split('\n') if len(document.page_content) > len(header) else []
+        row_budget = self.__chunk_size - len(header) - 1
+
+        chunk_rows: list[str] = []
+        size = 0
+        for row_index, row in enumerate(rows):
+            if chunk_rows and size + len(row) + 1 > row_budget:
+                yield Document(
+                    page_content='\n'.join([header] + chunk_rows),
+                    metadata={**metadata, 'start_row': start_row + row_index - len(chunk_rows), 'end_row': start_row + row_index - 1}
+                )
+                chunk_rows, size = [], 0
+            chunk_rows.append(row)
+            size += len(row) + 1
+
+        if chunk_rows:
+            yield Document(
+                page_content='\n'.join([header] + chunk_rows),
+                metadata={**metadata, 'start_row': start_row + len(rows) - len(chunk_rows), 'end_row': start_row + len(rows) - 1}
+            )
+
+    def __split_json_text(self, text: str) -> list[str]:
+        """
+        拆分超过 chunk_size 的 json 元素: 对象按键递归拆分, 仍超出的文本按字符拆分
+        :param text:
+        :return:
+        """
+        value = json.loads(text)
+        texts = self.__split_instance.split_text(json_data=value) if isinstance(value, dict) else [text]
+
+        split_texts = []
+        text_spliter = None
+        for split_text in texts:
+            if len(split_text) <= self.__chunk_size:
+                split_texts.append(split_text)
+                continue
+            if not text_spliter:
+                text_spliter = RecursiveCharacterTextSplitter(
+                    separators=[', ', ' ', ''],
+                    chunk_size=self.__chunk_size,
+                    chunk_overlap=self.__chunk_overlap
+                )
+            split_texts.extend(text_spliter.split_text(split_text))
+
+        return split_texts
+
+    def __merge_json_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        [懒加载]合并相邻 json 元素为不超过 chunk_size 的切片, 切片元数据使用第一个元素的元数据
+        :param documents: json 元素文档
+        :return:
+        """
+        texts: list[str] = []
+        metadata: dict = {}
+        size = 0
+
+        for document in documents:
+            split_texts = [document.page_content] if len(document.page_content) <= self.__chunk_size \
+                else self.__split_json_text(document.page_content)
+
+            for text in split_texts:
+                if texts and size + len(text) + 1 > self.__chunk_size:
+                    yield Document(page_content='\n'.join(texts), metadata=metadata)
+                    texts, size = [], 0
+                if not texts: metadata = dict(document.metadata)
+                texts.append(text)
+                size += len(text) + 1
 
-        return self.__split_instance.split_documents(documents=documents)
\ No newline at end of file
+        if texts: yield Document(page_content='\n'.join(texts), metadata=metadata)
@@ -0,0 +1,207 @@
+import ast
+import os
+from typing import Iterable, Iterator
+
+from langchain_core.documents import Document
+from pydantic import BaseModel, Field
+
+from common.file.file import py_module_path
+from core.common.split_document.token_counter import TokenCounter, token_counter
+
+DEF_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+class CodeChunk(BaseModel):
+    text: str = Field(description='切片代码(包含所属类/函数的定义行作为上下文)')
+    qualname: str = Field(description='限定名, 如: pkg.module.Class.method')
+    kind: str = Field(description='切片类型: module/class/function/method')
+    start_line: int = Field(description='起始行号(相对文档, 从1开始)')
+    end_line: int = Field(description='结束行号(相对文档, 包含)')
+    tokens: int = Field(description='token 数')
+
+
+class SplitPyCode:
+
+    def __init__(self, max_tokens: int = 512, tokenizer: str | None = None, counter: TokenCounter | None = None):
+        """
+        python 代码语法树切片: 按函数/类切片, 超过 token 上限的类按方法拆分, 函数按语句拆分, 模块级代码按语句合并;
+        token 数使用嵌入模型的 tokenizer 计算, 切片元数据记录限定名(qualname)
+        :param max_tokens: 单个切片最大 token 数
+        :param tokenizer: 嵌入模型 tokenizer 名称或 tokenizer.json 地址, 为空时使用近似计数
+        :param counter: token 计数器(不为空时忽略 tokenizer)
+        """
+        self.__max_tokens = max_tokens
+        self.__counter = counter if counter else token_counter(tokenizer)
+
+    def split_documents(self, documents: Iterable[Document]) -> list[Document]:
+        return list(self.lazy_split_documents(documents))
+
+    def lazy_split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        [懒加载]切片 LanguageParser/LoadPyCode 输出的代码文档, 模块名优先使用元数据 py_module, 否则根据文件地址计算
+        :param documents:
+        :return:
+        """
+        for document in documents:
+            source = str(document.metadata.get('source', ''))
+            module = document.metadata.get('py_module')
+            if module is None:
+                module = py_module_path(source).get('module', '') if source.endswith('.py') and os.path.isfile(source) else ''
+
+            for chunk in self.split_code(document.page_content, module=module):
+                yield Document(
+                    page_content=chunk.text,
+                    metadata={**document.metadata, **chunk.model_dump(exclude={'text'})}
+                )
+
+    def split_code(self, code: str, module: str = '') -> list[CodeChunk]:
+        """
+        切片代码文本, 语法错误时按行合并切片
+        :param code: 代码文本
+        :param module: 模块名(限定名前缀)
+        :return:
+        """
+        lines = code.splitlines()
+        if not lines: return []
+
+        try:
+            nodes = ast.parse(code).body
+        except SyntaxError:
+            return list(self.__split_lines(lines, 1, len(lines), module, 'module', []))
+
+        return list(self.__split_block(lines, nodes, 1, len(lines), module, 'module', []))
+
+    def __chunk(self, lines: list[str], start: int, end: int, qualname: str, kind: str, context: list[str], tokens: int | None = None) -> CodeChunk:
+        text = '\n'.join(context + lines[start - 1: end])
+        return CodeChunk(
+            text=text,
+            qualname=qualname,
+            kind=kind,
+            start_line=start,
+            end_line=end,
+            tokens=tokens if tokens is not None else self.__counter.count(text)
+        )
+
+    @staticmethod
+    def __node_start(node: ast.stmt) -> int:
+        decorators = getattr(node, 'decorator_list', [])
+        return min([node.lineno] + [decorator.lineno for decorator in decorators])
+
+    def __split_block(
+        self,
+        lines: list[str],
+        nodes: list[ast.stmt],
+        start: int,
+        end: int,
+        qualname: str,
+        kind: str,
+        context: list[str]
+    ) -> Iterator[CodeChunk]:
+        """
+        [懒加载]切片连续语句: 函数/类单独切片, 其它语句(包括语句间的注释和空行)按 token 上限合并
+        :param lines: 文档所有行
+        :param nodes: 语句节点
+        :param start: 起始行号
+        :param end: 结束行号
+        :param qualname: 所属限定名
+        :param kind: 非函数/类语句的切片类型
+        :param context: 上下文行(所属类/函数的定义行)
+        :return:
+        """
+        context_tokens = self.__counter.count('\n'.join(context)) if context else 0
+
+        # 每个语句覆盖到下一个语句开始前一行, 第一个语句从 start 开始
+        node_starts = [max(self.__node_start(node), start) for node in nodes]
+        spans = []
+        for index, node in enumerate(nodes):
+            span_start = start if index == 0 else node_starts[index]
+            span_end = node_starts[index + 1] - 1 if index + 1 < len(nodes) else end
+            spans.append((node, span_start, span_end))
+
+        group_start, group_end, group_tokens = None, None, context_tokens
+
+        def flush_group() -> Iterator[CodeChunk]:
+            if group_start is None: return
+            yield self.__chunk(lines, group_start, group_end, qualname, kind, context, tokens=group_tokens)
+
+        for node, span_start, span_end in spans:
+            if isinstance(node, DEF_NODES):
+                yield from flush_group()
+                group_start, group_end, group_tokens = None, None, context_tokens
+                yield from self.__split_def(lines, node, span_start, span_end, qualname, kind, context, context_tokens)
+                continue
+
+            span_tokens = self.__counter.count('\n'.join(lines[span_start - 1: span_end]))
+            if group_start is not None and group_tokens + span_tokens > self.__max_tokens:
+                yield from flush_group()
+                group_start, group_end, group_tokens = None, None, context_tokens
+
+            if context_tokens + span_tokens > self.__max_tokens:
+                yield from self.__split_lines(lines, span_start, span_end, qualname, kind, context)
+                continue
+
+            if group_start is None: group_start = span_start
+            group_end = span_end
+            group_tokens += span_tokens
+
+        yield from flush_group()
+
+    def __split_def(
+        self,
+        lines: list[str],
+        node: ast.stmt,
+        start: int,
+        end: int,
+        qualname: str,
+        parent_kind: str,
+        context: list[str],
+        context_tokens: int
+    ) -> Iterator[CodeChunk]:
+        """
+        [懒加载]切片函数/类: 未超出 token 上限时整体切片, 否则定义行和文档字符串单独切片, 函数体/类体以定义行为上下文继续切片
+        :return:
+        """
+        name = f'{qualname}.{node.name}' if qualname else node.name
+        kind = 'class' if isinstance(node, ast.ClassDef) else ('method' if parent_kind == 'class' else 'function')
+
+        tokens = context_tokens + self.__counter.count('\n'.join(lines[start - 1: end]))
+        if tokens <= self.__max_tokens:
+            yield self.__chunk(lines, start, end, name, kind, context, tokens=tokens)
+            return
+
+        body = list(node.body)
+        body_start = self.__node_start(body[0])
+        header_end = body_start - 1
+        # 文档字符串归入定义切片
+        if isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], 'value', None), ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            header_end = body[0].end_lineno
+            body = body[1:]
+
+        # 单行定义(如 def f(): return 1)无法继续拆分
+        if header_end < start or not body:
+            yield from self.__split_lines(lines, start, end, name, kind, context)
+            return
+
+        signature = lines[self.__node_start(node) - 1: max(body_start - 1, node.lineno)]
+        yield from self.__split_lines(lines, start, header_end, name, kind, context)
+        yield from self.__split_block(lines, body, header_end + 1, end, name, kind, context + signature)
+
+    def __split_lines(self, lines: list[str], start: int, end: int, qualname: str, kind: str, context: list[str]) -> Iterator[CodeChunk]:
+        """
+        [懒加载]按行合并切片, 单行超过 token 上限时单独切片
+        :return:
+        """
+        context_tokens = self.__counter.count('\n'.join(context)) if context else 0
+        chunk_start, chunk_tokens = None, context_tokens
+
+        for line_number in range(start, end + 1):
+            line_tokens = self.__counter.count(lines[line_number - 1]) + 1
+            if chunk_start is not None and chunk_tokens + line_tokens > self.__max_tokens:
+                yield self.__chunk(lines, chunk_start, line_number - 1, qualname, kind, context, tokens=chunk_tokens)
+                chunk_start, chunk_tokens = None, context_tokens
+            if chunk_start is None: chunk_start = line_number
+            chunk_tokens += line_tokens
+
+        if chunk_start is not None and any(line.strip() for line in lines[chunk_start - 1: end]):
+            yield self.__chunk(lines, chunk_start, end, qualname, kind, context, tokens=chunk_tokens)
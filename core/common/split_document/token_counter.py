@@ -0,0 +1,74 @@
+import functools
+import math
+import os
+import re
+
+from common.logger.logging import Logger
+
+logger = Logger.get_instance(__file__)
+
+# 近似计数: 中日韩字符按单字计数, 单词按长度折算(子词切分), 其它符号单独计数
+APPROX_TOKEN_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]')
+
+
+class TokenCounter:
+
+    def __init__(self, tokenizer: str | None = None):
+        """
+        切片 token 计数, 使用嵌入模型的 tokenizer(需安装 tokenizers), 未配置或加载失败时使用近似计数
+        :param tokenizer: huggingface tokenizer 名称(如 BAAI/bge-m3)或本地 tokenizer.json 地址
+        """
+        self.__tokenizer = None
+        if not tokenizer: return
+
+        try:
+            from tokenizers import Tokenizer
+            self.__tokenizer = Tokenizer.from_file(tokenizer) if os.path.isfile(tokenizer) else Tokenizer.from_pretrained(tokenizer)
+        except Exception as e:
+            logger.warning(f'* tokenizer【{tokenizer}】加载失败, 使用近似 token 计数: {str(e)}')
+
+    @property
+    def is_exact(self) -> bool:
+        return self.__tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if self.__tokenizer is not None:
+            return len(self.__tokenizer.encode(text, add_special_tokens=False).ids)
+
+        count = 0
+        for token in APPROX_TOKEN_PATTERN.findall(text):
+            count += self.__approx_count(token)
+        return count
+
+    @staticmethod
+    def __approx_count(token: str) -> int:
+        return math.ceil(len(token) / 6) if token[0].isascii() and (token[0].isalnum() or token[0] == '_') else 1
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        截断文本到不超过 max_tokens 个 token
+        :param text:
+        :param max_tokens: 最大 token 数
+        :return:
+        """
+        if max_tokens <= 0: return ''
+
+        if self.__tokenizer is not None:
+            offsets = self.__tokenizer.encode(text, add_special_tokens=False).offsets
+            return text if len(offsets) <= max_tokens else text[:offsets[max_tokens - 1][1]]
+
+        count = 0
+        for match in APPROX_TOKEN_PATTERN.finditer(text):
+            count += self.__approx_count(match.group())
+            if count > max_tokens: return text[:match.start()]
+        return text
+
+
+@functools.lru_cache(maxsize=8)
+def token_counter(tokenizer: str | None = None) -> TokenCounter:
+    """
+    同一 tokenizer 只加载一次
+    :param tokenizer:
+    :return:
+    """
+    return TokenCounter(tokenizer=tokenizer)
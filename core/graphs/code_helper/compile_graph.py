@@ -1,25 +1,42 @@
-import os.path
 import sys
+import threading
 import time
 import traceback
-from itertools import chain
 from pathlib import Path
 import uuid
 import warnings
+from collections.abc import Generator, Iterator
 
+from langchain_core.messages import AIMessageChunk
+from langgraph.graph.state import CompiledStateGraph
 from weaviate.config import AdditionalConfig, Timeout
 
-from common.error.load import UnLoadableError
-from common.file.file import iter_file_infos
-
 sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
 from common.config.config import YAML_CONFIGS_INFO
+from common.error.graph import GraphCancelledError
+from common.error.smtp import SendMailError
+from common.file.file_walker import FileWalker
+from common.logger.logging import Logger
+from common.redis.redis_client import RedisClient
 from common.smtp.send_mail import SendMail
 from core.agent.llm_agent import LLMAgent
+from core.common.rag.base_vector_store import BaseVectorStore
+from core.common.rag.base_web_search import BaseWebSearch
+from core.common.rag.dedup import ChunkDedup
 from core.common.rag.embedding import EmbeddingClient
-from core.common.rag.rerank import RerankClient
+from core.common.rag.embedding_cache import EmbeddingCache
+from core.common.rag.ingest import IngestPipeline
+from core.common.rag.local_vector_store import LocalVectorStore
+from core.common.rag.local_web_search import LocalWebSearch
+from core.common.rag.query_cache import QueryCache
+from core.common.rag.rerank import RerankClient, AdaptiveReranker
+from core.common.rag.retrieval import RetrievalOrchestrator
 from core.common.rag.vector_stores import WeaviateClient
+from core.common.rag.web_search import TavilySearch
+from core.common.rag.web_search_cache import WebSearchCache
+from core.common.rag.workspace_sync import WorkspaceSync
+from core.common.sandbox.sandbox import SandboxManager
 from core.graphs.base_graph import BaseGraph
 from core.graphs.code_helper.end_graph import EndGraph
 from core.graphs.code_helper.exec_graph import ExecGraph
@@ -30,16 +47,222 @@ from core.state.code_helper import CodeHelperState
 # python3 -W ignore script.py
 warnings.filterwarnings("ignore")
 
+logger = Logger.get_instance(__file__)
+
+
+def init_embedding_cache() -> EmbeddingCache | None:
+    """
+    按配置初始化向量缓存, 未开启时返回 None
+    :return:
+    """
+    cache_config = YAML_CONFIGS_INFO.get('code_helper', {}).get('vector_store', {}).get('embedding_client', {}).get('cache', {})
+    if not cache_config or not cache_config.get('enable', False):
+        return None
+
+    return EmbeddingCache(
+        db_path=cache_config.get('db_path'),
+        max_size_mb=cache_config.get('max_size_mb', 2048)
+    )
+
+
+def init_deduplicator() -> ChunkDedup | None:
+    """
+    按配置初始化切片去重, 未开启时返回 None
+    :return:
+    """
+    dedup_config = YAML_CONFIGS_INFO.get('code_helper', {}).get('vector_store', {}).get('dedup', {})
+    if not dedup_config or not dedup_config.get('enable', False):
+        return None
+
+    return ChunkDedup(**{key: val for key, val in dedup_config.items() if key != 'enable'})
+
+
+def init_query_cache() -> QueryCache | None:
+    """
+    按配置初始化检索结果缓存, 未开启时返回 None
+    :return:
+    """
+    cache_config = YAML_CONFIGS_INFO.get('code_helper', {}).get('vector_store', {}).get('query_cache', {})
+    if not cache_config or not cache_config.get('enable', False):
+        return None
+
+    redis_config = cache_config.get('redis', {})
+    return QueryCache(
+        max_size=cache_config.get('max_size', 1024),
+        ttl=cache_config.get('ttl', 600),
+        redis_client=RedisClient(**redis_config) if redis_config else None
+    )
+
+
+def init_vector_store() -> BaseVectorStore:
+    """
+    按配置初始化向量数据库(包含嵌入模型、重排模型客户端), backend 为 local 时使用进程内本地向量库, 否则使用 weaviate
+    :return:
+    """
+    embedding_client = EmbeddingClient(
+        base_url=YAML_CONFIGS_INFO['code_helper']['vector_store']['embedding_client']['base_url'],
+        model_uid=YAML_CONFIGS_INFO['code_helper']['vector_store']['embedding_client']['model_uid'],
+        cache=init_embedding_cache()
+    )
+    rerank_client = RerankClient(
+        base_url=YAML_CONFIGS_INFO['code_helper']['vector_store']['rerank_client']['base_url'],
+        model_uid=YAML_CONFIGS_INFO['code_helper']['vector_store']['rerank_client']['model_uid']
+    )
+    adaptive_config = YAML_CONFIGS_INFO['code_helper']['vector_store']['rerank_client'].get('adaptive', {}) or {}
+    reranker = AdaptiveReranker(
+        rerank_client=rerank_client,
+        max_length=adaptive_config.get('max_length'),
+        skip_margin=adaptive_config.get('skip_margin'),
+        max_pairs=adaptive_config.get('max_pairs'),
+        max_workers=adaptive_config.get('max_workers', 4),
+        tokenizer=adaptive_config.get('tokenizer')
+    )
+
+    if YAML_CONFIGS_INFO['code_helper']['vector_store'].get('backend', 'weaviate') == 'local':
+        return LocalVectorStore(
+            embedding_client=embedding_client,
+            rerank_client=rerank_client,
+            reranker=reranker,
+            query_cache=init_query_cache(),
+            **YAML_CONFIGS_INFO['code_helper']['vector_store'].get('local', {})
+        )
+
+    return WeaviateClient(
+        embedding_client=embedding_client,
+        rerank_client=rerank_client,
+        reranker=reranker,
+        port=YAML_CONFIGS_INFO['code_helper']['vector_store']['port'],
+        grpc_port=YAML_CONFIGS_INFO['code_helper']['vector_store']['grpc_port'],
+        additional_config=AdditionalConfig(
+            timeout=Timeout(
+                init=YAML_CONFIGS_INFO['code_helper']['vector_store']['additional_config']['timeout']['init'],
+                query=YAML_CONFIGS_INFO['code_helper']['vector_store']['additional_config']['timeout']['query'],
+                insert=YAML_CONFIGS_INFO['code_helper']['vector_store']['additional_config']['timeout']['insert'],
+            )  # 单位: s
+        ),
+        query_cache=init_query_cache(),
+        pool_size=YAML_CONFIGS_INFO['code_helper']['vector_store'].get('pool_size', 2),
+        health_check_interval=YAML_CONFIGS_INFO['code_helper']['vector_store'].get('health_check_interval', 30),
+        quantization=YAML_CONFIGS_INFO['code_helper']['vector_store'].get('quantization'),
+        collection_quantization=YAML_CONFIGS_INFO['code_helper']['vector_store'].get('collection_quantization')
+    )
+
+
+def init_sandbox_manager() -> SandboxManager | None:
+    """
+    按配置初始化沙箱进程池管理, 未开启时返回 None
+    :return:
+    """
+    sandbox_config = dict(YAML_CONFIGS_INFO.get('code_helper', {}).get('sandbox', {}) or {})
+    if not sandbox_config or not sandbox_config.pop('enable', False):
+        return None
+
+    return SandboxManager(**{key: value for key, value in sandbox_config.items() if value is not None})
+
+
+def init_web_search(tavily_api_key: str | None = None) -> BaseWebSearch | None:
+    """
+    按配置初始化网页搜索客户端(包含搜索结果缓存), provider 为 local 时使用离线语料, 否则使用 tavily(未配置 tavily_api_key 时返回 None)
+    :param tavily_api_key: tavily 搜索引擎 api_key, 为空时读取配置
+    :return:
+    """
+    web_search_config = YAML_CONFIGS_INFO.get('code_helper', {}).get('web_search', {}) or {}
+    chunk_size = YAML_CONFIGS_INFO.get('code_helper', {}).get('chunk_size', 200)
+    tavily_api_key = tavily_api_key if tavily_api_key else YAML_CONFIGS_INFO.get('code_helper', {}).get('tavily_api_key')
+    provider = web_search_config.get('provider', 'tavily')
+    if provider != 'local' and not tavily_api_key: return None
+
+    cache_config = web_search_config.get('cache', {}) or {}
+    cache = WebSearchCache(
+        db_path=cache_config.get('db_path'),
+        ttl=cache_config.get('ttl', 86400),
+        max_size_mb=cache_config.get('max_size_mb', 256)
+    ) if cache_config.get('enable', False) else None
+
+    if provider == 'local':
+        local_config = web_search_config.get('local', {}) or {}
+        return LocalWebSearch(
+            corpus_dir=local_config.get('corpus_dir'),
+            max_results=web_search_config.get('max_results', 2),
+            max_chars=chunk_size,
+            cache=cache,
+            passage_size=local_config.get('passage_size') or chunk_size,
+            passage_overlap=local_config.get('passage_overlap', 50)
+        )
+
+    retrieval_config = YAML_CONFIGS_INFO.get('code_helper', {}).get('retrieval', {}) or {}
+    return TavilySearch(
+        api_key=tavily_api_key,
+        max_results=web_search_config.get('max_results', 2),
+        max_chars=chunk_size,
+        cache=cache,
+        timeout=web_search_config.get('timeout', 10),
+        max_connections=retrieval_config.get('max_workers', 8)
+    )
+
+
+def init_retrieval_orchestrator() -> RetrievalOrchestrator:
+    """
+    按配置初始化检索编排
+    :return:
+    """
+    retrieval_config = YAML_CONFIGS_INFO.get('code_helper', {}).get('retrieval', {}) or {}
+    return RetrievalOrchestrator(
+        max_workers=retrieval_config.get('max_workers', 8),
+        deadline=retrieval_config.get('deadline', 15)
+    )
+
+
+def init_agent_client(code_type: str, install_tool: str, chat_model: any = None) -> LLMAgent:
+    """
+    按配置初始化代码生成智能体, 每次对话使用独立的 chat_id 和对话记忆
+    :param code_type: 生成代码类型
+    :param install_tool: 安装第三方依赖工具
+    :param chat_model: 共享的对话模型客户端, 为空时新建
+    :return:
+    """
+    extra_body = YAML_CONFIGS_INFO.get('code_helper', {}).get('agent_client', {}).get('extra_body', {})
+    return LLMAgent(
+        base_url=YAML_CONFIGS_INFO['code_helper']['agent_client']['base_url'],
+        api_key=YAML_CONFIGS_INFO['code_helper']['agent_client']['api_key'],
+        model=YAML_CONFIGS_INFO['code_helper']['agent_client']['model'],
+        system_propt=GenCodeSysPrompt.format(
+            code_type=code_type,
+            install_tool=install_tool
+        ),
+        extra_body={} if not extra_body else extra_body,
+        chat_id=str(uuid.uuid1()),
+        chat_model=chat_model,
+        tools=[]
+    )
+
+
+def init_send_mail() -> SendMail:
+    """
+    按配置初始化邮件客户端
+    :return:
+    """
+    return SendMail(
+        from_mail=YAML_CONFIGS_INFO['code_helper']['send_mail']['from_mail'],
+        to_mail=YAML_CONFIGS_INFO['code_helper']['send_mail']['to_mail'],
+        auth_code=YAML_CONFIGS_INFO['code_helper']['send_mail']['auth_code'],
+    )
+
+
 class CompileGraph:
     def __init__(
         self,
         enable_mutual: bool = True,
-        vector_store: WeaviateClient | None = None,
+        vector_store: BaseVectorStore | None = None,
         agent_client: LLMAgent | None = None,
         send_mail: SendMail | None = None,
         code_type: str | None = None,
         install_tool: str | None = None,
-        tavily_api_key: str | None =None
+        tavily_api_key: str | None =None,
+        web_search: BaseWebSearch | None = None,
+        retrieval_orchestrator: RetrievalOrchestrator | None = None,
+        sandbox_manager: SandboxManager | None = None,
+        deduplicator: ChunkDedup | None = None
     ):
         self.__vector_store = vector_store
         self.__agent_client = agent_client
@@ -50,55 +273,55 @@ class CompileGraph:
         self.__install_tool = install_tool if install_tool else YAML_CONFIGS_INFO['code_helper']['install_tool']
         self.__tavily_api_key = tavily_api_key if tavily_api_key else YAML_CONFIGS_INFO['code_helper']['tavily_api_key']
         self.__chunk_size = YAML_CONFIGS_INFO.get('code_helper', {}).get('chunk_size', 200)
-        self.__chunk_overlap = YAML_CONFIGS_INFO.get('code_helper', {}).get('chunk_size', 20)
+        self.__chunk_overlap = YAML_CONFIGS_INFO.get('code_helper', {}).get('chunk_overlap', 20)
         self.__running_command = YAML_CONFIGS_INFO['code_helper']['running_command']
-
+        self.__best_of_n = YAML_CONFIGS_INFO.get('code_helper', {}).get('best_of_n', 1)
+        # 外部传入的沙箱进程池管理由调用方管理生命周期(如 api 服务进程内共享预热进程), 只关闭自己创建的
+        self.__own_sandbox = not sandbox_manager
+        self.__sandbox_manager = sandbox_manager if sandbox_manager else init_sandbox_manager()
+        self.__retrieval_config = YAML_CONFIGS_INFO.get('code_helper', {}).get('retrieval', {}) or {}
+        # 外部传入的网页搜索客户端和检索编排由调用方管理生命周期, 只关闭自己创建的
+        self.__own_web_search = not web_search
+        self.__own_retrieval = not retrieval_orchestrator
+        self.__web_search = web_search if web_search else init_web_search(self.__tavily_api_key)
+        self.__retrieval_orchestrator = retrieval_orchestrator if retrieval_orchestrator else init_retrieval_orchestrator()
+
+        # 外部传入的向量数据库由调用方管理生命周期(如 api 服务所有请求共享), 只关闭自己创建的
+        self.__own_vector_store = not self.__vector_store
         if not self.__vector_store:
-            self.__vector_store = WeaviateClient(
-                embedding_client=EmbeddingClient(
-                    base_url=YAML_CONFIGS_INFO['code_helper']['vector_store']['embedding_client']['base_url'],
-                    model_uid=YAML_CONFIGS_INFO['code_helper']['vector_store']['embedding_client']['model_uid']
-                ).xinference_embeddings,
-                rerank_client=RerankClient(
-                    base_url=YAML_CONFIGS_INFO['code_helper']['vector_store']['rerank_client']['base_url'],
-                    model_uid=YAML_CONFIGS_INFO['code_helper']['vector_store']['embedding_client']['model_uid']
-                ),
-                port=YAML_CONFIGS_INFO['code_helper']['vector_store']['port'],
-                grpc_port=YAML_CONFIGS_INFO['code_helper']['vector_store']['grpc_port'],
-                additional_config=AdditionalConfig(
-                    timeout=Timeout(
-                        init=YAML_CONFIGS_INFO['code_helper']['vector_store']['additional_config']['timeout']['init'],
-                        query=YAML_CONFIGS_INFO['code_helper']['vector_store']['additional_config']['timeout']['query'],
-                        insert=YAML_CONFIGS_INFO['code_helper']['vector_store']['additional_config']['timeout']['insert'],
-                    )  # 单位: s
-                )
-            )
+            self.__vector_store = init_vector_store()
+
+        # 外部传入的切片去重(sqlite 连接)由调用方管理生命周期, 只关闭自己创建的
+        self.__own_deduplicator = not deduplicator
+        self.__deduplicator = deduplicator if deduplicator else init_deduplicator()
+        self.__ingest_pipeline = IngestPipeline(
+            vector_store=self.__vector_store,
+            chunk_size=self.__chunk_size,
+            chunk_overlap=self.__chunk_overlap,
+            file_walker=FileWalker(**YAML_CONFIGS_INFO.get('code_helper', {}).get('vector_store', {}).get('file_walker', {})),
+            deduplicator=self.__deduplicator,
+            **YAML_CONFIGS_INFO.get('code_helper', {}).get('vector_store', {}).get('ingest', {})
+        )
+        self.__sync_config = YAML_CONFIGS_INFO.get('code_helper', {}).get('vector_store', {}).get('sync', {})
+        self.__workspace_sync = WorkspaceSync(
+            ingest_pipeline=self.__ingest_pipeline,
+            manifest_dir=self.__sync_config.get('manifest_dir')
+        )
 
         if not self.__agent_client:
-            self.__extra_body = YAML_CONFIGS_INFO.get('code_helper', {}).get('agent_client', {}).get('extra_body', {})
-            self.__agent_client = LLMAgent(
-                base_url=YAML_CONFIGS_INFO['code_helper']['agent_client']['base_url'],
-                api_key=YAML_CONFIGS_INFO['code_helper']['agent_client']['api_key'],
-                model=YAML_CONFIGS_INFO['code_helper']['agent_client']['model'],
-                system_propt=GenCodeSysPrompt.format(
-                    code_type=self.__code_type,
-                    install_tool=self.__install_tool
-                ),
-                extra_body={} if not self.__extra_body else self.__extra_body,
-                chat_id=str(uuid.uuid1()),
-                tools=[]
-            )
+            self.__agent_client = init_agent_client(code_type=self.__code_type, install_tool=self.__install_tool)
 
         if not self.__send_mail:
-            self.__send_mail = SendMail(
-                from_mail=YAML_CONFIGS_INFO['code_helper']['send_mail']['from_mail'],
-                to_mail=YAML_CONFIGS_INFO['code_helper']['send_mail']['to_mail'],
-                auth_code=YAML_CONFIGS_INFO['code_helper']['send_mail']['auth_code'],
-            )
-
-
-    def compile_and_run(self, graph_class, graph_name: str, **kwargs) -> CodeHelperState:
+            self.__send_mail = init_send_mail()
 
+    def __compile(self, graph_class, graph_name: str, **kwargs) -> tuple[CompiledStateGraph, dict, dict]:
+        """
+        编译子图
+        :param graph_class: 子图类
+        :param graph_name: 子图名
+        :param kwargs: 子图初始化参数, 以及 input_data(子图输入)、config(子图执行配置)
+        :return: (编译后的子图, 子图输入, 子图执行配置)
+        """
         input_data = kwargs.pop("input_data", {})
         config = kwargs.pop("config", {})
         kwargs['enable_mutual'] = self.__enable_mutual
@@ -114,22 +337,143 @@ class CompileGraph:
         if "recursion_limit" not in config:
             config["recursion_limit"] = len(edge_maps) * max_retry * 2 if graph_name == 'ExecGraph' else len(edge_maps)
 
+        return graph, input_data, config
+
+    def compile_and_run(self, graph_class, graph_name: str, **kwargs) -> CodeHelperState:
+
+        graph, input_data, config = self.__compile(graph_class=graph_class, graph_name=graph_name, **kwargs)
         result = graph.invoke(input=input_data, config=config)
         return CodeHelperState(**result)
 
+    def compile_and_stream(
+        self,
+        graph_class,
+        graph_name: str,
+        cancel_event: threading.Event | None = None,
+        **kwargs
+    ) -> Generator[dict, None, CodeHelperState]:
+        """
+        流式执行子图, 迭代输出节点完成事件和大模型 token, 生成器返回值为子图最终状态
+        :param graph_class: 子图类
+        :param graph_name: 子图名
+        :param cancel_event: 取消事件, 被设置时停止执行子图并抛出 GraphCancelledError(ExecGraph 同时终止正在运行的安装和测试进程)
+        :param kwargs: 同 compile_and_run
+        :return:
+        """
+        if cancel_event and graph_name == 'ExecGraph':
+            kwargs['cancel_event'] = cancel_event
+        graph, input_data, config = self.__compile(graph_class=graph_class, graph_name=graph_name, **kwargs)
+        result = input_data
+
+        for stream_mode, chunk in graph.stream(input=input_data, config=config, stream_mode=["updates", "messages", "values"]):
+            if cancel_event and cancel_event.is_set():
+                raise GraphCancelledError()
+            if stream_mode == 'values':
+                result = chunk
+            elif stream_mode == 'updates':
+                for node_name in chunk:
+                    yield {'event': 'node', 'data': {'graph': graph_name, 'node': node_name}}
+            elif stream_mode == 'messages':
+                message_chunk, metadata = chunk
+                if isinstance(message_chunk, AIMessageChunk) and message_chunk.content:
+                    yield {'event': 'token', 'data': {'graph': graph_name, 'content': message_chunk.content}}
+
+        return CodeHelperState(**result)
+
+    def __graph_steps(self) -> list[tuple[type, str, dict]]:
+        """
+        子图执行顺序及各子图初始化参数: InitGraph -> ExecGraph -> EndGraph
+        :return:
+        """
+        return [
+            (InitGraph, 'InitGraph', {
+                'vector_store': self.__vector_store,
+                'workspace_sync': self.__workspace_sync,
+                'chunk_size': self.__chunk_size,
+                'chunk_overlap': self.__chunk_overlap
+            }),
+            (ExecGraph, 'ExecGraph', {
+                'install_tool': self.__install_tool,
+                'agent_client': self.__agent_client,
+                'vector_store': self.__vector_store,
+                'tavily_api_key': self.__tavily_api_key,
+                'web_search': self.__web_search,
+                'retrieval_orchestrator': self.__retrieval_orchestrator,
+                'retrieval_config': self.__retrieval_config,
+                'chunk_size': self.__chunk_size,
+                'running_command': self.__running_command,
+                'best_of_n': self.__best_of_n,
+                'sandbox_manager': self.__sandbox_manager,
+                'install_config': YAML_CONFIGS_INFO.get('code_helper', {}).get('install', {})
+            }),
+            (EndGraph, 'EndGraph', {
+                'send_mail': self.__send_mail
+            })
+        ]
+
+    def stream_run(
+        self,
+        prompt: str,
+        global_setting: dict | None = None,
+        data_source: dict | None = None,
+        cancel_event: threading.Event | None = None
+    ) -> Iterator[dict]:
+        """
+        [非交互]流式执行代码生成器, 不关闭共享的向量数据库连接
+        :param prompt: 编码需求
+        :param global_setting: 全局设置(同 GlobalSetting 字段), 为空时使用默认配置
+        :param data_source: 数据源(同 DataSource 字段), 为空时使用默认配置
+        :param cancel_event: 取消事件(如 api 服务客户端断开连接), 被设置时停止执行并终止正在运行的安装和测试进程
+        :return: 事件迭代器, 事件格式: {'event': 'graph'/'node'/'token'/'result'/'cancelled'/'error', 'data': dict}
+        """
+        input_data = {'prompt': prompt}
+        if global_setting: input_data['global_setting'] = global_setting
+        if data_source: input_data['data_source'] = data_source
+
+        try:
+            for graph_class, graph_name, graph_kwargs in self.__graph_steps():
+                yield {'event': 'graph', 'data': {'graph': graph_name}}
+                if graph_name == 'ExecGraph':
+                    graph_kwargs['max_retry'] = input_data.get('global_setting', {}).get('max_retry', 3)
+                if graph_name == 'EndGraph':
+                    # api 服务不在服务器本机响铃
+                    graph_kwargs['enable_bell'] = False
+
+                result = yield from self.compile_and_stream(
+                    graph_class=graph_class,
+                    graph_name=graph_name,
+                    cancel_event=cancel_event,
+                    input_data=input_data,
+                    **graph_kwargs
+                )
+                input_data = result.model_dump()
+
+            yield {'event': 'result', 'data': input_data}
+        except GraphCancelledError as e:
+            logger.info(f'代码生成器已取消执行: {str(e)}')
+            yield {'event': 'cancelled', 'data': {'error': str(e)}}
+        except Exception as e:
+            logger.exception(f'代码生成器执行出现异常: {str(e)}')
+            self.__send_error_mail(prompt=prompt)
+            yield {'event': 'error', 'data': {'error': str(e)}}
+        finally:
+            self.__close_sandbox()
+            self.__close_retrieval()
+            self.__close_deduplicator()
+
     def run(self, prompt):
 
         end_result = {}
 
         try:
+            init_steps, exec_steps, end_steps = self.__graph_steps()
+
             # Step 1: InitGraph
             init_result = self.compile_and_run(
-                graph_class=InitGraph,
-                graph_name='InitGraph',
-                vector_store=self.__vector_store,
+                graph_class=init_steps[0],
+                graph_name=init_steps[1],
                 input_data={"prompt": prompt},
-                chunk_size=self.__chunk_size,
-                chunk_overlap=self.__chunk_overlap
+                **init_steps[2]
             )
 
 
@@ -143,39 +487,62 @@ class CompileGraph:
             # Step 2: ExecGraph
             self.__max_retry = init_result.global_setting.max_retry
             exec_result = self.compile_and_run(
-                graph_class=ExecGraph,
-                graph_name='ExecGraph',
-                install_tool=self.__install_tool,
+                graph_class=exec_steps[0],
+                graph_name=exec_steps[1],
                 max_retry=self.__max_retry,
-                agent_client=self.__agent_client,
-                vector_store=self.__vector_store,
-                tavily_api_key=self.__tavily_api_key,
                 input_data=init_result.model_dump(),
-                chunk_size=self.__chunk_size,
-                running_command=self.__running_command
+                **exec_steps[2]
             )
 
             # Step 3: EndGraph
             end_result = self.compile_and_run(
-                graph_class=EndGraph,
-                graph_name='EndGraph',
-                send_mail=self.__send_mail,
-                input_data=exec_result.model_dump()
+                graph_class=end_steps[0],
+                graph_name=end_steps[1],
+                input_data=exec_result.model_dump(),
+                **end_steps[2]
             )
         except Exception as e:
-            print(f'代码生成器执行出现异常, 异常原因: {traceback.format_exc()}')
+            logger.exception(f'代码生成器执行出现异常: {str(e)}')
+            self.__send_error_mail(prompt=prompt)
+        finally:
+            self.__close_sandbox()
+            self.__close_retrieval()
+            self.__close_deduplicator()
+            self.__close_vector()
+
+        return end_result
+
+    def __send_error_mail(self, prompt: str):
+        """
+        发送执行异常邮件(在 except 中调用), 邮件发送失败只记录日志
+        :param prompt: 编码需求
+        :return:
+        """
+        try:
             self.__send_mail.send(
                 subject=f'【执行异常】【需求】{prompt}',
                 content=f'代码生成器执行出现异常, 异常原因: {traceback.format_exc()}',
                 mime_type='plain'
             )
-        finally:
-            self.__close_vector()
+        except SendMailError as e:
+            logger.error(f'执行异常邮件发送失败: {str(e)}')
 
-        return end_result
+    def __close_sandbox(self):
+        if self.__sandbox_manager and self.__own_sandbox:
+            self.__sandbox_manager.close()
+
+    def __close_deduplicator(self):
+        if self.__deduplicator and self.__own_deduplicator:
+            self.__deduplicator.close()
+
+    def __close_retrieval(self):
+        if self.__own_retrieval:
+            self.__retrieval_orchestrator.close()
+        if self.__web_search and self.__own_web_search:
+            self.__web_search.close()
 
     def __close_vector(self):
-        if not self.__vector_store:
+        if self.__vector_store and self.__own_vector_store:
             self.__vector_store.close()
 
     def update_vector_data(self, index_name: str, file_paths: list[str]):
@@ -185,29 +552,27 @@ class CompileGraph:
         :param file_paths: 作为更新源数据的文件列表
         :return:
         """
-        print(f'=' * 100)
-        split_docs_map = {}
-
-        for file_index, file_path in enumerate(file_paths):
-            try:
-                split_docs_map[file_path] = self.__vector_store.load_file(
-                    file_path=file_path,
-                    file_type=os.path.splitext(file_path)[-1][1:],
-                    chunk_size=self.__chunk_size,
-                    chunk_overlap=self.__chunk_overlap
-                )
-                print(f'【{file_index + 1}/{len(file_paths)}】已添加文件: {file_path}')
-
-            except UnLoadableError as e:
-                print(f'【{file_index + 1}/{len(file_paths)}】文件: {file_path} 出现异常: {str(e)}')
-
-        print(f'* 文件正在写入知识库...')
+        logger.info(f'* 文件正在写入知识库...', extra={'workspace': index_name, 'file_count': len(file_paths)})
         s_time = time.time()
-        split_docs = list(chain.from_iterable(list(split_docs_map.values())))
-        if index_name in self.__vector_store.all_collections():
-            self.__vector_store.delete_collection(collection_name=index_name)
-        self.__vector_store.init_vector(split_docs=split_docs, index_name=index_name)
-        print(f'* 文件写入知识库完成, 耗时: 【{time.time() - s_time}(s)】')
+        if self.__sync_config.get('mode', 'incremental') == 'rebuild':
+            self.__workspace_sync.rebuild(workspace=index_name, file_paths=file_paths)
+        else:
+            self.__workspace_sync.sync(workspace=index_name, file_paths=file_paths)
+        elapsed = round(time.time() - s_time, 3)
+        logger.info(f'* 文件写入知识库完成, 耗时: 【{elapsed}(s)】', extra={'workspace': index_name, 'elapsed': elapsed})
+
+        index_stats = self.__vector_store.index_stats(
+            index_name=index_name,
+            k=self.__sync_config.get('recall_k', 10),
+            samples=self.__sync_config.get('recall_samples', 50)
+        )
+        recall = round(index_stats.recall_at_k, 4) if index_stats.recall_at_k is not None else '-'
+        logger.info(
+            f'* 工作区【{index_name}】索引: 切片【{index_stats.count}】, 量化【{index_stats.quantization}】, '
+            f'常驻内存【{round(index_stats.memory_mb, 2)}(MB)】, 原始向量【{round(index_stats.vector_bytes / 1024 / 1024, 2)}(MB)】, '
+            f'recall@{index_stats.k}【{recall}】',
+            extra={'index_stats': index_stats.model_dump()}
+        )
 
 if __name__ == '__main__':
     __enable_mutual = YAML_CONFIGS_INFO['code_helper']['mutual_config']['enable_mutual']
@@ -2,11 +2,13 @@ import sys
 import os
 import warnings
 
-import winsound
+# winsound 仅 windows 可用
+if sys.platform.startswith('win'): import winsound
 
 from langgraph.constants import START, END
 
 from common.error.smtp import SendMailError
+from common.logger.logging import Logger
 from common.smtp.send_mail import SendMail
 from core.common.format_result.format_result import format_search_refer
 from core.graphs.base_graph import BaseGraph
@@ -15,18 +17,24 @@ from core.state.code_helper import CodeHelperState
 # python3 -W ignore script.py
 warnings.filterwarnings("ignore")
 
+logger = Logger.get_instance(__file__)
+
 class EndGraph:
 
     def __init__(
         self,
         send_mail: SendMail | None = None,
+        enable_bell: bool = True,
         enable_mutual: bool = True
     ):
         """
         结束流程
+        :param send_mail: 邮件客户端, 为空时不发送结果邮件
+        :param enable_bell: 流程结束后是否在本机响铃(api 服务关闭)
         :param enable_mutual:
         """
         self.__send_mail = send_mail
+        self.__enable_bell = enable_bell
         self.__enable_mutual = enable_mutual
         self.__action_state_map = {
             'success': '成功',
@@ -40,6 +48,8 @@ class EndGraph:
         :param state:
         :return:
         """
+        if not self.__enable_bell: return
+
         for i in range(3):
             # 发出 1000Hz 频率的声音，持续 500ms
             if sys.platform.startswith('win'): winsound.Beep(1000, 500)
@@ -149,7 +159,7 @@ class EndGraph:
         try:
             self.__send_mail.send(subject=subject, content=content, mime_type='html')
         except SendMailError as e:
-            print(str(e))
+            logger.error(f'执行结果邮件发送失败: {str(e)}', extra={'action_state': action_state})
 
     def graph_nodes(self):
         """
@@ -1,21 +1,32 @@
+import logging
 import re
 import subprocess
 import sys
 import os.path
+import threading
+import time
 import uuid
 import warnings
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from langchain_community.tools import TavilySearchResults
+from langchain_core.messages import AIMessage, HumanMessage
 from langgraph.constants import START, END
 from langgraph.types import RetryPolicy
 
 from common.enum.graph import ActionState
 from common.error.extra import ExtraTagError
+from common.error.graph import GraphCancelledError
 from common.file.file import output_content_to_file, extract_paths
+from common.logger.logging import Logger
 from core.agent.llm_agent import LLMAgent
 from core.common.format_result.format_result import extract_tags, format_search_refer
-from core.common.rag.vector_stores import WeaviateClient
+from core.common.rag.base_vector_store import BaseVectorStore
+from core.common.rag.base_web_search import BaseWebSearch
+from core.common.rag.retrieval import RetrievalOrchestrator
+from core.common.rag.web_search import TavilySearch
+from core.common.sandbox.install_manager import InstallManager, resolve_python
+from core.common.sandbox.sandbox import SandboxManager, kill_process
 from core.graphs.base_graph import BaseGraph
 from core.prompts.code_helper import GenCodePrompt, RequirementAnalysisPrompt, GenCodeSysPrompt, ReGenCodePrompt
 from core.state.code_helper import CodeHelperState, GenResult, GlobalSetting
@@ -23,6 +34,8 @@ from core.state.code_helper import CodeHelperState, GenResult, GlobalSetting
 # python3 -W ignore script.py
 warnings.filterwarnings("ignore")
 
+logger = Logger.get_instance(__file__)
+
 class ExecGraph:
 
     def __init__(
@@ -30,11 +43,18 @@ class ExecGraph:
         install_tool: str,
         max_retry: int = 5,
         agent_client: LLMAgent | None = None,
-        vector_store: WeaviateClient | None = None,
+        vector_store: BaseVectorStore | None = None,
         tavily_api_key: str | None = None,
         chunk_size=200,
         running_command: str | None = None,
-        enable_mutual: bool = True
+        best_of_n: int = 1,
+        sandbox_manager: SandboxManager | None = None,
+        install_config: dict | None = None,
+        web_search: BaseWebSearch | None = None,
+        retrieval_orchestrator: RetrievalOrchestrator | None = None,
+        retrieval_config: dict | None = None,
+        enable_mutual: bool = True,
+        cancel_event: threading.Event | None = None
     ):
         """
         执行流程
@@ -45,7 +65,15 @@ class ExecGraph:
         :param tavily_api_key: tavily 搜索引擎 api_key(该值为空则不会使用web搜索)
         :param chunk_size: 切片大小
         :param running_command: 运行命令
+        :param best_of_n: 每轮并发生成的候选代码数, 大于1时每个候选写入 project_path 下独立目录并发运行测试,
+                          取第一个运行结果与 ran_result 一致的候选并终止其余候选
+        :param sandbox_manager: 沙箱进程池管理, 不为空时 python 测试文件在项目虚拟环境的预热进程中运行
+        :param install_config: 依赖安装管理配置(InstallManager 参数: cache_dir、enable_wheel_cache)
+        :param web_search: 网页搜索客户端, 为空时按 tavily_api_key 创建
+        :param retrieval_orchestrator: 检索编排(知识库、网页搜索并发检索), 为空时创建
+        :param retrieval_config: 检索配置(deadline、knowledge_k、knowledge_topn)
         :param enable_mutual: 是否开启交互模式
+        :param cancel_event: 取消事件(如 api 服务客户端断开连接), 被设置时终止正在运行的安装和测试进程并抛出 GraphCancelledError
         """
         self.__spacing = 100
         self.__install_tool = install_tool
@@ -59,6 +87,22 @@ class ExecGraph:
         self.__reason: str | None = None
         self.__solution: str | None = None
         self.__enable_mutual: bool = enable_mutual
+        self.__best_of_n: int = max(best_of_n, 1)
+        self.__sandbox_manager: SandboxManager | None = sandbox_manager
+        self.__install_config: dict = install_config if install_config else {}
+        self.__install_lock = threading.Lock()
+        # 依赖安装管理按目标环境缓存(沙箱为项目虚拟环境, 否则为 running_command 的解释器), 重试时复用安装结果
+        self.__install_managers: dict[str, InstallManager] = {}
+        # 候选共享同一环境, 并发 pip/npm 安装会互相覆盖, 依赖安装串行执行(已满足的依赖由安装管理跳过)
+        self.__candidate_install_lock = threading.Lock()
+        self.__candidate_lock = threading.Lock()
+        self.__candidate_procs: set[subprocess.Popen] = set()
+        self.__web_search: BaseWebSearch | None = web_search
+        if not self.__web_search and self.__tavily_api_key:
+            self.__web_search = TavilySearch(api_key=self.__tavily_api_key)
+        self.__retrieval_orchestrator = retrieval_orchestrator if retrieval_orchestrator else RetrievalOrchestrator()
+        self.__retrieval_config: dict = retrieval_config if retrieval_config else {}
+        self.__cancel_event: threading.Event = cancel_event if cancel_event else threading.Event()
 
     def is_read_file(self, state: CodeHelperState):
         """
@@ -82,7 +126,7 @@ class ExecGraph:
         for file_path in file_paths:
 
             if not os.path.exists(file_path):
-                print(f' => 文件: 【{file_path}】 不存在, 跳过...')
+                logger.warning(f' => 文件: 【{file_path}】 不存在, 跳过...')
                 continue
 
             try:
@@ -95,7 +139,7 @@ class ExecGraph:
             finally:
                 index += 1
 
-        print(f'prompt:', prompt)
+        logger.debug('prompt: %s', prompt)
 
         return {
             'prompt': prompt
@@ -108,8 +152,11 @@ class ExecGraph:
         :param state:
         :return:
         """
-        print('=' * self.__spacing)
-        print(f' -> 需求分析中, 用户输入需求: 【{state.prompt}】 ...')
+        # 需求分析、检索和代码生成期间后台创建项目虚拟环境和预热进程
+        if self.__sandbox_manager: self.__sandbox_manager.prewarm(state.global_setting.project_path)
+
+        logger.info(f' -> 需求分析中...')
+        logger.debug('用户输入需求: 【%s】', state.prompt)
         prompt = RequirementAnalysisPrompt.format(input_text=state.prompt)
         self.__agent_client.agent_ask(prompt=prompt, enable_assistant=True, enable_print=False)
 
@@ -119,9 +166,12 @@ class ExecGraph:
         if not requirement_analysis:
             raise ExtraTagError(f'需求分析标签提取异常, 源提取文本: {req_analysis}')
 
-        print(f' -> 需求分析结束, 需求补全与任务分解:')
-        for index, req_item in enumerate(requirement_analysis):
-            print(f'\t{index+1}) {req_item}')
+        logger.info(
+            '\n'.join([f' -> 需求分析结束, 需求补全与任务分解:'] + [
+                f'\t{index+1}) {req_item}' for index, req_item in enumerate(requirement_analysis)
+            ]),
+            extra={'requirement_analysis': requirement_analysis}
+        )
 
         return {
             'gen_result': {
@@ -146,6 +196,8 @@ class ExecGraph:
             return workspace
         else:
             all_collections = self.__vector_store.all_collections()
+            # 工作区选择为交互输入, 菜单直接输出到控制台, 输出前先写完日志队列
+            if self.__enable_mutual: Logger.flush()
 
             print(f'-' * round(self.__spacing / 2))
             print(f' * 知识库工作区列表:')
@@ -158,80 +210,79 @@ class ExecGraph:
                 input_val = input_val[0].upper() + input_val[1:]
                 print(f'-' * self.__spacing)
                 if input_val in all_collections:
-                    print(f' * 选择工作区【{input_val}】作为检索源...')
+                    logger.info(f' * 选择工作区【{input_val}】作为检索源...', extra={'workspace': input_val})
                     break
                 print(f' * 工作区【{input_val}】 不存在, 请重新输入...')
 
             print(f'-' * round(self.__spacing / 2))
             return input_val
 
-    def search_knowledge(self, state: CodeHelperState):
+    def search_refer(self, state: CodeHelperState):
         """
-        查询知识库
+        检索参考资料: 所有 需求 x 检索源(知识库/网页搜索) 由检索编排并发执行, 超过截止时间后只使用已完成的结果
         :param state:
         :return:
         """
         gen_result = state.gen_result.model_dump()
-        knowledge_workspace = self.select_knowledge_workspace(state=state)
-        if not knowledge_workspace: return {}
-
-        print('=' * self.__spacing)
-        print(f' -> 开始搜索知识库...')
-
-        search_map = {}
         requirement_analysis = state.gen_result.requirement_analysis
-        self.__vector_store.init_vector(split_docs=[], index_name=knowledge_workspace)
 
-        for req_index, req_item in enumerate(requirement_analysis):
-            print(f'\t-> {req_index + 1}) {req_item}')
-            search_result = self.__vector_store.search(query=req_item, is_rerank=True, k=10, rerank_topn=2)
-            search_result = [item.get('content') for item in search_result]
-
-            search_map[req_item] = search_result
-            for search_index, search_item in enumerate(search_result):
-                print(f'\t\t{req_index + 1}.{search_index+1}) {search_item}')
+        sources, batch_sources = {}, {}
+        knowledge_workspace = self.select_knowledge_workspace(state=state)
+        if knowledge_workspace:
+            # 知识库一次检索所有需求, 重排请求统一调度
+            batch_sources['knowledge'] = lambda queries: self.__search_knowledge(queries=queries, workspace=knowledge_workspace)
+        if state.global_setting.enable_web and self.__web_search:
+            sources['web'] = self.__search_web
+        if not (sources or batch_sources) or not requirement_analysis: return {}
+
+        logger.info(f' -> 开始检索参考资料...', extra={'sources': [*sources, *batch_sources]})
+        retrieval_result = self.__retrieval_orchestrator.retrieve(
+            queries=requirement_analysis,
+            sources=sources,
+            deadline=self.__retrieval_config.get('deadline'),
+            batch_sources=batch_sources
+        )
 
-        gen_result['knowledge_refer'] = search_map
+        for source_name, refer_key, source_text in [('knowledge', 'knowledge_refer', '知识库'), ('web', 'web_refer', '网页搜索')]:
+            if source_name not in sources and source_name not in batch_sources: continue
+
+            search_map = retrieval_result.refer[source_name]
+            partial = retrieval_result.partial.get(source_name, [])
+            errors = retrieval_result.errors.get(source_name, {})
+            for req_item in partial:
+                logger.warning(f' -> 【{source_text}】超过检索截止时间, 未获取结果: {req_item}', extra={'source': source_name})
+            for req_item, error in errors.items():
+                logger.warning(f' -> 【{source_text}】检索异常: {req_item}, 异常原因: {error}', extra={'source': source_name})
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f' -> 【{source_text}】检索结果:{format_search_refer(search_refer=search_map)}')
+
+            gen_result[refer_key] = search_map
+
+        total_time = round(retrieval_result.total_time, 3)
+        logger.info(
+            f' -> 检索完成, 耗时: 【{total_time}(s)】' + (', 部分检索超时' if retrieval_result.is_partial else ''),
+            extra={
+                'elapsed': total_time,
+                'refer_count': {source_name: sum(map(len, refer.values())) for source_name, refer in retrieval_result.refer.items()},
+                'partial': retrieval_result.partial
+            }
+        )
         return {
             'aggregate': [gen_result]
         }
 
-    # [todo] 之后看效果决定使用 TavilySearch 还是自研
-    def search_web(self, state: CodeHelperState):
-        """
-        查询网页搜索引擎
-        :param state:
-        :return:
-        """
-        gen_result = state.gen_result.model_dump()
-        if not state.global_setting.enable_web or not self.__tavily_api_key:
-            return {}
-
-        print('=' * self.__spacing)
-        print(f' -> 开启网页搜索...')
-
-        search_map = {}
-        requirement_analysis = state.gen_result.requirement_analysis
-
-        for req_index, req_item in enumerate(requirement_analysis):
-            try:
-
-                print(f'\t-> {req_index + 1}) {req_item}')
-                tavily_search = TavilySearchResults(max_results=2, tavily_api_key=self.__tavily_api_key)
-                search_result = tavily_search.invoke({'query': req_item})
-                search_result = [item.get('content', '')[:self.__chunk_size] for item in search_result]
-
-                search_map[req_item] = search_result
-                for search_index, search_item in enumerate(search_result):
-                    print(f'\t\t{req_index + 1}.{search_index + 1}) {search_item}')
-
-            except Exception as e:
-                print(f'\t* 网页搜索异常, 退出网页搜索, 异常原因:', str(e))
+    def __search_knowledge(self, queries: list[str], workspace: str) -> list[list[str]]:
+        search_results = self.__vector_store.search_many(
+            queries=queries,
+            is_rerank=True,
+            k=self.__retrieval_config.get('knowledge_k', 10),
+            rerank_topn=self.__retrieval_config.get('knowledge_topn', 2),
+            index_name=workspace
+        )
+        return [[item.get('content') for item in search_result] for search_result in search_results]
 
-        gen_result['web_refer'] = search_map
-        return {
-            'aggregate': [gen_result],
-        }
+    def __search_web(self, query: str) -> list[str]:
+        return [item.get('content', '')[:self.__chunk_size] for item in self.__web_search.search(query)]
 
     def __insert_refer(self, state: CodeHelperState) -> dict:
         """
@@ -253,35 +304,245 @@ class ExecGraph:
         :param state:
         :return:
         """
-        tip_text = f'== 第【{self.__retry_count}】次执行【代码生成】【开始】'
-        print(tip_text + ('=' * (self.__spacing - len(tip_text))))
+        logger.info(f'== 第【{self.__retry_count}】次执行【代码生成】【开始】', extra={'retry_count': self.__retry_count})
 
         gen_result = self.__insert_refer(state=state)
+        gencode_prompt = self.__gencode_prompt(state=state, gen_result=gen_result)
+        logger.debug('=> 【代码生成】提示词(共 %s 字):\n%s', len(gencode_prompt), gencode_prompt)
+        self.__agent_client.agent_ask(prompt=gencode_prompt, enable_assistant=True, enable_print=False)
+        req_analysis = self.__agent_client.messages[-1].content
+        # print(f'realize_requirements.req_analysis:', req_analysis)
 
-        requirement_analysis = state.gen_result.requirement_analysis
-        knowledge_refer = gen_result.get('knowledge_refer')
-        web_refer = gen_result.get('web_refer')
+        gen_result = self.gen_code_wrap(text=req_analysis, gen_result=gen_result)
+        self.__reason = ''
+        self.__solution = ''
+        return {
+            'gen_result': gen_result
+        }
 
-        gencode_prompt = GenCodePrompt.format(
+    def __gencode_prompt(self, state: CodeHelperState, gen_result: dict) -> str:
+        """
+        生成【代码生成】提示词
+        :param state:
+        :param gen_result: 插入参考资料后的生成代码结果对象字典
+        :return:
+        """
+        return GenCodePrompt.format(
             install_tool=self.__install_tool,
-            requirements=requirement_analysis,
-            knowledge_refer=knowledge_refer,
-            web_refer=web_refer,
+            requirements=state.gen_result.requirement_analysis,
+            knowledge_refer=gen_result.get('knowledge_refer'),
+            web_refer=gen_result.get('web_refer'),
             reason=self.__reason if self.__reason else '',
             solution=self.__solution if self.__solution else ''
         )
-        print(f'=> 【代码生成】提示词(共 {len(gencode_prompt)} 字):\n{gencode_prompt}')
-        self.__agent_client.agent_ask(prompt=gencode_prompt, enable_assistant=True, enable_print=False)
-        req_analysis = self.__agent_client.messages[-1].content
-        # print(f'realize_requirements.req_analysis:', req_analysis)
 
-        gen_result = self.gen_code_wrap(text=req_analysis, gen_result=gen_result)
+    def realize_candidates(self, state: CodeHelperState):
+        """
+        [best-of-N]并发生成 best_of_n 个候选代码, 每个候选写入独立目录后立即运行测试,
+        第一个运行结果与 ran_result 一致的候选作为本轮结果, 并取消/终止其余候选
+        :param state:
+        :return:
+        """
+        logger.info(
+            f'== 第【{self.__retry_count}】次执行【代码生成】【开始】, 并发候选数【{self.__best_of_n}】',
+            extra={'retry_count': self.__retry_count, 'best_of_n': self.__best_of_n}
+        )
+
+        gen_result = self.__insert_refer(state=state)
+        gencode_prompt = self.__gencode_prompt(state=state, gen_result=gen_result)
+        logger.debug('=> 【代码生成】提示词(共 %s 字):\n%s', len(gencode_prompt), gencode_prompt)
         self.__reason = ''
         self.__solution = ''
+
+        cancel_event = threading.Event()
+        threading.Thread(target=self.__watch_cancel, args=(cancel_event,), daemon=True).start()
+        candidates: list[tuple[dict, str]] = []
+        errors: list[str] = []
+        winner: tuple[dict, str] | None = None
+
+        # 不使用 with, 有候选通过后不等待仍在请求模型的候选(候选线程返回时检查 cancel_event 直接退出)
+        executor = ThreadPoolExecutor(max_workers=self.__best_of_n)
+        futures = {
+            executor.submit(self.__run_candidate, index + 1, gencode_prompt, gen_result, state, cancel_event): index + 1
+            for index in range(self.__best_of_n)
+        }
+        try:
+            for future in as_completed(futures):
+                try:
+                    candidate = future.result()
+                except Exception as e:
+                    errors.append(f'候选【{futures[future]}】执行异常: {str(e)}')
+                    logger.warning(f' => {errors[-1]}')
+                    continue
+
+                if not candidate: continue
+                candidates.append(candidate)
+                if candidate[0]['is_success']:
+                    winner = candidate
+                    logger.info(f' => 候选【{futures[future]}】运行结果与预期一致, 终止其余候选...')
+                    break
+        finally:
+            cancel_event.set()
+            self.__kill_candidates()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if self.__cancel_event.is_set():
+            raise GraphCancelledError()
+        if not winner and not candidates:
+            raise RuntimeError(f'候选代码全部执行异常: {"; ".join(errors)}')
+
+        # 无候选通过时, 优先选择没有运行异常的候选作为 error_handle 的修复对象
+        if not winner:
+            winner = next((candidate for candidate in candidates if not candidate[0]['code_error']), candidates[0])
+
+        result, content = winner
+        self.__agent_client.merge_messages([HumanMessage(content=gencode_prompt), AIMessage(content=content)])
+
+        action_state = state.action_state
+        if self.__retry_count >= state.global_setting.max_retry and not result['is_success']:
+            action_state = ActionState.FAIL if result['code_error'] else ActionState.VERIFY
+
+        logger.info(
+            f'== 第【{self.__retry_count}】次执行【代码生成】【完成】',
+            extra={'retry_count': self.__retry_count, 'is_success': result['is_success'], 'candidates': len(candidates)}
+        )
         return {
-            'gen_result': gen_result
+            'gen_result': result,
+            'gen_states': [candidate[0] for candidate in candidates],
+            'action_state': action_state,
         }
 
+    def __run_candidate(
+        self,
+        candidate_index: int,
+        gencode_prompt: str,
+        gen_result: dict,
+        state: CodeHelperState,
+        cancel_event: threading.Event
+    ) -> tuple[dict, str] | None:
+        """
+        生成单个候选代码, 写入 project_path/candidate_{重试次数}_{候选序号} 目录并运行测试
+        :param candidate_index: 候选序号
+        :param gencode_prompt: 【代码生成】提示词
+        :param gen_result: 插入参考资料后的生成代码结果对象字典
+        :param state:
+        :param cancel_event: 已有候选通过时被设置
+        :return: (候选生成代码结果, 模型返回文本), 已取消时返回 None
+        """
+        # 派生对话共享模型客户端和需求分析上下文, 候选之间对话记录互不影响
+        ask_msg = self.__agent_client.fork().ask(prompt=gencode_prompt)
+        if cancel_event.is_set(): return None
+
+        candidate = self.gen_code_wrap(text=ask_msg.content, gen_result=dict(gen_result))
+        candidate_dir = os.path.join(state.global_setting.project_path, f'candidate_{self.__retry_count}_{candidate_index}')
+        code_file = output_content_to_file(
+            file_path=os.path.join(candidate_dir, candidate.get('code_file', '')),
+            content=candidate.get('gen_code', '')
+        )
+        test_file = output_content_to_file(
+            file_path=os.path.join(candidate_dir, candidate.get('test_file', '')),
+            content=candidate.get('test_code', '')
+        )
+        logger.info(f' => 候选【{candidate_index}】代码写入目录【{candidate_dir}】')
+
+        install_command = candidate.get('install_command', '')
+        if self.__use_sandbox(test_file):
+            # 候选共享项目虚拟环境和预热进程池
+            sandbox_pool = self.__sandbox_manager.get_pool(state.global_setting.project_path)
+            if install_command:
+                with self.__candidate_install_lock:
+                    if cancel_event.is_set(): return None
+                    self.__get_install_manager(state.global_setting.project_path).install(
+                        command=install_command,
+                        cwd=candidate_dir,
+                        cancel_event=cancel_event
+                    )
+            run_result = sandbox_pool.run(file_path=test_file, cwd=candidate_dir, cancel_event=cancel_event)
+            command_result, code_error = run_result.stdout, run_result.error
+        else:
+            if install_command:
+                with self.__candidate_install_lock:
+                    if cancel_event.is_set(): return None
+                    self.__get_install_manager().install(command=install_command, cwd=candidate_dir, cancel_event=cancel_event)
+
+            running_command = self.__running_command if self.__running_command else 'python -W ignore'
+            command_result, code_error = self.__run_command(
+                command=f'{running_command} {test_file}',
+                cwd=candidate_dir,
+                cancel_event=cancel_event
+            )
+        if cancel_event.is_set(): return None
+
+        ran_result = candidate.get('ran_result', '')
+        logger.info(f' => 候选【{candidate_index}】运行完成', extra={'candidate_index': candidate_index})
+        logger.debug(' => 候选【%s】运行结果:\n%s', candidate_index, command_result.strip())
+        return {
+            **candidate,
+            'code_file': code_file,
+            'test_file': test_file,
+            'is_success': command_result.strip() == ran_result.strip(),
+            'code_error': code_error,
+            'actual_result': command_result
+        }, ask_msg.content
+
+    def __run_command(self, command: str, cwd: str | None, cancel_event: threading.Event, timeout: int = 300) -> tuple[str, str]:
+        """
+        在独立进程组中运行命令, 记录进程以便有候选通过或执行被取消时终止
+        :param command: 命令
+        :param cwd: 运行目录, 为空时为当前目录
+        :param cancel_event: 已有候选通过或执行被取消时被设置
+        :param timeout: 超时时间(单位: s)
+        :return: (stdout, stderr)
+        """
+        if cancel_event.is_set(): return '', ''
+
+        proc = subprocess.Popen(
+            command,
+            shell=True,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            start_new_session=True
+        )
+        with self.__candidate_lock:
+            self.__candidate_procs.add(proc)
+
+        deadline = time.time() + timeout
+        try:
+            while True:
+                try:
+                    return proc.communicate(timeout=0.1)
+                except subprocess.TimeoutExpired:
+                    if cancel_event.is_set():
+                        kill_process(proc)
+                        return proc.communicate()
+                    if time.time() >= deadline:
+                        kill_process(proc)
+                        stdout, stderr = proc.communicate()
+                        return stdout, f'{stderr}\n命令执行超时({timeout}s): {command}'
+        finally:
+            with self.__candidate_lock:
+                self.__candidate_procs.discard(proc)
+
+    def __watch_cancel(self, cancel_event: threading.Event):
+        """
+        执行被取消时设置本轮候选的取消事件(终止候选正在运行的安装和测试进程)
+        :param cancel_event: 本轮候选的取消事件
+        :return:
+        """
+        while not cancel_event.is_set():
+            if self.__cancel_event.wait(0.1):
+                cancel_event.set()
+
+    def __kill_candidates(self):
+        with self.__candidate_lock:
+            procs = list(self.__candidate_procs)
+
+        for proc in procs:
+            kill_process(proc)
+
     def gen_code_wrap(self, text: str, gen_result: dict):
         """
         生成代码结果装配器, 解析 text 文本, 把对应标签内容装配到 gen_code 对象
@@ -322,13 +583,12 @@ class ExecGraph:
             if os.path.exists(code_file): shutil.move(code_file, backup_dir)
             if os.path.exists(test_file): shutil.move(test_file, backup_dir)
 
-        print(f'=' * self.__spacing)
-        print(f'-> 生成代码写入文件【{code_file}】...')
         code_file = output_content_to_file(file_path=code_file, content=gen_code)
-        print(f'-> 生成代码写入【完成】')
-        print(f'-> 测试代码写入文件【{test_file}】...')
+        logger.info(f'-> 生成代码写入文件【{code_file}】【完成】')
+        logger.debug('-> 生成代码:\n%s', gen_code)
         test_file = output_content_to_file(file_path=test_file, content=test_code)
-        print(f'-> 测试代码写入【完成】')
+        logger.info(f'-> 测试代码写入文件【{test_file}】【完成】')
+        logger.debug('-> 测试代码:\n%s', test_code)
 
         return {
             'gen_result': {
@@ -344,49 +604,30 @@ class ExecGraph:
         :param state:
         :return:
         """
-        tip_text = f'== 第【{self.__retry_count}】次执行【代码生成】【完成】'
-        print(f'=' * self.__spacing)
-
         project_path = state.global_setting.project_path
         install_command = state.gen_result.install_command
         test_file = state.gen_result.test_file
         ran_result = state.gen_result.ran_result
         action_state = state.action_state
 
-        if install_command:
-            print(f' => 安装第三方依赖, 执行命令【{install_command}】')
-            command_result = subprocess.run(
-                install_command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                encoding="utf-8",  # 显式指定编码
-                timeout=300
-            ).stdout
-            print(f' => 命令执行完成:\n', command_result)
-            print(f'-' * self.__spacing)
-
-        # 注册项目目录
-        sys.path.append(project_path)
-
-        running_command = self.__running_command if self.__running_command else 'python -W ignore'
-        running_command = f'{running_command} {test_file}'
-        print(f' => 运行测试文件, 执行命令【{running_command}】')
+        if self.__use_sandbox(test_file):
+            command_result, code_error = self.__action_in_sandbox(
+                project_path=project_path,
+                install_command=install_command,
+                test_file=test_file
+            )
+        else:
+            command_result, code_error = self.__action_in_shell(
+                project_path=project_path,
+                install_command=install_command,
+                test_file=test_file
+            )
 
-        sp_command = subprocess.run(
-            running_command,
-            shell=True,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",  # 显式指定编码
-            timeout=300
-        )
-        command_result = sp_command.stdout
-        code_error = sp_command.stderr
+        if self.__cancel_event.is_set():
+            raise GraphCancelledError()
 
-        print(f' => 命令执行完成:\n', command_result.strip())
-        print(f'-' * self.__spacing)
-        print(f' => 预期结果:\n', ran_result.strip())
+        logger.debug(' => 命令执行完成:\n%s', command_result.strip())
+        logger.debug(' => 预期结果:\n%s', ran_result.strip())
 
         # 判断运行测试文件, 测试生成代码结果, 是否与预期效果 ran_result 一样
         if command_result.strip() == ran_result.strip():
@@ -398,7 +639,10 @@ class ExecGraph:
         if self.__retry_count >= state.global_setting.max_retry and not is_success:
             action_state = ActionState.FAIL if code_error else ActionState.VERIFY
 
-        print(tip_text + ('=' * (self.__spacing - len(tip_text))))
+        logger.info(
+            f'== 第【{self.__retry_count}】次执行【代码生成】【完成】, 运行结果{"与预期一致" if is_success else "与预期不一致"}',
+            extra={'retry_count': self.__retry_count, 'is_success': is_success}
+        )
         gen_result = {
             **state.gen_result.model_dump(),
             'is_success': is_success,
@@ -411,6 +655,93 @@ class ExecGraph:
             'action_state': action_state,
         }
 
+    def __use_sandbox(self, test_file: str) -> bool:
+        return bool(self.__sandbox_manager) and test_file.endswith('.py')
+
+    @staticmethod
+    def __print_output(stream_name: str, data: str):
+        logger.debug(data.rstrip('\n'), extra={'stream': stream_name})
+
+    def __get_install_manager(self, project_path: str | None = None) -> InstallManager:
+        """
+        获取依赖安装管理, project_path 不为空时在项目虚拟环境中安装, 否则在 running_command 的解释器环境中安装
+        (不是 python 命令时安装命令按原命令执行, 不安装到服务自身的解释器环境)
+        :param project_path: 项目目录
+        :return:
+        """
+        key = os.path.abspath(project_path) if project_path else ''
+        with self.__install_lock:
+            if key not in self.__install_managers:
+                if project_path:
+                    sandbox_pool = self.__sandbox_manager.get_pool(project_path)
+                    self.__install_managers[key] = InstallManager(
+                        python_path=sandbox_pool.venv.python_path,
+                        run_command=sandbox_pool.run_command,
+                        **self.__install_config
+                    )
+                else:
+                    self.__install_managers[key] = InstallManager(
+                        python_path=resolve_python(self.__running_command if self.__running_command else 'python'),
+                        **self.__install_config
+                    )
+
+            return self.__install_managers[key]
+
+    def __action_in_sandbox(self, project_path: str, install_command: str, test_file: str) -> tuple[str, str]:
+        """
+        在项目虚拟环境中安装依赖, 并使用预热进程运行测试文件(流式打印输出)
+        :param project_path: 项目目录
+        :param install_command: 安装依赖命令
+        :param test_file: 测试文件
+        :return: (stdout, 异常描述)
+        """
+        sandbox_pool = self.__sandbox_manager.get_pool(project_path)
+        if install_command:
+            logger.info(f' => 安装第三方依赖, 执行命令【{install_command}】')
+            self.__get_install_manager(project_path).install(
+                command=install_command,
+                cwd=project_path,
+                on_output=self.__print_output,
+                cancel_event=self.__cancel_event
+            )
+
+        logger.info(f' => 运行测试文件【{test_file}】(沙箱预热进程)')
+        run_result = sandbox_pool.run(
+            file_path=test_file,
+            cwd=project_path,
+            on_output=self.__print_output,
+            cancel_event=self.__cancel_event
+        )
+        return run_result.stdout, run_result.error
+
+    def __action_in_shell(self, project_path: str, install_command: str, test_file: str) -> tuple[str, str]:
+        """
+        使用 running_command 新建进程运行测试文件(非 python 代码或未开启沙箱)
+        :param project_path: 项目目录
+        :param install_command: 安装依赖命令
+        :param test_file: 测试文件
+        :return: (stdout, stderr)
+        """
+        if install_command:
+            logger.info(f' => 安装第三方依赖, 执行命令【{install_command}】')
+            install_results = self.__get_install_manager().install(
+                command=install_command,
+                cwd=project_path,
+                cancel_event=self.__cancel_event
+            )
+            if logger.isEnabledFor(logging.DEBUG):
+                command_result = '\n'.join(f'[{result.status}] {result.command}\n{result.stdout}' for result in install_results)
+                logger.debug(' => 命令执行完成:\n%s', command_result)
+
+        # 注册项目目录
+        sys.path.append(project_path)
+
+        running_command = self.__running_command if self.__running_command else 'python -W ignore'
+        running_command = f'{running_command} {test_file}'
+        logger.info(f' => 运行测试文件, 执行命令【{running_command}】')
+
+        return self.__run_command(command=running_command, cwd=None, cancel_event=self.__cancel_event)
+
     def is_regen_code(self, state: CodeHelperState):
         """
         判断是否重新生成代码:
@@ -433,8 +764,6 @@ class ExecGraph:
         :param state:
         :return:
         """
-        print(f'=' * self.__spacing)
-
         requirement_analysis = state.gen_result.requirement_analysis
         gen_code = state.gen_result.gen_code
         test_code = state.gen_result.test_code
@@ -450,20 +779,20 @@ class ExecGraph:
             actual_result=actual_result.strip(),
             error_msg=code_error.strip()
         )
-        print(f'重新生成代码 prompt(共【{len(regencode_prompt)}】字):\n', regencode_prompt)
+        logger.info(f'-> 第【{self.__retry_count}】次代码生成运行结果与预期不一致, 分析异常原因...')
+        logger.debug('重新生成代码 prompt(共【%s】字):\n%s', len(regencode_prompt), regencode_prompt)
 
         self.__agent_client.agent_ask(prompt=regencode_prompt, enable_assistant=True, enable_print=False)
         suggestion = self.__agent_client.messages[-1].content
-        print(f'suggestion:', suggestion)
+        logger.debug('suggestion: %s', suggestion)
 
         reason = extract_tags(text=suggestion, tag='reason')
         solution = extract_tags(text=suggestion, tag='solution')
         self.__reason = '\n'.join(reason)
         self.__solution = '\n'.join(solution)
-        print(f'reason:', self.__reason)
-        print(f'solution:', self.__solution)
+        logger.info(f'reason: {self.__reason}')
+        logger.info(f'solution: {self.__solution}')
 
-        print(f'=' * self.__spacing)
         reset_keys = [
             'install_command',
             'gen_code',
@@ -487,18 +816,13 @@ class ExecGraph:
         初始化graph模块节点
         :return:
         """
-        return [
-            {
-                'node': self.requirement_analysis,
-                'action': self.requirement_analysis,
-                'retry': RetryPolicy(retry_on=ExtraTagError, backoff_factor=1, max_attempts=self.__max_retry)
-            },
-            {
-                'node': self.search_knowledge
-            },
+        # best-of-N 模式使用 realize_candidates 节点替代 生成代码 -> 写入文件 -> 运行代码 流程
+        gen_nodes = [
             {
-                'node': self.search_web
-            },
+                'node': self.realize_candidates,
+                'defer': True
+            }
+        ] if self.__best_of_n > 1 else [
             {
                 'node': self.realize_requirements,
                 'defer': True
@@ -508,7 +832,19 @@ class ExecGraph:
             },
             {
                 'node': self.action_code
+            }
+        ]
+
+        return [
+            {
+                'node': self.requirement_analysis,
+                'action': self.requirement_analysis,
+                'retry': RetryPolicy(retry_on=ExtraTagError, backoff_factor=1, max_attempts=self.__max_retry)
             },
+            {
+                'node': self.search_refer
+            },
+            *gen_nodes,
             {
                 'node': self.error_handle
             },
@@ -522,6 +858,21 @@ class ExecGraph:
         初始化graph 边
         :return:
         """
+        gen_node = 'realize_candidates' if self.__best_of_n > 1 else 'realize_requirements'
+        action_node = 'realize_candidates' if self.__best_of_n > 1 else 'action_code'
+        gen_edges = [] if self.__best_of_n > 1 else [
+            {
+                'start_key': 'realize_requirements',
+                'end_key': 'write_code_to_file',
+                'edge_func': 'add_edge'
+            },
+            {
+                'start_key': 'write_code_to_file',
+                'end_key': 'action_code',
+                'edge_func': 'add_edge'
+            }
+        ]
+
         return [
             {
                 'source': START,
@@ -536,43 +887,24 @@ class ExecGraph:
             },
             {
                 'start_key': 'requirement_analysis',
-                'end_key': 'search_knowledge',
-                'edge_func': 'add_edge'
-            },
-            {
-                'start_key': 'requirement_analysis',
-                'end_key': 'search_web',
-                'edge_func': 'add_edge'
-            },
-            {
-                'start_key': 'search_knowledge',
-                'end_key': 'realize_requirements',
+                'end_key': 'search_refer',
                 'edge_func': 'add_edge'
             },
             {
-                'start_key': 'search_web',
-                'end_key': 'realize_requirements',
-                'edge_func': 'add_edge'
-            },
-            {
-                'start_key': 'realize_requirements',
-                'end_key': 'write_code_to_file',
-                'edge_func': 'add_edge'
-            },
-            {
-                'start_key': 'write_code_to_file',
-                'end_key': 'action_code',
+                'start_key': 'search_refer',
+                'end_key': gen_node,
                 'edge_func': 'add_edge'
             },
+            *gen_edges,
             {
-                'source': 'action_code',
+                'source': action_node,
                 'path': self.is_regen_code,
                 'path_map': {True: END, False: 'error_handle'},
                 'edge_func': 'add_conditional_edges'
             },
             {
                 'start_key': 'error_handle',
-                'end_key': 'realize_requirements',
+                'end_key': gen_node,
                 'edge_func': 'add_edge'
             },
         ]
\ No newline at end of file
@@ -1,27 +1,31 @@
 import os
 import time
 import warnings
-from itertools import chain
 
 from langgraph.constants import START, END
 from weaviate.config import AdditionalConfig, Timeout
 
-from common.error.load import UnLoadableError
 from common.file.file import iter_file_infos
+from common.logger.logging import Logger
 from core.common.rag.embedding import EmbeddingClient
+from core.common.rag.ingest import IngestPipeline
+from core.common.rag.workspace_sync import WorkspaceSync
 from core.common.rag.rerank import RerankClient
-from core.common.rag.vector_stores import WeaviateClient
+from core.common.rag.base_vector_store import BaseVectorStore
 from core.graphs.base_graph import BaseGraph
 from core.state.code_helper import CodeHelperState
 
 # python3 -W ignore script.py
 warnings.filterwarnings("ignore")
 
+logger = Logger.get_instance(__file__)
+
 class InitGraph:
 
     def __init__(
         self,
-        vector_store: WeaviateClient | None = None,
+        vector_store: BaseVectorStore | None = None,
+        workspace_sync: WorkspaceSync | None = None,
         chunk_size=200,
         chunk_overlap=20,
         enable_mutual: bool = True
@@ -29,15 +33,29 @@ class InitGraph:
         """
         初始化代码生成器
         :param vector_store: 向量数据库
+        :param workspace_sync: 工作区同步(为空时按 chunk_size/chunk_overlap 新建)
         :param chunk_size: 切片大小
         :param chunk_overlap: 切片重合度
         :param enable_mutual: 是否开启交互
         """
         self.__spacing = 100
-        self.__vector_store: WeaviateClient | None = vector_store
+        self.__vector_store: BaseVectorStore | None = vector_store
         self.__chunk_size = chunk_size
         self.__chunk_overlap = chunk_overlap
         self.__enable_mutual: bool = enable_mutual
+        # 工作区已存在时, 是否删除不在本次上传文件列表内的文件切片(False 为增量插入)
+        self.__remove_missing: bool = True
+        # 工作区已存在时, 是否删除工作区索引后全量写入(全量更新)
+        self.__rebuild: bool = False
+        self.__workspace_sync: WorkspaceSync | None = workspace_sync
+        if not self.__workspace_sync and self.__vector_store:
+            self.__workspace_sync = WorkspaceSync(
+                ingest_pipeline=IngestPipeline(
+                    vector_store=self.__vector_store,
+                    chunk_size=self.__chunk_size,
+                    chunk_overlap=self.__chunk_overlap
+                )
+            )
 
     def print_global_setting(self, state: CodeHelperState):
         """
@@ -47,17 +65,16 @@ class InitGraph:
         """
         index = 1
         data = {}
+        setting_texts = ['[当前全局变量]:']
         global_setting = state.global_setting
-        print('=' * self.__spacing)
-        print('[当前全局变量]:')
 
         for field_name, field_info in global_setting.__pydantic_fields__.items():
             if not field_info.description: continue
-            print(f'{index}) {field_info.description}: {field_info.default}')
+            setting_texts.append(f'{index}) {field_info.description}: {field_info.default}')
             data[field_name] = field_info.default
             index += 1
 
-        print('=' * self.__spacing)
+        logger.info('\n'.join(setting_texts), extra={'global_setting': data})
 
     def is_global_setting(self, state: CodeHelperState):
         """
@@ -68,6 +85,7 @@ class InitGraph:
         print_text = f'* 输入值为空, 不修改全局变量...'
         # change_type: str = 'unchage_global'
         is_change: bool = False
+        if self.__enable_mutual: Logger.flush()
 
         while True:
 
@@ -90,8 +108,7 @@ class InitGraph:
                 #     print_text = f'* 不修改全局变量, 跳转设置知识库...'
                 #     change_type = 'edit_knowledge'
 
-                print(print_text)
-                print('=' * self.__spacing)
+                logger.info(print_text)
                 # return change_type
                 return is_change
 
@@ -116,7 +133,6 @@ class InitGraph:
                 data[field_name] = eval(input_val) if input_val else field_info.default
             index += 1
 
-        print('=' * self.__spacing)
         return {
             'global_setting': data
         }
@@ -139,18 +155,22 @@ class InitGraph:
         """
         enable_knowledge = state.global_setting.enable_knowledge
         all_collections = self.__vector_store.all_collections()
+        if self.__enable_mutual: Logger.flush()
 
         while enable_knowledge:
             if not all_collections:
-                print(f'* 目前知识库没有工作区, 请输入工作区并上传文件到知识库...')
+                if not self.__enable_mutual:
+                    logger.info(f'* 目前知识库没有工作区, 非交互模式跳过知识库设置...')
+                    return False
+                logger.info(f'* 目前知识库没有工作区, 请输入工作区并上传文件到知识库...')
                 return True
             else:
                 input_val = input('* 是否需要对原有知识库工作区进行修改[Y/N]: ') if self.__enable_mutual else 'N'
                 if input_val.lower() == 'y':
-                    print('* 开始编辑已有知识库...')
+                    logger.info('* 开始编辑已有知识库...')
                     return True
                 elif input_val.lower() == 'n':
-                    print('* 无需修改知识库工作区, 已完成全局变量设置...')
+                    logger.info('* 无需修改知识库工作区, 已完成全局变量设置...')
                     return False
                 else:
                     print('* 输入标识异常, 请重新输入, 仅支持[Y/N](不区分大小写)...')
@@ -164,7 +184,8 @@ class InitGraph:
         :param state:
         :return: 新增、更新、追加的工作区名
         """
-
+        # 工作区选择为交互输入, 菜单直接输出到控制台, 输出前先写完日志队列
+        Logger.flush()
         all_collections = self.__vector_store.all_collections()
         for index in range(len(all_collections)):
             if index == 0: print(f'** 已创建工作区列表: ')
@@ -173,20 +194,23 @@ class InitGraph:
         input_val = input('[选择/新增]知识库工作区[仅英文, 如: my_workspace]: ')
         input_val = input_val[0].upper() + input_val[1:]
         work_mode = '创建并上传文件'
+        self.__rebuild = False
+        self.__remove_missing = True
 
         while input_val in all_collections:
             print(f'-' * round(self.__spacing / 2))
             print(f'* 工作区【{input_val}】已存在, 请选择操作模式:')
-            print(f'[1] 全量更新(使用新文件完全替换旧工作区内容)')
-            print(f'[2] 增量插入(上传文件追加到原知识库[注意: 内容不要重复, 否则可能影响检索效率和准确度])')
+            print(f'[1] 全量更新(删除旧工作区后写入新文件)')
+            print(f'[2] 增量插入(上传文件追加到原知识库, 开启去重时跳过与工作区内已有内容重复的切片)')
             print(f'[3] 重新选择/输入工作区')
             select_val = input('* 请输入操作模式序号:')
 
             if select_val == '1':
-                self.__vector_store.delete_collection(collection_name=input_val)
+                self.__rebuild = True
                 work_mode = '全量更新'
                 break
             elif select_val == '2':
+                self.__remove_missing = False
                 work_mode = '增量插入'
                 break
             elif select_val == '3':
@@ -195,8 +219,10 @@ class InitGraph:
                 print(f'选择模式不存在, 输入值必须为【{'\\'.join(['1', '2', '3'])}】')
 
         print(f'-' * round(self.__spacing / 2))
-        print(f'* 已{'选择' if input_val in all_collections else '创建'}工作区【{input_val}】, 工作模式【{work_mode}】')
-        print(f'-' * round(self.__spacing / 2))
+        logger.info(
+            f'* 已{'选择' if input_val in all_collections else '创建'}工作区【{input_val}】, 工作模式【{work_mode}】',
+            extra={'workspace': input_val, 'work_mode': work_mode}
+        )
 
         return {
             'data_source': {
@@ -213,7 +239,7 @@ class InitGraph:
         """
         file_count = 0
         file_paths = []
-        split_docs_map = {}
+        Logger.flush()
 
         while True:
 
@@ -235,34 +261,32 @@ class InitGraph:
                     file_info = input_file_paths[file_index]
 
                     input_file = file_info.get('file_path', '')
-                    input_type = file_info.get('file_type', 'txt')
-
-                    try:
-
-                        if input_file in file_paths:
-                            file_paths.remove(input_file)
-                            split_docs_map.pop(input_file)
-                            file_count -= 1
-                            print(f'*文件 【{input_file}】 重复输入, 更新文件内容...')
-
-                        split_docs_map[input_file] = self.__vector_store.load_file(
-                            file_path=input_file,
-                            file_type=input_type,
-                            chunk_size=self.__chunk_size,
-                            chunk_overlap=self.__chunk_overlap
-                        )
-                        file_paths.append(input_file)
-                        print(f'【{len(file_paths)}/{file_count}】已添加文件: {input_file}')
-                    except UnLoadableError as e:
-                        print(f'文件: {input_file} 出现异常: {str(e)}')
+
+                    if input_file in file_paths:
+                        file_paths.remove(input_file)
+                        file_count -= 1
+                        print(f'*文件 【{input_file}】 重复输入, 更新文件内容...')
+
+                    file_paths.append(input_file)
+                    print(f'【{len(file_paths)}/{file_count}】已添加文件: {input_file}')
 
         s_time = time.time()
-        print(f'* 文件正在写入知识库...')
-        split_docs = list(chain.from_iterable(list(split_docs_map.values())))
-        if state.data_source.workspace in self.__vector_store.all_collections():
-            self.__vector_store.delete_collection(collection_name=state.data_source.workspace)
-        self.__vector_store.init_vector(split_docs=split_docs, index_name=state.data_source.workspace)
-        print(f'* 文件写入知识库完成, 耗时: 【{time.time() - s_time}(s)】')
+        logger.info(f'* 文件正在写入知识库...', extra={'workspace': state.data_source.workspace, 'file_count': len(file_paths)})
+        # 文件在写入时才流式加载切片, 不可上传的文件类型在写入报告中统计
+        if self.__rebuild:
+            report = self.__workspace_sync.rebuild(workspace=state.data_source.workspace, file_paths=file_paths)
+        else:
+            report = self.__workspace_sync.sync(
+                workspace=state.data_source.workspace,
+                file_paths=file_paths,
+                remove_missing=self.__remove_missing
+            )
+        file_paths = [file_path for file_path in file_paths if os.path.abspath(file_path) not in report.ingest.failed_files]
+        elapsed = round(time.time() - s_time, 3)
+        logger.info(
+            f'* 文件写入知识库完成, 耗时: 【{elapsed}(s)】',
+            extra={'workspace': state.data_source.workspace, 'elapsed': elapsed, 'failed_files': len(report.ingest.failed_files)}
+        )
 
         return {
             'data_source': {
@@ -1,14 +1,26 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from api.routers.llm_router import router as llm_router
+from api.services.code_helper_service import CodeHelperService
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 应用启动时创建共享客户端, 关闭时释放连接
+    app.state.code_helper_service = CodeHelperService()
+    yield
+    app.state.code_helper_service.close()
 
 app = FastAPI(
     title="Fast AI Agent 接口映射",
     description="快速实现AI Agent 功能",
-    version="0.0.1"
+    version="0.0.1",
+    lifespan=lifespan
 )
 
 app.include_router(llm_router)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)